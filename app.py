@@ -1,10 +1,352 @@
 import streamlit as st
-import os
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import tempfile
-from extract_images import extract_images_from_pdf
+import hashlib
+import threading
+import time
+import uuid
+from extract_images import count_images_in_pdf, iter_images_from_pdf
+from pipeline import SPLIT_WORKERS
+from prescreen import ImageScreen
+from processing import CACHE_DIR, CACHE_MAX_BYTES, EXTRACT_WORKERS
+from result_cache import ResultCache, result_key
 from split_subimages import process_image
-import zipfile
+from zipstream import iter_zip, layout_entries
+from thumbnails import ensure_thumbnail
+
+# 与Web服务共用的处理结果缓存（磁盘），按最近使用时间淘汰到配额以内
+result_cache = ResultCache(CACHE_DIR, CACHE_MAX_BYTES)
+
+# 内存中保留的已结束的提取任务（按PDF）和分割任务（按PDF和子图数量）的个数上限
+EXTRACT_MEMORY_ENTRIES = 16
+SPLIT_MEMORY_ENTRIES = 64
+
+# 后台任务运行期间结果区域的刷新间隔（秒）
+REFRESH_INTERVAL = 1.0
+
+# 画廊每页显示的提取图片数和分割结果（原图）数
+EXTRACTED_PAGE_SIZE = 12
+SPLIT_PAGE_SIZE = 5
+
+def uploaded_pdf_hash(uploaded_file):
+    """上传文件的SHA-256，同一次上传只计算一次（保存在 session_state 中，重新运行时直接使用）"""
+    hashes = st.session_state.setdefault('pdf_hashes', {})
+    if uploaded_file.file_id not in hashes:
+        hashes[uploaded_file.file_id] = hashlib.sha256(uploaded_file.getbuffer()).hexdigest()
+    return hashes[uploaded_file.file_id]
+
+def extract_key(pdf_hash):
+    """PDF提取结果的缓存键，与子图数量无关"""
+    return result_key(pdf_hash, 0, {'stage': 'extract'})
+
+def split_to_cache(pdf_hash, image_name, subimages_count, read_image):
+    """
+    分割一张提取的图片，结果按 (PDF哈希, 图片, 子图数量) 保存为磁盘缓存条目
+
+    Args:
+        read_image: 返回图片字节的函数，只在缓存未命中时调用
+
+    Returns:
+        (子图所在目录, 子图文件名列表)，不符合分割要求的图片列表为空
+    """
+    cache_key = result_key(pdf_hash, subimages_count, {'image': image_name})
+    manifest = result_cache.lookup(cache_key)
+    if manifest is None:
+        partial_dir = result_cache.partial_dir(cache_key, uuid.uuid4().hex[:12])
+        partial_dir.mkdir(parents=True, exist_ok=True)
+        result_cache.pin(partial_dir)
+        try:
+            count = 0
+            if process_image(read_image(), str(partial_dir), subimages_count, name=image_name):
+                count = len(list(partial_dir.glob('subimg_*.jpg')))
+            manifest = {'subimages': [f'subimg_{i}.jpg' for i in range(1, count + 1)]}
+            result_cache.commit(cache_key, partial_dir, manifest)
+        finally:
+            result_cache.unpin(partial_dir)
+    return str(result_cache.entry_dir(cache_key)), manifest['subimages']
+
+class ExtractionTask:
+    """
+    在后台线程中提取PDF中的图片，每张图片写入后即可被页面显示和分割任务读取
+
+    结果保存为磁盘缓存条目，与子图数量无关，每个PDF只提取一次。只跳过图标、蒙版等
+    明显不需要的图片，不能按某个子图数量分割的图片在分割时跳过。
+    """
+
+    def __init__(self, pdf_hash, pdf_name, pdf_bytes):
+        self.pdf_hash = pdf_hash
+        self.image_dir = None
+        self.images = []
+        self.total = None
+        self.done = False
+        self.error = None
+        self.last_used = time.time()
+        self._changed = threading.Condition()
+        threading.Thread(target=self._run, args=(pdf_name, pdf_bytes), daemon=True).start()
+
+    def _run(self, pdf_name, pdf_bytes):
+        cache_key = extract_key(self.pdf_hash)
+        try:
+            manifest = result_cache.lookup(cache_key)
+            if manifest is None:
+                self._extract(cache_key, pdf_name, pdf_bytes)
+            else:
+                with self._changed:
+                    self.image_dir = result_cache.entry_dir(cache_key)
+                    self.images = manifest['images']
+                    self.total = len(self.images)
+        except Exception as e:
+            self.error = str(e)
+        finally:
+            with self._changed:
+                self.done = True
+                self._changed.notify_all()
+
+    def _extract(self, cache_key, pdf_name, pdf_bytes):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            pdf_path = Path(temp_dir) / f"{pdf_name}.pdf"
+            with open(pdf_path, "wb") as f:
+                f.write(pdf_bytes)
+
+            screen = ImageScreen()
+            partial_dir = result_cache.partial_dir(cache_key, uuid.uuid4().hex[:12])
+            partial_dir.mkdir(parents=True, exist_ok=True)
+            result_cache.pin(partial_dir)
+            try:
+                total, _ = count_images_in_pdf(str(pdf_path), screen=screen)
+                with self._changed:
+                    self.image_dir = partial_dir
+                    self.total = total
+                images = []
+                for record in iter_images_from_pdf(str(pdf_path), workers=EXTRACT_WORKERS, screen=screen):
+                    if record['duplicate_of'] is not None:
+                        continue
+                    with open(partial_dir / record['name'], "wb") as f:
+                        f.write(record['image'])
+                    images.append({'name': record['name'], 'path': record['name']})
+                    with self._changed:
+                        self.images.append(images[-1])
+                        self._changed.notify_all()
+                # 提交（重命名目录）期间不能读取图片，见 read_image
+                with self._changed:
+                    self.image_dir = result_cache.commit(cache_key, partial_dir, {'images': images})
+            finally:
+                result_cache.unpin(partial_dir)
+
+    def wait_for_image(self, index):
+        """等待第 index 张图片提取完成并返回其信息，提取结束且没有更多图片时返回None"""
+        with self._changed:
+            while index >= len(self.images) and not self.done:
+                self._changed.wait()
+            return self.images[index] if index < len(self.images) else None
+
+    def read_image(self, name):
+        """读取一张已提取的图片"""
+        with self._changed:
+            with open(Path(self.image_dir) / name, 'rb') as f:
+                return f.read()
+
+    def snapshot(self):
+        """返回 (图片所在目录, 已提取的图片列表, 预计总数)"""
+        with self._changed:
+            return self.image_dir, list(self.images), self.total
+
+    def stale(self):
+        """已结束但失败或结果已被淘汰，需要重新提取"""
+        return self.done and (self.error is not None or not Path(self.image_dir).exists())
+
+class SplitTask:
+    """在后台按子图数量分割一个PDF提取的图片，每张图片提取出来后立即分割"""
+
+    def __init__(self, extraction, subimages_count):
+        self.extraction = extraction
+        self.subimages_count = subimages_count
+        # 图片名 -> (子图所在目录, 子图文件名列表)，按完成顺序加入
+        self.results = {}
+        self.done = False
+        self.error = None
+        self.last_used = time.time()
+        self._lock = threading.Lock()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def _run(self):
+        # 分割期间提取结果不能被淘汰
+        image_dir = result_cache.entry_dir(extract_key(self.extraction.pdf_hash))
+        result_cache.pin(image_dir)
+        try:
+            with ThreadPoolExecutor(SPLIT_WORKERS) as executor:
+                futures = []
+                while True:
+                    image_info = self.extraction.wait_for_image(len(futures))
+                    if image_info is None:
+                        break
+                    futures.append(executor.submit(self._split, image_info['name']))
+                for future in futures:
+                    future.result()
+            self.error = self.extraction.error
+        except Exception as e:
+            self.error = str(e)
+        finally:
+            result_cache.unpin(image_dir)
+            self.done = True
+            result_cache.evict()
+
+    def _split(self, name):
+        result = split_to_cache(self.extraction.pdf_hash, name, self.subimages_count,
+                                lambda: self.extraction.read_image(name))
+        with self._lock:
+            self.results[name] = result
+
+    def snapshot(self):
+        """返回已完成的分割结果的副本"""
+        with self._lock:
+            return dict(self.results)
+
+    def stale(self):
+        """已结束但失败或结果已被淘汰，需要重新分割"""
+        if not self.done:
+            return False
+        return self.error is not None or not all(Path(split_dir).exists() for split_dir, _ in self.snapshot().values())
+
+class TaskRegistry:
+    """
+    进程内的后台任务，同一PDF的提取任务和同一 (PDF, 子图数量) 的分割任务在各次页面运行、
+    各个会话之间复用；已结束的任务按最近使用时间保留有限个数，作为内存中的结果缓存
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._extractions = {}
+        self._splits = {}
+
+    @staticmethod
+    def _trim(tasks, limit):
+        finished = sorted((task.last_used, key) for key, task in tasks.items() if task.done)
+        for _, key in finished[:max(0, len(tasks) - limit)]:
+            del tasks[key]
+
+    def extraction(self, pdf_hash, pdf_name, read_pdf):
+        """
+        返回PDF的提取任务，没有时启动
+
+        Args:
+            read_pdf: 返回PDF字节的函数，只在需要启动任务时调用
+        """
+        with self._lock:
+            task = self._extractions.get(pdf_hash)
+            if task is None or task.stale():
+                task = self._extractions[pdf_hash] = ExtractionTask(pdf_hash, pdf_name, read_pdf())
+                self._trim(self._extractions, EXTRACT_MEMORY_ENTRIES)
+            task.last_used = time.time()
+            return task
+
+    def split(self, extraction, subimages_count):
+        """返回按子图数量分割该提取结果的任务，没有时启动"""
+        key = (extraction.pdf_hash, subimages_count)
+        with self._lock:
+            task = self._splits.get(key)
+            if task is None or task.extraction is not extraction or task.stale():
+                task = self._splits[key] = SplitTask(extraction, subimages_count)
+                self._trim(self._splits, SPLIT_MEMORY_ENTRIES)
+            task.last_used = time.time()
+            return task
+
+@st.cache_resource
+def task_registry():
+    return TaskRegistry()
+
+def paginate(items, page_size, key):
+    """显示页码选择，只返回当前页的条目"""
+    pages = max(1, -(-len(items) // page_size))
+    if pages == 1:
+        return items
+    page = st.number_input(f"页码（共 {pages} 页）", min_value=1, max_value=pages, value=1, key=key)
+    return items[(page - 1) * page_size:page * page_size]
+
+def show_image(container, root, rel_path, size, caption):
+    """显示结果图片的缩略图；提取结果正在提交（目录重命名）时跳过，下次刷新再显示"""
+    if not (Path(root) / rel_path).exists():
+        return
+    try:
+        thumb_path = ensure_thumbnail(root, rel_path, size)
+        image_path = thumb_path or Path(root) / rel_path
+        if image_path.exists():
+            container.image(str(image_path), caption=caption)
+    except OSError:
+        pass
+
+def show_results(extraction, split, refreshing):
+    """结果区域：后台任务运行期间定期刷新，只显示画廊当前页的图片"""
+    image_dir, images, total = extraction.snapshot()
+    results = split.snapshot()
+    if refreshing and split.done:
+        # 处理已结束，重新运行整个页面以停止定期刷新
+        st.rerun()
+
+    if not split.done:
+        split_count = sum(1 for img_info in images if img_info['name'] in results)
+        total = max(total or 0, len(images), 1)
+        st.progress(min(1.0, (len(images) + split_count) / (2 * total)),
+                    text=f"已提取 {len(images)}/{total} 张图片，已分割 {split_count} 张")
+    elif split.error is not None:
+        st.error(f"处理出错: {split.error}")
+    else:
+        total_split = sum(len(subimages) for _, subimages in results.values())
+        st.success(f"已提取 {len(images)} 张图片，分割得到 {total_split} 个子图")
+
+    if split.done and not images:
+        st.error("未从PDF中提取到图片")
+        return
+
+    # 显示提取的图片
+    st.subheader("提取的图片")
+    cols = st.columns(3)
+    for idx, img_info in enumerate(paginate(images, EXTRACTED_PAGE_SIZE, f"extracted_page_{extraction.pdf_hash}")):
+        # 页面只显示缩略图，原图可通过下载获取
+        show_image(cols[idx % 3], image_dir, img_info['path'], 1024, img_info['name'])
+
+    # 显示分割结果，按图片的提取顺序排列
+    st.subheader("分割结果")
+    split_names = [img_info['name'] for img_info in images if results.get(img_info['name'], (None, []))[1]]
+    page_key = f"split_page_{extraction.pdf_hash}_{split.subimages_count}"
+    for img_name in paginate(split_names, SPLIT_PAGE_SIZE, page_key):
+        split_dir, subimages = results[img_name]
+        st.write(f"原图: {img_name}")
+        subcols = st.columns(4)
+        for idx, subimg in enumerate(subimages):
+            show_image(subcols[idx % 4], split_dir, subimg, 256, f"子图_{idx+1}")
+
+    if split.done and split_names:
+        split_files = [
+            (f"split_{img_name.rsplit('.', 1)[0]}", subimg, str(Path(results[img_name][0]) / subimg))
+            for img_name in split_names
+            for subimg in results[img_name][1]
+        ]
+
+        # 创建下载按钮区域，ZIP在点击时才生成，已压缩的JPEG直接存储；点击下载不会重新运行页面
+        st.subheader("下载选项")
+        download_cols = st.columns(2)
+
+        # 按章节打包（保持目录结构）
+        download_cols[0].download_button(
+            label="按章节下载",
+            data=lambda: b''.join(iter_zip(layout_entries(split_files, 'chapter'))),
+            file_name="split_results_by_chapter.zip",
+            mime="application/zip",
+            help="保持目录结构打包下载",
+            on_click="ignore",
+        )
+
+        # 所有图片打包在同一目录
+        download_cols[1].download_button(
+            label="打包所有图片",
+            data=lambda: b''.join(iter_zip(layout_entries(split_files, 'flat'))),
+            file_name="split_results_flat.zip",
+            mime="application/zip",
+            help="所有图片在同一目录下",
+            on_click="ignore",
+        )
 
 def main():
     st.set_page_config(page_title="PDF图片提取工具", layout="wide")
@@ -25,121 +367,16 @@ def main():
     uploaded_file = st.file_uploader("选择PDF文件", type=['pdf'])
     
     if uploaded_file:
-        # 创建临时目录
-        with tempfile.TemporaryDirectory() as temp_dir:
-            # 保存上传的PDF
-            pdf_path = Path(temp_dir) / "input.pdf"
-            with open(pdf_path, "wb") as f:
-                f.write(uploaded_file.getvalue())
-            
-            # 创建输出目录
-            output_dir = Path(temp_dir) / "output"
-            output_dir.mkdir(exist_ok=True)
-            
-            # 处理进度条
-            progress_bar = st.progress(0)
-            status_text = st.empty()
-            
-            # 第一步：提取图片
-            status_text.text("正在从PDF提取图片...")
-            progress_bar.progress(20)
-            
-            num_images, image_files = extract_images_from_pdf(str(pdf_path), str(output_dir))
-            
-            if num_images > 0:
-                status_text.text(f"已提取 {num_images} 张图片")
-                progress_bar.progress(50)
-                
-                # 显示提取的图片
-                st.subheader("提取的图片")
-                cols = st.columns(3)
-                for idx, img_name in enumerate(image_files):
-                    img_path = output_dir / img_name
-                    if img_path.exists():
-                        cols[idx % 3].image(str(img_path), caption=img_name)
-                
-                # 第二步：分割子图
-                status_text.text("正在处理提取出的图片...")
-                progress_bar.progress(75)
-                
-                # 创建分割结果目录
-                split_dir = Path(temp_dir) / "split"
-                split_dir.mkdir(exist_ok=True)
-                
-                # 处理每个提取的图片
-                st.subheader("分割结果")
-                for img_name in image_files:
-                    img_path = output_dir / img_name
-                    if img_path.exists():
-                        output_subdir = split_dir / f"split_{img_name.rsplit('.', 1)[0]}"
-                        output_subdir.mkdir(exist_ok=True)
-                        
-                        success = process_image(str(img_path), str(output_subdir), subimages_count)
-                        
-                        if success:
-                            # 显示分割结果
-                            st.write(f"原图: {img_name}")
-                            subcols = st.columns(4)
-                            for idx, subimg in enumerate(sorted(output_subdir.glob('*.jpg'))):
-                                subcols[idx % 4].image(str(subimg), caption=f"子图_{idx+1}")
-                
-                # 完成
-                progress_bar.progress(100)
-                status_text.text("处理完成！")
-                
-                # 创建下载按钮区域
-                st.subheader("下载选项")
-                download_cols = st.columns(2)
-                
-                # 按章节打包（保持目录结构）
-                with tempfile.NamedTemporaryFile(delete=False, suffix='.zip') as chapter_zip:
-                    with zipfile.ZipFile(chapter_zip.name, 'w') as zipf:
-                        for root, _, files in os.walk(split_dir):
-                            for file in files:
-                                file_path = Path(root) / file
-                                # 保持目录结构
-                                arcname = file_path.relative_to(split_dir)
-                                zipf.write(file_path, arcname)
-                    
-                    with open(chapter_zip.name, 'rb') as f:
-                        download_cols[0].download_button(
-                            label="按章节下载",
-                            data=f.read(),
-                            file_name="split_results_by_chapter.zip",
-                            mime="application/zip",
-                            help="保持目录结构打包下载"
-                        )
-                
-                # 所有图片打包在同一目录
-                with tempfile.NamedTemporaryFile(delete=False, suffix='.zip') as flat_zip:
-                    with zipfile.ZipFile(flat_zip.name, 'w') as zipf:
-                        for root, _, files in os.walk(split_dir):
-                            for file in files:
-                                file_path = Path(root) / file
-                                # 使用目录名和文件名组合作为新文件名
-                                dir_name = Path(root).name
-                                arcname = f"{dir_name}_{file}"
-                                zipf.write(file_path, arcname)
-                    
-                    with open(flat_zip.name, 'rb') as f:
-                        download_cols[1].download_button(
-                            label="打包所有图片",
-                            data=f.read(),
-                            file_name="split_results_flat.zip",
-                            mime="application/zip",
-                            help="所有图片在同一目录下"
-                        )
-                
-                # 清理临时zip文件
-                try:
-                    if os.path.exists(chapter_zip.name):
-                        os.unlink(chapter_zip.name)
-                    if os.path.exists(flat_zip.name):
-                        os.unlink(flat_zip.name)
-                except Exception as e:
-                    st.warning(f"清理临时文件时出错: {e}")
-            else:
-                st.error("未从PDF中提取到图片")
+        # 提取和分割在后台线程中进行，提取结果按PDF缓存，分割结果按 (PDF, 图片, 子图数量) 缓存：
+        # 修改子图数量只重新分割，点击下载等其他操作不会重新处理
+        pdf_hash = uploaded_pdf_hash(uploaded_file)
+        registry = task_registry()
+        extraction = registry.extraction(pdf_hash, Path(uploaded_file.name).stem, uploaded_file.getvalue)
+        split = registry.split(extraction, subimages_count)
+        
+        # 处理期间只定期刷新结果区域，不重新运行整个页面
+        refreshing = not split.done
+        st.fragment(run_every=REFRESH_INTERVAL if refreshing else None)(show_results)(extraction, split, refreshing)
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
@@ -0,0 +1,158 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+from pathlib import Path
+
+# 批处理清单的文件名，保存在批处理的输出目录中
+BATCH_MANIFEST_NAME = '.manifest.jsonl'
+
+# 读取文件计算哈希时的块大小
+HASH_CHUNK_SIZE = 1024 * 1024
+
+def file_sha256(path):
+    """流式计算文件的SHA-256"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(HASH_CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _normalize(params):
+    """转换为JSON往返后的形式（元组变为列表等），便于与读取的记录比较"""
+    return json.loads(json.dumps(params, sort_keys=True))
+
+class BatchManifest:
+    """
+    批处理的处理清单（JSONL格式）
+
+    每处理完一个输入文件追加一行，记录输入的路径、大小、修改时间、内容哈希、
+    处理参数和生成的输出文件（相对于清单所在目录的路径和大小）。同一输入以最后一行为准。
+    进程中途退出时最多丢失正在处理的输入，不完整的最后一行在读取时忽略。
+
+    重新运行时，路径、参数相同且大小和修改时间未变（或内容哈希相同）、
+    输出文件都在且大小一致的输入视为已完成，可以跳过。
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.root = self.path.parent
+        # 输入的绝对路径 -> 最后一条记录
+        self._entries = {}
+        self._lines = 0
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # 写到一半的行
+                        continue
+                    self._entries[entry['input']] = entry
+                    self._lines += 1
+        except FileNotFoundError:
+            pass
+
+    @staticmethod
+    def _key(input_path):
+        return str(Path(input_path).resolve())
+
+    def _append(self, entry):
+        self.root.mkdir(parents=True, exist_ok=True)
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        self._entries[entry['input']] = entry
+        self._lines += 1
+
+    def _outputs_intact(self, entry):
+        for output in entry['outputs']:
+            try:
+                if os.stat(self.root / output['path']).st_size != output['size']:
+                    return False
+            except OSError:
+                return False
+        return True
+
+    def get(self, input_path):
+        """返回输入的最后一条记录，没有时返回None"""
+        return self._entries.get(self._key(input_path))
+
+    def is_current(self, input_path, params):
+        """
+        判断输入是否已经用相同的参数处理完成，且输出文件完整
+
+        大小和修改时间都未变时不读取文件内容；只有修改时间变化时比较内容哈希，
+        内容相同（如重新复制的文件）则更新记录中的修改时间。
+        """
+        entry = self.get(input_path)
+        if entry is None or entry['params'] != _normalize(params):
+            return False
+        stat = os.stat(input_path)
+        if stat.st_size != entry['size']:
+            return False
+        if stat.st_mtime_ns != entry['mtime_ns']:
+            if file_sha256(input_path) != entry['sha256']:
+                return False
+            self._append(dict(entry, mtime_ns=stat.st_mtime_ns))
+        return self._outputs_intact(entry)
+
+    def record(self, input_path, params, outputs, result=None):
+        """
+        记录一个处理完成的输入，应在所有输出文件写完之后调用
+
+        Args:
+            input_path: 输入文件路径
+            params: 影响输出的处理参数（可JSON序列化的字典）
+            outputs: 生成的输出文件路径列表（应位于清单所在目录中）
+            result: 可选的处理结果摘要，如提取的图片数，跳过时可以直接使用
+        """
+        stat = os.stat(input_path)
+        root = self.root.resolve()
+        self._append({
+            'input': self._key(input_path),
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'sha256': file_sha256(input_path),
+            'params': _normalize(params),
+            'outputs': [
+                {
+                    'path': Path(output).resolve().relative_to(root).as_posix(),
+                    'size': os.stat(output).st_size,
+                }
+                for output in outputs
+            ],
+            'result': result,
+            'finished_at': time.time(),
+        })
+
+    def compact(self):
+        """每个输入只保留最后一条记录，重写清单文件"""
+        if self._lines <= len(self._entries):
+            return
+        temp_path = self.path.with_name(self.path.name + '.tmp')
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            for entry in self._entries.values():
+                f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        os.replace(temp_path, self.path)
+        self._lines = len(self._entries)
+
+def list_outputs(directory):
+    """列出目录中的所有文件，目录不存在时返回空列表"""
+    directory = Path(directory)
+    if not directory.exists():
+        return []
+    return sorted(path for path in directory.rglob('*') if path.is_file())
+
+def reset_output_dir(directory):
+    """删除输入对应的输出目录，重新处理前清除上次中断时留下的不完整输出"""
+    if Path(directory).exists():
+        shutil.rmtree(str(directory))
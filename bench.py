@@ -0,0 +1,360 @@
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import cv2
+import fitz
+import numpy as np
+
+try:
+    import resource
+except ImportError:
+    # Windows 上没有 resource 模块，不统计峰值内存
+    resource = None
+
+from bench_split import make_figure
+from extract_images import extract_images_from_pdf
+from split_subimages import extract_subimages, grid_shape, process_directory, process_image
+from batch_manifest import BATCH_MANIFEST_NAME
+from zipstream import directory_entries, iter_zip
+
+# 合成图片的格式 -> cv2.imencode 使用的扩展名
+IMAGE_FORMATS = {'jpeg': '.jpg', 'png': '.png', 'jpx': '.jp2'}
+
+# 按执行顺序排列的基准测试阶段，后面的阶段使用 extract 阶段提取的图片
+STAGES = ('extract', 'process_image', 'extract_subimages', 'process_directory', 'zip')
+
+# 吞吐量下降或峰值内存增加超过该比例时视为性能回退
+REGRESSION_THRESHOLD = 0.10
+
+# 结果JSON的格式版本
+RESULT_VERSION = 1
+
+def make_corpus(pdf_path, pages=20, images_per_page=1, sub_size=150, image_format='jpeg',
+                duplicate_ratio=0.0, subimages_count=8, seed=0):
+    """
+    用PyMuPDF生成合成PDF，每张图片由 subimages_count 个带白边的子图按网格组成
+
+    Args:
+        pdf_path: 输出的PDF路径
+        pages: 页数
+        images_per_page: 每页的图片数
+        sub_size: 每个子图的边长像素
+        image_format: 图片格式 jpeg、png 或 jpx
+        duplicate_ratio: 重复引用已有图片（同一xref）的比例，0 到 1
+        subimages_count: 每张图片的子图数量
+        seed: 随机种子，相同参数和种子生成相同的PDF
+
+    Returns:
+        dict: 语料的参数和统计信息，会写入结果JSON
+    """
+    rng = np.random.default_rng(seed)
+    ext = IMAGE_FORMATS[image_format]
+    num_rows, num_cols = grid_shape(subimages_count)
+    margin = max(1, sub_size // 12)
+
+    doc = fitz.open()
+    xrefs = []
+    for _ in range(pages):
+        page = doc.new_page()
+        slot_height = page.rect.height / images_per_page
+        for i in range(images_per_page):
+            rect = fitz.Rect(0, i * slot_height, page.rect.width, (i + 1) * slot_height)
+            if xrefs and rng.random() < duplicate_ratio:
+                page.insert_image(rect, xref=int(rng.choice(xrefs)))
+                continue
+            img = make_figure(subimages_count, sub_size, margin, seed=int(rng.integers(2 ** 31)))
+            ok, buffer = cv2.imencode(ext, img)
+            if not ok:
+                raise ValueError(f"无法编码 {image_format} 格式的图片")
+            xrefs.append(page.insert_image(rect, stream=buffer.tobytes()))
+    doc.save(str(pdf_path))
+    doc.close()
+
+    return {
+        'pages': pages,
+        'images_per_page': images_per_page,
+        'images': pages * images_per_page,
+        'unique_images': len(xrefs),
+        'image_width': num_cols * sub_size,
+        'image_height': num_rows * sub_size,
+        'format': image_format,
+        'duplicate_ratio': duplicate_ratio,
+        'subimages_count': subimages_count,
+        'sub_size': sub_size,
+        'seed': seed,
+        'pdf_bytes': os.path.getsize(pdf_path),
+    }
+
+def _unique_files(directory):
+    """按文件名顺序列出目录中的图片，硬链接的重复图片只保留一个"""
+    seen = set()
+    files = []
+    for path in sorted(Path(directory).iterdir()):
+        stat = path.stat()
+        if (stat.st_dev, stat.st_ino) in seen:
+            continue
+        seen.add((stat.st_dev, stat.st_ino))
+        files.append(path)
+    return files
+
+def _count_files(directory):
+    """统计输出文件数，不计批处理清单"""
+    return sum(1 for path in Path(directory).rglob('*') if path.is_file() and path.name != BATCH_MANIFEST_NAME)
+
+def _stage_extract(work_dir, subimages_count, workers):
+    images, _ = extract_images_from_pdf(str(work_dir / 'corpus.pdf'), str(work_dir / 'extract'), workers=workers)
+    return {'images': images}
+
+def _stage_process_image(work_dir, subimages_count, workers):
+    files = _unique_files(work_dir / 'extract')
+    tiles = 0
+    for path in files:
+        output_dir = work_dir / 'process_image' / path.stem
+        output_dir.mkdir(parents=True)
+        if process_image(str(path), str(output_dir), subimages_count):
+            tiles += subimages_count
+    return {'images': len(files), 'tiles': tiles}
+
+def _stage_extract_subimages(work_dir, subimages_count, workers):
+    files = _unique_files(work_dir / 'extract')
+    tiles = sum(subimages_count for path in files
+                if extract_subimages(path, work_dir / 'extract_subimages', subimages_count))
+    return {'images': len(files), 'tiles': tiles}
+
+def _stage_process_directory(work_dir, subimages_count, workers):
+    process_directory(work_dir / 'extract', work_dir / 'process_directory', subimages_count)
+    images = sum(1 for path in _unique_files(work_dir / 'extract')
+                 if path.suffix.lower() in ('.jpg', '.jpeg', '.png'))
+    return {'images': images, 'tiles': _count_files(work_dir / 'process_directory')}
+
+def _stage_zip(work_dir, subimages_count, workers):
+    total_bytes = 0
+    for chunk in iter_zip(directory_entries(work_dir / 'process_image', 'chapter')):
+        total_bytes += len(chunk)
+    return {'files': _count_files(work_dir / 'process_image'), 'megabytes': total_bytes / 1e6}
+
+_STAGE_FUNCTIONS = {
+    'extract': _stage_extract,
+    'process_image': _stage_process_image,
+    'extract_subimages': _stage_extract_subimages,
+    'process_directory': _stage_process_directory,
+    'zip': _stage_zip,
+}
+
+def _rss_mb():
+    """当前进程的峰值常驻内存（MB），不支持时返回None"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 上单位为KB，macOS 上为字节
+    return peak / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+def _run_stage(stage, work_dir, subimages_count, workers):
+    """
+    在独立的进程中运行一个阶段，使峰值内存只反映该阶段
+
+    Returns:
+        (耗时秒数, 处理量, 阶段开始前的峰值内存MB, 阶段结束后的峰值内存MB)
+    """
+    work_dir = Path(work_dir)
+    output_dir = work_dir / stage
+    if output_dir.exists():
+        shutil.rmtree(str(output_dir))
+    output_dir.mkdir()
+
+    baseline_rss = _rss_mb()
+    # 被测函数逐张打印日志，基准测试时不输出
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        units = _STAGE_FUNCTIONS[stage](work_dir, subimages_count, workers)
+        elapsed = time.perf_counter() - start
+    return elapsed, units, baseline_rss, _rss_mb()
+
+def _throughput(stage, units, corpus, seconds):
+    """根据处理量计算吞吐量：pages/s、images/s、MP/s、tiles/s、files/s、MB/s"""
+    if seconds <= 0:
+        return {}
+    megapixels_per_image = corpus['image_width'] * corpus['image_height'] / 1e6
+    result = {}
+    if stage == 'extract':
+        result['pages/s'] = corpus['pages'] / seconds
+    if 'images' in units:
+        result['images/s'] = units['images'] / seconds
+        # 重复图片只解码一次，按去重后的图片计算像素吞吐量
+        images = corpus['unique_images'] if stage == 'extract' else units['images']
+        result['MP/s'] = images * megapixels_per_image / seconds
+    if 'tiles' in units:
+        result['tiles/s'] = units['tiles'] / seconds
+    if 'files' in units:
+        result['files/s'] = units['files'] / seconds
+    if 'megabytes' in units:
+        result['MB/s'] = units['megabytes'] / seconds
+    return result
+
+def run_benchmark(corpus_options, stages=STAGES, repeat=3, workers=1, work_dir=None):
+    """
+    生成语料并依次运行各阶段，每个阶段重复 repeat 次取最快的一次
+
+    Args:
+        corpus_options: 传给 make_corpus 的参数字典
+        stages: 要计时的阶段，提供输入的阶段（extract，zip 依赖的 process_image）即使未选中也会运行一次
+        repeat: 每个阶段的重复次数
+        workers: extract 阶段按页分片的进程数
+        work_dir: 工作目录，None 时使用临时目录并在结束后删除
+
+    Returns:
+        dict: 可写入JSON的结果
+    """
+    temp_dir = None
+    if work_dir is None:
+        temp_dir = tempfile.mkdtemp(prefix='pdf_bench_')
+        work_dir = temp_dir
+    work_dir = Path(work_dir)
+    work_dir.mkdir(parents=True, exist_ok=True)
+
+    try:
+        corpus = make_corpus(work_dir / 'corpus.pdf', **corpus_options)
+        subimages_count = corpus['subimages_count']
+        results = {}
+        # 每次运行使用新启动的进程，峰值内存不受之前阶段的影响
+        context = multiprocessing.get_context('spawn')
+        required = set(stages) | {'extract'}
+        if 'zip' in stages:
+            required.add('process_image')
+        for stage in STAGES:
+            if stage not in required:
+                continue
+            runs = []
+            for _ in range(repeat if stage in stages else 1):
+                with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                    runs.append(executor.submit(_run_stage, stage, str(work_dir), subimages_count, workers).result())
+            if stage not in stages:
+                continue
+            seconds, units, baseline_rss, peak_rss = min(runs, key=lambda run: run[0])
+            results[stage] = {
+                'seconds': seconds,
+                'units': units,
+                'throughput': _throughput(stage, units, corpus, seconds),
+                'baseline_rss_mb': baseline_rss,
+                'peak_rss_mb': max((run[3] for run in runs if run[3] is not None), default=None),
+            }
+    finally:
+        if temp_dir is not None:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    return {
+        'version': RESULT_VERSION,
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'corpus': corpus,
+        'repeat': repeat,
+        'workers': workers,
+        'stages': results,
+    }
+
+def compare_results(current, baseline, threshold=REGRESSION_THRESHOLD):
+    """
+    与基准结果对比，吞吐量下降或峰值内存增加超过 threshold 视为回退
+
+    Returns:
+        list: 每项为 (阶段, 指标, 基准值, 当前值, 变化比例, 是否回退)
+    """
+    rows = []
+    for stage, result in current['stages'].items():
+        base = baseline.get('stages', {}).get(stage)
+        if base is None:
+            continue
+        for metric, value in result['throughput'].items():
+            base_value = base['throughput'].get(metric)
+            if not base_value:
+                continue
+            change = value / base_value - 1
+            rows.append((stage, metric, base_value, value, change, change < -threshold))
+        if result['peak_rss_mb'] and base.get('peak_rss_mb'):
+            change = result['peak_rss_mb'] / base['peak_rss_mb'] - 1
+            rows.append((stage, 'peak_rss_mb', base['peak_rss_mb'], result['peak_rss_mb'], change, change > threshold))
+    return rows
+
+def print_results(result):
+    corpus = result['corpus']
+    print(f"语料: {corpus['pages']} 页, {corpus['images']} 张图片 (去重后 {corpus['unique_images']} 张), "
+          f"{corpus['format']} {corpus['image_width']}x{corpus['image_height']}, "
+          f"{corpus['subimages_count']} 子图, PDF {corpus['pdf_bytes'] / 1e6:.1f} MB")
+    print(f"{'阶段':<18} {'耗时(s)':>9} {'峰值内存(MB)':>13}  吞吐量")
+    for stage, stage_result in result['stages'].items():
+        throughput = ', '.join(f"{value:.1f} {metric}" for metric, value in stage_result['throughput'].items())
+        peak = stage_result['peak_rss_mb']
+        peak_text = f"{peak:.0f}" if peak is not None else '-'
+        print(f"{stage:<18} {stage_result['seconds']:>9.3f} {peak_text:>13}  {throughput}")
+
+def main():
+    parser = argparse.ArgumentParser(description='PDF图片提取与分割的基准测试')
+    parser.add_argument('--pages', type=int, default=20, help='合成PDF的页数 (默认: 20)')
+    parser.add_argument('--images-per-page', type=int, default=1, help='每页的图片数 (默认: 1)')
+    parser.add_argument('--sub-size', type=int, default=150, help='每个子图的边长像素 (默认: 150)')
+    parser.add_argument('--format', choices=sorted(IMAGE_FORMATS), default='jpeg', help='图片格式 (默认: jpeg)')
+    parser.add_argument('--dup-ratio', type=float, default=0.0, help='重复引用已有图片的比例 (默认: 0)')
+    parser.add_argument('--grid', type=int, default=8, help='每张图片的子图数量 (默认: 8)')
+    parser.add_argument('--seed', type=int, default=0, help='随机种子 (默认: 0)')
+    parser.add_argument('--stages', default=','.join(STAGES), help='要计时的阶段，逗号分隔 (默认: 全部)')
+    parser.add_argument('--repeat', type=int, default=3, help='每个阶段的重复次数，取最快的一次 (默认: 3)')
+    parser.add_argument('--workers', type=int, default=1, help='extract 阶段按页分片的进程数 (默认: 1)')
+    parser.add_argument('--work-dir', default=None, help='保留中间文件的工作目录 (默认: 临时目录)')
+    parser.add_argument('--output', '-o', default=None, help='将结果写入JSON文件')
+    parser.add_argument('--compare', default=None, help='与之前保存的JSON结果对比，有回退时返回非零退出码')
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD,
+                        help='判定回退的变化比例 (默认: 0.10)')
+    args = parser.parse_args()
+
+    stages = [stage.strip() for stage in args.stages.split(',') if stage.strip()]
+    unknown = [stage for stage in stages if stage not in STAGES]
+    if unknown:
+        parser.error(f"未知的阶段: {', '.join(unknown)}")
+
+    corpus_options = {
+        'pages': args.pages,
+        'images_per_page': args.images_per_page,
+        'sub_size': args.sub_size,
+        'image_format': args.format,
+        'duplicate_ratio': args.dup_ratio,
+        'subimages_count': args.grid,
+        'seed': args.seed,
+    }
+    result = run_benchmark(corpus_options, stages, args.repeat, args.workers, args.work_dir)
+    print_results(result)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"结果已保存到: {args.output}")
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline.get('corpus') != result['corpus']:
+            print("警告: 基准结果使用的语料参数不同，对比结果仅供参考")
+        rows = compare_results(result, baseline, args.threshold)
+        print(f"\n{'阶段':<18} {'指标':<12} {'基准':>10} {'当前':>10} {'变化':>8}")
+        for stage, metric, base_value, value, change, regressed in rows:
+            flag = '  回退' if regressed else ''
+            print(f"{stage:<18} {metric:<12} {base_value:>10.1f} {value:>10.1f} {change:>+7.1%}{flag}")
+        regressions = [row for row in rows if row[5]]
+        if regressions:
+            print(f"\n发现 {len(regressions)} 项性能回退（阈值 {args.threshold:.0%}）")
+            sys.exit(1)
+        print("\n没有发现性能回退")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+import argparse
+import time
+
+import cv2
+import numpy as np
+
+from extract_images import iter_images_from_pdf
+from split_subimages import encode_subimage, find_regions, grid_shape, load_image, split_image, split_jpeg
+
+def make_figure(subimages_count, sub_size=750, margin=60, seed=0):
+    """生成一张由 subimages_count 个带白边子图组成的合成图片"""
+    rng = np.random.default_rng(seed)
+    num_rows, num_cols = grid_shape(subimages_count)
+    img = np.full((num_rows * sub_size, num_cols * sub_size, 3), 255, dtype=np.uint8)
+    for i in range(subimages_count):
+        row, col = divmod(i, num_cols)
+        top = row * sub_size + margin + int(rng.integers(0, margin))
+        left = col * sub_size + margin + int(rng.integers(0, margin))
+        bottom = (row + 1) * sub_size - margin - int(rng.integers(0, margin))
+        right = (col + 1) * sub_size - margin - int(rng.integers(0, margin))
+        img[top:bottom, left:right] = rng.integers(0, 200, (bottom - top, right - left, 3), dtype=np.uint8)
+    return img
+
+def time_call(func, repeat):
+    """返回多次调用中最快一次的耗时（秒）"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def bench_jpeg(img, subimages_count, quality, repeat):
+    """
+    对比JPEG来源的两种子图输出方式：解码后分割并重新编码（默认），与DCT域无损裁剪（画质选项）
+    
+    Returns:
+        (重新编码耗时, 无损裁剪耗时, 重新编码总字节数, 无损裁剪总字节数)，无法无损裁剪时后两项为None
+    """
+    data = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, quality])[1].tobytes()
+    decoded = load_image(data)
+    
+    def reencode():
+        return [encode_subimage(sub_img) for sub_img in split_image(decoded, subimages_count)]
+    
+    reencode_time = time_call(reencode, repeat)
+    reencode_bytes = sum(len(tile) for tile in reencode())
+    lossless = split_jpeg(data, decoded, subimages_count)
+    if lossless is None:
+        return reencode_time, None, reencode_bytes, None
+    lossless_time = time_call(lambda: split_jpeg(data, decoded, subimages_count), repeat)
+    return reencode_time, lossless_time, reencode_bytes, sum(len(tile) for tile in lossless[0])
+
+def bench_contours(img, repeat):
+    """
+    对比轮廓检测在原尺寸上检测与由粗到细检测的速度和结果
+    
+    Returns:
+        (原尺寸耗时, 由粗到细耗时, 区域完全一致, 区域数是否相同, 对应区域边界的最大偏差像素)
+    """
+    exact = find_regions(img, coarse=False)
+    coarse = find_regions(img, coarse=True)
+    exact_time = time_call(lambda: find_regions(img, coarse=False), repeat)
+    coarse_time = time_call(lambda: find_regions(img, coarse=True), repeat)
+    # 区域已按位置排序，数量相同时逐个比较边界
+    max_error = None
+    if len(exact) == len(coarse):
+        max_error = max((abs(a - b) for r1, r2 in zip(exact, coarse) for a, b in zip(r1, r2)), default=0)
+    return exact_time, coarse_time, exact == coarse, len(exact) == len(coarse), max_error
+
+def print_contour_report(images, repeat):
+    """逐张打印轮廓检测的对比结果，最后打印汇总"""
+    print(f"\n{'图片':<24} {'尺寸':>12} {'原尺寸(ms)':>12} {'由粗到细(ms)':>14} {'一致':>6} {'最大偏差(px)':>14}")
+    total_exact = total_coarse = identical = same_count = count = 0
+    for name, img in images:
+        exact_time, coarse_time, same, same_len, max_error = bench_contours(img, repeat)
+        total_exact += exact_time
+        total_coarse += coarse_time
+        identical += same
+        same_count += same_len
+        count += 1
+        shape = f"{img.shape[1]}x{img.shape[0]}"
+        error = '区域数不同' if max_error is None else str(max_error)
+        print(f"{name:<24} {shape:>12} {exact_time * 1000:>12.1f} {coarse_time * 1000:>14.1f} "
+              f"{str(same):>6} {error:>14}")
+    if count:
+        print(f"共 {count} 张：总耗时 {total_exact * 1000:.0f}ms -> {total_coarse * 1000:.0f}ms "
+              f"（{total_exact / total_coarse:.2f}x），区域完全一致 {identical} 张，区域数相同 {same_count} 张")
+
+def main():
+    parser = argparse.ArgumentParser(description='对比JPEG子图的输出方式和轮廓检测方式')
+    parser.add_argument('--counts', default='8,12,16', help='子图数量列表 (默认: 8,12,16)')
+    parser.add_argument('--size', type=int, default=750, help='每个子图的边长像素 (默认: 750)')
+    parser.add_argument('--repeat', type=int, default=5, help='每种实现的重复次数 (默认: 5)')
+    parser.add_argument('--jpeg-quality', type=int, default=90, help='JPEG来源对比使用的压缩质量 (默认: 90)')
+    parser.add_argument('--contour-sizes', default='500,1000,1500',
+                        help='轮廓检测对比使用的子图边长列表，对应约150~600 DPI的插图 (默认: 500,1000,1500)')
+    parser.add_argument('--corpus', help='可选的PDF（如 bench.py 生成的语料），对其中的图片做轮廓检测对比')
+    args = parser.parse_args()
+
+    print(f"{'子图数':>6} {'重新编码(ms)':>14} {'无损裁剪(ms)':>14} {'重新编码(KB)':>14} {'无损裁剪(KB)':>14}")
+    for subimages_count in (int(c) for c in args.counts.split(',')):
+        img = make_figure(subimages_count, args.size)
+        reencode_time, lossless_time, reencode_bytes, lossless_bytes = bench_jpeg(
+            img, subimages_count, args.jpeg_quality, args.repeat)
+        if lossless_time is None:
+            print(f"{subimages_count:>6} {reencode_time * 1000:>14.1f} {'不可用':>14} {reencode_bytes / 1024:>14.0f} {'-':>14}")
+        else:
+            print(f"{subimages_count:>6} {reencode_time * 1000:>14.1f} {lossless_time * 1000:>14.1f} "
+                  f"{reencode_bytes / 1024:>14.0f} {lossless_bytes / 1024:>14.0f}")
+    
+    if args.corpus:
+        images = ((record['name'], record['array'])
+                  for record in iter_images_from_pdf(args.corpus, decode=True)
+                  if record['array'] is not None)
+    else:
+        images = ((f"合成 {size}px", make_figure(8, size, size // 12, seed=size))
+                  for size in (int(s) for s in args.contour_sizes.split(',')))
+    print_contour_report(images, args.repeat)
+
+if __name__ == "__main__":
+    main()
@@ -1,113 +1,564 @@
 import fitz
+import multiprocessing
 import os
 from pathlib import Path
 import argparse
 import glob
+import shutil
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 
-def extract_images_from_pdf(pdf_path, output_dir):
+from split_subimages import load_image
+from prescreen import ImageScreen
+from metrics import StageTimings, timed
+from batch_manifest import BATCH_MANIFEST_NAME, BatchManifest, list_outputs, reset_output_dir
+
+# 每个分片进程至少处理的页数，页数太少时进程启动开销大于收益
+MIN_PAGES_PER_WORKER = 20
+
+# 分片进程池不使用 fork：调用方常在线程中运行（流水线的提取线程、Streamlit 的后台任务），
+# 从多线程进程 fork 可能在子进程中死锁
+_MP_CONTEXT = multiprocessing.get_context(
+    'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn')
+
+def _release_page_cache(pages_done, page_window):
+    """每处理完 page_window 页清空一次 MuPDF 的对象缓存（已解析的页面、字体和图片等）"""
+    if page_window and pages_done % page_window == 0:
+        fitz.TOOLS.store_shrink(100)
+
+def _link_duplicate(source_path, target_path):
+    """为重复图片创建指向首次出现文件的硬链接，文件系统不支持时退回复制"""
+    if target_path.exists():
+        target_path.unlink()
+    try:
+        os.link(source_path, target_path)
+    except OSError:
+        shutil.copyfile(source_path, target_path)
+
+def _iter_page_images(pdf_document, page_numbers, dedupe=True, screen=None, timings=None, page_window=None):
     """
-    从PDF文件中提取所有图片并保存到指定目录
+    逐张读取指定页面中的图片，按页码顺序生成图片记录
     
     Args:
-        pdf_path: PDF文件路径
-        output_dir: 输出目录路径
+        pdf_document: 已打开的fitz文档
+        page_numbers: 要处理的页码列表（从0开始）
+        dedupe: 是否按xref去重。开启时同一xref只解码一次，
+                之后的出现只生成引用记录（image 为 None，duplicate_of 为首次出现的文件名）
+        screen: 可选的 ImageScreen，按 get_images() 中的尺寸等元数据预筛选，
+                被拒绝的图片不提取也不生成记录
+        timings: 可选的 StageTimings，记录页面解析（parse）和图片提取（extract_image）的耗时
+        page_window: 每处理这么多页释放一次 MuPDF 的对象缓存，None 表示不主动释放
         
-    Returns:
-        tuple: (图片数量, 提取的图片路径列表)
+    Yields:
+        dict: 包含 name、page、index、xref、ext、width、height、image(原始字节)、duplicate_of 的记录
     """
-    # 获取PDF文件名（不含扩展名）作为子目录名
-    pdf_name = Path(pdf_path).stem
-    
-    # 打开PDF文件
-    pdf_document = fitz.open(pdf_path)
-    
-    # 用于记录提取的图片数量和路径
-    image_count = 0
-    extracted_images = []
+    # xref -> 首次出现的文件名（提取失败时为None）
+    xref_cache = {}
     
     # 遍历每一页
-    for page_num in range(len(pdf_document)):
-        page = pdf_document[page_num]
-        
-        # 获取页面上的图片
-        images = page.get_images()
+    for pages_done, page_num in enumerate(page_numbers, 1):
+        with timed('parse', timings):
+            page = pdf_document[page_num]
+            
+            # 获取页面上的图片
+            images = page.get_images()
         
         # 遍历该页的所有图片
         for img_index, img in enumerate(images):
             # 获取图片信息
             xref = img[0]
-            base_image = pdf_document.extract_image(xref)
+            
+            if dedupe and xref in xref_cache:
+                original = xref_cache[xref]
+                if original is None:
+                    continue
+                # 重复出现的图片只记录引用，不再解码
+                image_ext = original.rsplit('.', 1)[1]
+                yield {
+                    'name': f"page{page_num + 1}_img{img_index + 1}.{image_ext}",
+                    'page': page_num + 1,
+                    'index': img_index + 1,
+                    'xref': xref,
+                    'ext': image_ext,
+                    'width': img[2],
+                    'height': img[3],
+                    'image': None,
+                    'duplicate_of': original,
+                }
+                continue
+            
+            xref_cache[xref] = None
+            if screen is not None and screen.check_pdf_image(img) is not None:
+                continue
+            
+            with timed('extract_image', timings):
+                base_image = pdf_document.extract_image(xref)
             
             if base_image:
-                image_bytes = base_image["image"]
                 image_ext = base_image["ext"]
-                
                 # 构建输出文件名
                 image_filename = f"page{page_num + 1}_img{img_index + 1}.{image_ext}"
-                image_path = Path(output_dir) / image_filename
-                
+                xref_cache[xref] = image_filename
+                yield {
+                    'name': image_filename,
+                    'page': page_num + 1,
+                    'index': img_index + 1,
+                    'xref': xref,
+                    'ext': image_ext,
+                    'width': base_image["width"],
+                    'height': base_image["height"],
+                    'image': base_image["image"],
+                    'duplicate_of': None,
+                }
+        
+        # 页面对象在下一页开始前即可释放
+        del page
+        _release_page_cache(pages_done, page_window)
+
+def _extract_pages(pdf_document, page_numbers, output_dir, dedupe=True, screen=None, timings=None):
+    """
+    提取指定页面中的图片并保存到输出目录
+    
+    Args:
+        pdf_document: 已打开的fitz文档
+        page_numbers: 要处理的页码列表（从0开始）
+        output_dir: 输出目录路径
+        dedupe: 是否按xref去重。开启时同一xref只解码和写入一次，
+                之后的出现以硬链接记录，并在记录中标明 duplicate_of
+        screen: 可选的 ImageScreen，见 _iter_page_images
+        timings: 可选的 StageTimings，另外记录写入文件（save_extracted）的耗时
+        
+    Returns:
+        list: 图片记录列表（不含图片字节），按页码顺序排列
+    """
+    extracted_images = []
+    
+    for record in _iter_page_images(pdf_document, page_numbers, dedupe, screen, timings):
+        image_bytes = record.pop('image')
+        image_path = Path(output_dir) / record['name']
+        
+        with timed('save_extracted', timings):
+            if record['duplicate_of'] is not None:
+                _link_duplicate(Path(output_dir) / record['duplicate_of'], image_path)
+            else:
                 # 保存图片
                 with open(image_path, "wb") as image_file:
                     image_file.write(image_bytes)
-                    image_count += 1
-                    extracted_images.append(image_filename)  # 只保存文件名
+        extracted_images.append(record)  # 只保存文件名等元数据
+    
+    return extracted_images
+
+def _extract_pages_worker(pdf_path, output_dir, page_numbers, dedupe=True, screen=None):
+    """分片进程任务：独立打开PDF并提取一段页面中的图片，返回 (记录列表, 耗时明细)"""
+    timings = StageTimings()
+    with timed('open', timings):
+        pdf_document = fitz.open(pdf_path)
+    try:
+        return _extract_pages(pdf_document, page_numbers, output_dir, dedupe, screen, timings), timings
+    finally:
+        pdf_document.close()
+
+def _merge_duplicates(records, output_dir):
+    """
+    合并分片结果后做跨分片去重：各分片只在自身范围内去重，
+    同一xref在后续分片中再次写入的文件改为指向全局首次出现的硬链接
+    """
+    first_seen = {}
+    for record in records:
+        original = first_seen.setdefault(record['xref'], record['name'])
+        if original == record['name']:
+            continue
+        if record['duplicate_of'] != original:
+            _link_duplicate(Path(output_dir) / original, Path(output_dir) / record['name'])
+        record['duplicate_of'] = original
+
+def _resolve_pages(pdf_document, pages):
+    """将 pages 参数转换为文档内有效的页码列表（从0开始），None 表示全部页面"""
+    page_count = len(pdf_document)
+    if pages is None:
+        return list(range(page_count))
+    return [page_num for page_num in pages if 0 <= page_num < page_count]
+
+def _split_pages(page_numbers, workers):
+    """将页码列表切分为最多 workers 段连续的分片"""
+    shard_size = max(MIN_PAGES_PER_WORKER, -(-len(page_numbers) // workers))
+    return [page_numbers[i:i + shard_size] for i in range(0, len(page_numbers), shard_size)]
+
+def extract_image_records(pdf_path, output_dir, pages=None, workers=1, dedupe=True, screen=None,
+                          timings=None):
+    """
+    从PDF文件中提取所有图片并保存到指定目录，返回每次图片出现的详细记录
+    
+    Args:
+        pdf_path: PDF文件路径
+        output_dir: 输出目录路径
+        pages: 要处理的页码（从0开始）的可迭代对象，如 range(0, 100)；None 表示全部页面
+        workers: 分片并行的进程数，大于1时将页面范围切分给多个进程，
+                 每个进程独立打开PDF，结果按页码顺序合并
+        dedupe: 是否按xref去重，False 时每次出现都单独解码并写入一个文件
+        screen: 可选的 ImageScreen，提取前按元数据跳过图标、蒙版和不能分割的图片
+        timings: 可选的 StageTimings，记录各阶段耗时（包括分片进程中的耗时）
+        
+    Returns:
+        list: 按页码顺序排列的记录，每条包含 name、page、index、xref、duplicate_of；
+              duplicate_of 为首次出现的文件名，非重复图片为 None
+    """
+    # 打开PDF文件
+    with timed('open', timings):
+        pdf_document = fitz.open(pdf_path)
+    
+    try:
+        page_numbers = _resolve_pages(pdf_document, pages)
+        
+        if not workers:
+            workers = os.cpu_count() or 1
+        shards = _split_pages(page_numbers, workers) if workers > 1 else []
+        
+        if len(shards) <= 1:
+            # 页数不足以分片时直接在当前进程中处理
+            records = _extract_pages(pdf_document, page_numbers, output_dir, dedupe, screen, timings)
+        else:
+            # 分片进程各自打开文档，这里的文档句柄不再需要
+            pdf_document.close()
+            pdf_document = None
+            with ProcessPoolExecutor(max_workers=len(shards), mp_context=_MP_CONTEXT) as executor:
+                results = executor.map(
+                    _extract_pages_worker,
+                    [pdf_path] * len(shards),
+                    [output_dir] * len(shards),
+                    shards,
+                    [dedupe] * len(shards),
+                    [screen] * len(shards),
+                )
+                # map 按分片顺序返回，分片本身按页码连续，合并后即为页码顺序
+                records = []
+                for shard_records, shard_timings in results:
+                    records.extend(shard_records)
+                    if timings is not None:
+                        timings.merge(shard_timings)
+            if dedupe:
+                _merge_duplicates(records, output_dir)
+    finally:
+        if pdf_document is not None:
+            pdf_document.close()
+    
+    return records
+
+def _read_pages_worker(pdf_path, page_numbers, dedupe=True, screen=None, page_window=None):
+    """分片进程任务：独立打开PDF并读取一段页面中的图片字节，返回 (记录列表, 耗时明细)"""
+    timings = StageTimings()
+    with timed('open', timings):
+        pdf_document = fitz.open(pdf_path)
+    try:
+        return list(_iter_page_images(pdf_document, page_numbers, dedupe, screen, timings, page_window)), timings
+    finally:
+        pdf_document.close()
+
+def _iter_sharded(pdf_path, page_numbers, workers, dedupe, screen=None, timings=None, page_window=None):
+    """
+    按页分片并行读取图片，按页码顺序逐条生成记录
+    
+    每个分片最多 MIN_PAGES_PER_WORKER 页，最多同时预取 workers * 2 个分片，
+    避免大文档的所有图片字节同时驻留内存。
+    """
+    shards = [page_numbers[i:i + MIN_PAGES_PER_WORKER]
+              for i in range(0, len(page_numbers), MIN_PAGES_PER_WORKER)]
+    # 跨分片去重：xref -> 全局首次出现的文件名
+    first_seen = {}
+    
+    with ProcessPoolExecutor(max_workers=workers, mp_context=_MP_CONTEXT) as executor:
+        pending = deque()
+        next_shard = 0
+        while next_shard < len(shards) or pending:
+            while next_shard < len(shards) and len(pending) < workers * 2:
+                pending.append(executor.submit(_read_pages_worker, pdf_path, shards[next_shard], dedupe, screen,
+                                               page_window))
+                next_shard += 1
+            shard_records, shard_timings = pending.popleft().result()
+            if timings is not None:
+                timings.merge(shard_timings)
+            for record in shard_records:
+                if dedupe:
+                    original = first_seen.setdefault(record['xref'], record['name'])
+                    if original != record['name']:
+                        record['image'] = None
+                        record['duplicate_of'] = original
+                yield record
+
+def count_images_in_pdf(pdf_path, pages=None, dedupe=True, screen=None):
+    """
+    只读取页面的图片列表统计图片数量，不提取任何图片数据
+    
+    Args:
+        pdf_path: PDF文件路径
+        pages: 要统计的页码（从0开始），None 表示全部页面
+        dedupe: 为 True 时同一xref只计一次
+        screen: 可选的 ImageScreen，只统计通过预筛选的图片
+        
+    Returns:
+        (通过预筛选的图片数量, 图片总数)，两者在同一次遍历图片列表时统计，没有 screen 时相同
+    """
+    pdf_document = fitz.open(pdf_path)
+    kept = []
+    xrefs = []
+    try:
+        for page_num in _resolve_pages(pdf_document, pages):
+            for img in pdf_document[page_num].get_images():
+                xrefs.append(img[0])
+                if screen is None or screen.check_pdf_image(img) is None:
+                    kept.append(img[0])
+    finally:
+        pdf_document.close()
+    if dedupe:
+        return len(set(kept)), len(set(xrefs))
+    return len(kept), len(xrefs)
+
+def iter_images_from_pdf(pdf_path, pages=None, decode=False, dedupe=True, workers=1, screen=None,
+                         timings=None, page_window=None):
+    """
+    以生成器方式逐张读取PDF中的图片，不写入任何中间文件
+    
+    Args:
+        pdf_path: PDF文件路径
+        pages: 要处理的页码（从0开始），None 表示全部页面
+        decode: 是否同时用 cv2.imdecode 解码为 ndarray（存入记录的 array 字段）
+        dedupe: 是否按xref去重，重复出现的图片只生成引用记录（image 为 None）
+        workers: 按页分片并行读取的进程数
+        screen: 可选的 ImageScreen，读取前按元数据跳过图标、蒙版和不能分割的图片
+        timings: 可选的 StageTimings，记录各阶段耗时（包括分片进程中的耗时）
+        page_window: 每处理这么多页释放一次 MuPDF 的对象缓存，用于控制大文档的内存，
+                     None 表示不主动释放
+        
+    Yields:
+        dict: 包含 name、page、index、xref、ext、width、height、image(原始字节)、array、duplicate_of 的记录
+    """
+    with timed('open', timings):
+        pdf_document = fitz.open(pdf_path)
     
-    pdf_document.close()
-    return image_count, extracted_images
+    try:
+        page_numbers = _resolve_pages(pdf_document, pages)
+        
+        if not workers:
+            workers = os.cpu_count() or 1
+        if workers > 1 and len(page_numbers) > MIN_PAGES_PER_WORKER:
+            # 分片进程各自打开文档，这里的文档句柄不再需要
+            pdf_document.close()
+            pdf_document = None
+            records = _iter_sharded(pdf_path, page_numbers, workers, dedupe, screen, timings, page_window)
+        else:
+            records = _iter_page_images(pdf_document, page_numbers, dedupe, screen, timings, page_window)
+        
+        for record in records:
+            record['array'] = None
+            if decode and record['image'] is not None:
+                with timed('decode', timings):
+                    record['array'] = load_image(record['image'])
+            yield record
+    finally:
+        if pdf_document is not None:
+            pdf_document.close()
 
-def process_pdf_directory(pdf_dir, output_dir):
+def extract_images_from_pdf(pdf_path, output_dir, pages=None, workers=1, dedupe=True, screen=None,
+                            timings=None):
+    """
+    从PDF文件中提取所有图片并保存到指定目录
+    
+    Args:
+        pdf_path: PDF文件路径
+        output_dir: 输出目录路径
+        pages: 要处理的页码（从0开始），None 表示全部页面
+        workers: 分片并行的进程数
+        dedupe: 是否按xref去重，重复出现的图片以硬链接保存；
+                False 时每次出现都单独写入一个文件
+        screen: 可选的 ImageScreen，见 extract_image_records
+        timings: 可选的 StageTimings，见 extract_image_records
+        
+    Returns:
+        tuple: (图片数量, 提取的图片路径列表)
+    """
+    records = extract_image_records(pdf_path, output_dir, pages, workers, dedupe, screen, timings)
+    extracted_images = [record['name'] for record in records]
+    return len(extracted_images), extracted_images
+
+def _extract_pdf_worker(pdf_path, output_dir, dedupe=True, screen=None):
+    """
+    进程池中处理单个PDF的任务，每个进程独立打开自己的fitz文档
+
+    Returns:
+        tuple: (PDF路径, 图片数量, 错误信息或None, 耗时明细)
+    """
+    timings = StageTimings()
+    try:
+        Path(output_dir).mkdir(parents=True, exist_ok=True)
+        images_count, _ = extract_images_from_pdf(pdf_path, output_dir, dedupe=dedupe, screen=screen,
+                                                  timings=timings)
+        return pdf_path, images_count, None, timings
+    except Exception as e:
+        return pdf_path, 0, str(e), timings
+
+def process_pdf_directory(pdf_dir, output_dir, jobs=1, errors=None, dedupe=True, screen=None, timings=None,
+                          resume=True):
     """
     处理指定目录下的所有PDF文件
     
+    每个PDF的图片保存在以PDF文件名命名的子目录中，因此不同PDF的
+    pageN_imgM 文件不会互相覆盖，输出与调度顺序无关。
+    每个PDF处理完成后记录在输出目录的批处理清单中（见 batch_manifest.BatchManifest），
+    重新运行时跳过未变化且输出完整的PDF，其余PDF先清除上次留下的输出再重新提取。
+    
     Args:
         pdf_dir: PDF文件所在目录
         output_dir: 输出目录路径
+        jobs: 并行进程数，1 表示顺序处理，0 或 None 表示使用全部CPU核心
+        errors: 可选列表，用于收集处理失败的 (PDF路径, 错误信息)；不提供时直接打印每个失败的PDF
+        dedupe: 是否按xref去重，见 extract_images_from_pdf
+        screen: 可选的 ImageScreen，见 extract_image_records
+        timings: 可选的 StageTimings，汇总所有PDF的各阶段耗时
+        resume: 是否跳过清单中已完成的PDF，False 时全部重新处理（清单仍会更新）
+        
+    Returns:
+        tuple: (PDF数量, 图片总数)，图片总数包括跳过的PDF上次提取的图片
     """
     # 确保输出目录存在
     Path(output_dir).mkdir(parents=True, exist_ok=True)
     
-    # 获取所有PDF文件
-    pdf_files = glob.glob(os.path.join(pdf_dir, "*.pdf"))
+    # 获取所有PDF文件，排序保证处理顺序确定
+    pdf_files = sorted(glob.glob(os.path.join(pdf_dir, "*.pdf")))
     
     if not pdf_files:
         print(f"在目录 {pdf_dir} 中没有找到PDF文件")
-        return
+        return 0, 0
     
     total_pdfs = len(pdf_files)
     total_images = 0
     
-    # 处理每个PDF文件
-    for index, pdf_path in enumerate(pdf_files, 1):
-        try:
-            images_count, pdf_name = extract_images_from_pdf(pdf_path, output_dir)
+    manifest = BatchManifest(Path(output_dir) / BATCH_MANIFEST_NAME)
+    params = {'dedupe': dedupe, 'screen': screen.params() if screen is not None else None}
+    
+    # 跳过未变化的PDF，其余的清除上次可能只写了一部分的输出
+    pending = []
+    for pdf_path in pdf_files:
+        if resume and manifest.is_current(pdf_path, params):
+            total_images += manifest.get(pdf_path)['result']
+            continue
+        pdf_output = str(Path(output_dir) / Path(pdf_path).stem)
+        reset_output_dir(pdf_output)
+        pending.append((pdf_path, pdf_output))
+    if len(pending) < total_pdfs:
+        print(f"跳过 {total_pdfs - len(pending)} 个已处理且未变化的PDF")
+    
+    if not jobs:
+        jobs = os.cpu_count() or 1
+    jobs = max(1, min(jobs, len(pending)))
+    
+    if jobs > 1:
+        # 每个PDF交给进程池中的一个进程；map按提交顺序返回结果
+        executor = ProcessPoolExecutor(max_workers=jobs, mp_context=_MP_CONTEXT)
+        results = executor.map(
+            _extract_pdf_worker, *zip(*pending), [dedupe] * len(pending), [screen] * len(pending)
+        )
+    else:
+        executor = None
+        results = (_extract_pdf_worker(pdf_path, pdf_output, dedupe, screen) for pdf_path, pdf_output in pending)
+    
+    # 逐个汇总结果，每个PDF完成后立即记入清单，中途退出时已完成的不会丢失
+    try:
+        for index, (pdf_path, images_count, error, pdf_timings) in enumerate(results, 1):
+            pdf_name = Path(pdf_path).stem
+            if timings is not None:
+                # 顺序处理时明细已计入本进程的直方图，只有子进程的需要补记
+                timings.merge(pdf_timings, observe=jobs > 1)
+            if error is not None:
+                if errors is not None:
+                    errors.append((pdf_path, error))
+                else:
+                    print(f"[{index}/{len(pending)}] 处理 {pdf_name}.pdf 时发生错误: {error}")
+                continue
+            manifest.record(pdf_path, params, list_outputs(Path(output_dir) / pdf_name), images_count)
             total_images += images_count
-            print(f"[{index}/{total_pdfs}] 处理 {pdf_name}.pdf: 提取了 {images_count} 张图片")
-        except Exception as e:
-            print(f"处理 {pdf_path} 时发生错误: {str(e)}")
+            print(f"[{index}/{len(pending)}] 处理 {pdf_name}.pdf: 提取了 {images_count} 张图片")
+    finally:
+        if executor is not None:
+            executor.shutdown()
+        manifest.compact()
     
     return total_pdfs, total_images
 
+def parse_page_range(text):
+    """
+    解析形如 "1-100" 或 "5" 的页码范围（从1开始，包含两端）
+    
+    Returns:
+        range: 从0开始的页码范围，text 为空时返回 None
+    """
+    if not text:
+        return None
+    start, _, end = text.partition('-')
+    start = int(start)
+    end = int(end) if end else start
+    if start < 1 or end < start:
+        raise ValueError(f"无效的页码范围: {text}")
+    return range(start - 1, end)
+
 def main():
     parser = argparse.ArgumentParser(description='从PDF文件中提取图片')
     parser.add_argument('pdf_path', help='PDF文件或目录路径')
     parser.add_argument('--output', '-o', default='output_images',
                       help='输出目录路径 (默认: output_images)')
+    parser.add_argument('--jobs', '-j', type=int, default=1,
+                      help='并行处理PDF的进程数，0 表示使用全部CPU核心 (默认: 1)')
+    parser.add_argument('--workers', '-w', type=int, default=1,
+                      help='单个PDF按页分片并行的进程数，0 表示使用全部CPU核心 (默认: 1)')
+    parser.add_argument('--pages', '-p', default=None,
+                      help='只处理指定页码范围，如 1-100 (默认: 全部页面)')
+    parser.add_argument('--no-dedupe', action='store_true',
+                      help='不按xref去重，重复出现的图片每次都单独写入文件')
+    parser.add_argument('--min-size', type=int, default=0,
+                      help='跳过短边小于该像素数的图片（图标、装饰等），只读取元数据 (默认: 不限制)')
+    parser.add_argument('--max-aspect', type=float, default=None,
+                      help='跳过长宽比超过该值的图片（分隔线等） (默认: 不限制)')
+    parser.add_argument('--grid', type=int, default=None,
+                      help='只提取能均匀分割为该数量子图的图片 (默认: 不检查)')
+    parser.add_argument('--profile', action='store_true',
+                      help='结束后打印各阶段（打开、页面解析、图片提取、写入）的耗时明细')
+    parser.add_argument('--no-resume', action='store_true',
+                      help='处理目录时不跳过清单中已完成的PDF，全部重新提取')
     
     args = parser.parse_args()
     pdf_path = args.pdf_path
     
+    screen = None
+    if args.min_size or args.max_aspect or args.grid:
+        screen = ImageScreen(args.grid, min_size=args.min_size, max_aspect=args.max_aspect)
+    timings = StageTimings() if args.profile else None
+    
     try:
         if os.path.isdir(pdf_path):
             # 处理整个目录
-            total_pdfs, total_images = process_pdf_directory(pdf_path, args.output)
+            errors = []
+            total_pdfs, total_images = process_pdf_directory(
+                pdf_path, args.output, jobs=args.jobs, errors=errors,
+                dedupe=not args.no_dedupe, screen=screen, timings=timings, resume=not args.no_resume
+            )
+            for failed_path, error in errors:
+                print(f"处理 {failed_path} 时发生错误: {error}")
             print(f"\n总计处理了 {total_pdfs} 个PDF文件，提取了 {total_images} 张图片")
             print(f"所有图片已保存到目录: {args.output}")
         else:
             # 处理单个PDF文件
-            num_images, pdf_name = extract_images_from_pdf(pdf_path, args.output)
+            Path(args.output).mkdir(parents=True, exist_ok=True)
+            num_images, _ = extract_images_from_pdf(
+                pdf_path, args.output, pages=parse_page_range(args.pages), workers=args.workers,
+                dedupe=not args.no_dedupe, screen=screen, timings=timings
+            )
+            pdf_name = Path(pdf_path).stem
             print(f"成功从 {pdf_name}.pdf 中提取了 {num_images} 张图片到目录: {args.output}")
     except Exception as e:
         print(f"发生错误: {str(e)}")
+    
+    if timings is not None:
+        print("\n各阶段耗时:")
+        print(timings.format())
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
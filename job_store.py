@@ -0,0 +1,358 @@
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from jobs import Job, new_status
+
+# 运行中的任务超过该时间（秒）没有更新心跳，视为工作进程已退出，重新排队
+HEARTBEAT_TIMEOUT = 60
+
+# 只追加的状态列表：存储中的类型 -> 状态字典中的字段（与 /status 的游标名一致）
+LIST_FIELDS = {'log': 'log', 'images': 'extracted_images', 'splits': 'split_items'}
+
+# 保存在 jobs.status 列中的标量状态字段
+SCALAR_FIELDS = ('is_processing', 'progress', 'status', 'current_step', 'current_pdf_name',
+                 'subimages_count', 'timings')
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS jobs (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    id TEXT UNIQUE NOT NULL,
+    state TEXT NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    pdf_path TEXT NOT NULL,
+    output_dir TEXT NOT NULL,
+    params TEXT NOT NULL,
+    status TEXT NOT NULL,
+    cancel_requested INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    heartbeat REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_queue ON jobs (state, priority DESC, seq);
+CREATE TABLE IF NOT EXISTS job_items (
+    job_id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (job_id, kind, seq)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS worker_metrics (
+    worker TEXT PRIMARY KEY,
+    metrics TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+'''
+
+def worker_name():
+    """当前进程在 jobs.worker 列中的标识：主机名:进程号"""
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+def _worker_alive(worker):
+    """判断本机上的工作进程是否仍在运行，其他主机的进程只能依靠心跳判断"""
+    host, _, pid = (worker or '').rpartition(':')
+    if host != socket.gethostname() or not pid.isdigit():
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass
+    return True
+
+class JobStore:
+    """
+    保存在SQLite（WAL模式）中的任务队列和任务状态，多个Web进程和工作进程共用
+
+    Web进程提交任务、查询状态和取消任务，接口与原来的进程内调度器相同；
+    工作进程用 claim() 领取任务，处理过程中用 save() 定期写回状态和心跳，
+    用 finish() 结束任务。日志、提取图片和分割结果只追加，按序号保存在
+    job_items 表中，写回时只插入新增的条目。
+
+    每个线程使用自己的数据库连接。
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        conn = self._connect()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.executescript(SCHEMA)
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # 自动提交模式，需要原子性的操作显式使用 BEGIN IMMEDIATE
+            conn = sqlite3.connect(str(self.path), timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _transaction(self):
+        return _Transaction(self._connect())
+
+    @staticmethod
+    def _scalars(status):
+        return json.dumps({key: status.get(key) for key in SCALAR_FIELDS}, ensure_ascii=False)
+
+    def _insert_items(self, conn, job_id, status, start_counts=None):
+        """插入状态列表中 start_counts 之后的新条目，返回各列表写入后的长度"""
+        counts = {}
+        for kind, field in LIST_FIELDS.items():
+            items = list(status[field])
+            start = (start_counts or {}).get(kind, 0)
+            conn.executemany(
+                'INSERT OR REPLACE INTO job_items (job_id, kind, seq, data) VALUES (?, ?, ?, ?)',
+                [(job_id, kind, seq, json.dumps(item, ensure_ascii=False))
+                 for seq, item in enumerate(items[start:], start)],
+            )
+            counts[kind] = len(items)
+        return counts
+
+    def _insert(self, job, state):
+        job.status['state'] = state
+        params = {
+            'subimages_count': job.subimages_count,
+            'workers': job.workers,
+            'cache_key': job.cache_key,
+            'max_memory': job.max_memory,
+            'split_mode': job.split_mode,
+            'lossless': job.lossless,
+        }
+        with self._transaction() as conn:
+            conn.execute(
+                'INSERT INTO jobs (id, state, priority, created_at, pdf_path, output_dir, params, status) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (job.id, state, job.priority, job.created_at, job.pdf_path, job.output_dir,
+                 json.dumps(params), self._scalars(job.status)),
+            )
+            self._insert_items(conn, job.id, job.status)
+
+    def _load(self, row, items=True):
+        params = json.loads(row['params'])
+        job = Job(row['pdf_path'], row['output_dir'], params['subimages_count'], params['workers'],
+                  row['priority'], job_id=row['id'])
+        job.cache_key = params['cache_key']
+        job.max_memory = params['max_memory']
+        job.split_mode = params['split_mode']
+        job.lossless = params.get('lossless', False)
+        job.created_at = row['created_at']
+        job.status.update(json.loads(row['status']))
+        job.status['state'] = row['state']
+        if row['cancel_requested']:
+            job.stop_event.set()
+        if items:
+            for item in self._connect().execute(
+                    'SELECT kind, data FROM job_items WHERE job_id = ? ORDER BY kind, seq', (row['id'],)):
+                job.status[LIST_FIELDS[item['kind']]].append(json.loads(item['data']))
+            # 分割结果按图片的提取顺序排列
+            job.status['split_results'] = {
+                item['name']: item['subimages']
+                for item in sorted(job.status['split_items'], key=lambda item: item['index'])
+            }
+        return job
+
+    # Web进程使用的接口
+
+    def submit(self, job):
+        """提交任务，返回任务ID"""
+        self._insert(job, 'queued')
+        return job.id
+
+    def add_finished(self, job, state):
+        """登记一个无需处理即已结束的任务（例如直接命中结果缓存）"""
+        job.mark_finished(state)
+        self._insert(job, state)
+
+    def get(self, job_id, items=True):
+        """
+        按ID获取任务，不存在时返回None
+
+        Args:
+            items: 是否读取日志、提取图片和分割结果，只需要概要信息时可以跳过
+        """
+        row = self._connect().execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return self._load(row, items) if row is not None else None
+
+    def get_delta(self, job_id, cursors):
+        """
+        读取任务的概要信息和各列表在游标之后新增的条目，用于增量状态接口
+
+        只查询 seq 不小于游标的条目，开销与新增的条目数成正比，与任务已有的条目总数无关。
+
+        Args:
+            cursors: 类型（log、images、splits） -> 客户端已收到的条目数
+
+        Returns:
+            (Job, {类型: 新增条目列表}, {类型: 列表当前长度})，任务不存在时返回 (None, None, None)；
+            Job 的列表状态为空
+        """
+        conn = self._connect()
+        # 在同一个读事务中查询，概要信息、长度和条目属于同一时刻
+        conn.execute('BEGIN')
+        try:
+            row = conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+            if row is None:
+                return None, None, None
+            items = {}
+            lengths = {}
+            for kind in LIST_FIELDS:
+                last = conn.execute('SELECT MAX(seq) FROM job_items WHERE job_id = ? AND kind = ?',
+                                    (job_id, kind)).fetchone()[0]
+                lengths[kind] = last + 1 if last is not None else 0
+                items[kind] = [
+                    json.loads(item['data']) for item in conn.execute(
+                        'SELECT data FROM job_items WHERE job_id = ? AND kind = ? AND seq >= ? ORDER BY seq',
+                        (job_id, kind, cursors.get(kind, 0)))
+                ]
+            return self._load(row, items=False), items, lengths
+        finally:
+            conn.execute('COMMIT')
+
+    def list_jobs(self, items=False):
+        """按提交时间返回所有任务，默认不读取各任务的列表状态"""
+        rows = self._connect().execute('SELECT * FROM jobs ORDER BY created_at, seq').fetchall()
+        return [self._load(row, items) for row in rows]
+
+    def queue_position(self, job_id):
+        """返回排队任务前面还有多少个任务，任务不在排队中时返回None"""
+        row = self._connect().execute(
+            'SELECT state, priority, seq FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        if row is None or row['state'] != 'queued':
+            return None
+        return self._connect().execute(
+            "SELECT COUNT(*) FROM jobs WHERE state = 'queued' AND (priority > ? OR (priority = ? AND seq < ?))",
+            (row['priority'], row['priority'], row['seq']),
+        ).fetchone()[0]
+
+    def cancel(self, job_id):
+        """
+        取消任务：排队中的任务直接标记为已取消，运行中的任务由工作进程在下次写回状态时停止
+
+        Returns:
+            bool: 任务存在且尚未结束时返回 True
+        """
+        with self._transaction() as conn:
+            row = conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+            if row is None or row['state'] not in ('queued', 'running'):
+                return False
+            if row['state'] == 'queued':
+                job = self._load(row, items=False)
+                job.mark_finished('cancelled')
+                log_count = conn.execute(
+                    "SELECT COUNT(*) FROM job_items WHERE job_id = ? AND kind = 'log'", (job_id,)).fetchone()[0]
+                conn.execute(
+                    "UPDATE jobs SET state = 'cancelled', status = ? WHERE id = ?",
+                    (self._scalars(job.status), job_id))
+                conn.execute(
+                    "INSERT INTO job_items (job_id, kind, seq, data) VALUES (?, 'log', ?, ?)",
+                    (job_id, log_count, json.dumps(job.status['log'][-1], ensure_ascii=False)))
+            else:
+                conn.execute('UPDATE jobs SET cancel_requested = 1 WHERE id = ?', (job_id,))
+        return True
+
+    # 工作进程使用的接口
+
+    def claim(self, worker=None):
+        """
+        领取优先级最高的排队任务（相同优先级按提交顺序），标记为运行中
+
+        工作进程已退出（心跳超时或本机进程不存在）的运行中任务清空状态后重新领取。
+
+        Returns:
+            Job: 领取的任务，没有可处理的任务时返回None
+        """
+        worker = worker or worker_name()
+        now = time.time()
+        with self._transaction() as conn:
+            row = None
+            for running in conn.execute(
+                    "SELECT * FROM jobs WHERE state = 'running' ORDER BY priority DESC, seq").fetchall():
+                if running['heartbeat'] < now - HEARTBEAT_TIMEOUT or not _worker_alive(running['worker']):
+                    row = running
+                    break
+            if row is None:
+                row = conn.execute(
+                    "SELECT * FROM jobs WHERE state = 'queued' ORDER BY priority DESC, seq LIMIT 1").fetchone()
+            if row is None:
+                return None
+
+            job = self._load(row, items=False)
+            if row['state'] == 'running':
+                # 之前的处理结果不完整，从头开始
+                conn.execute('DELETE FROM job_items WHERE job_id = ?', (job.id,))
+                job.status = new_status(job.subimages_count)
+                job.status['job_id'] = job.id
+                job.status['log'].append('工作进程已退出，任务重新开始')
+            job.status['state'] = 'running'
+            job.status['status'] = '正在处理...'
+            conn.execute(
+                "UPDATE jobs SET state = 'running', status = ?, worker = ?, heartbeat = ? WHERE id = ?",
+                (self._scalars(job.status), worker, now, job.id))
+            job.saved_counts = self._insert_items(conn, job.id, job.status)
+        return job
+
+    def _write(self, conn, job, state=None):
+        conn.execute(
+            'UPDATE jobs SET state = COALESCE(?, state), status = ?, output_dir = ?, heartbeat = ? WHERE id = ?',
+            (state, self._scalars(job.status), job.output_dir, time.time(), job.id))
+        job.saved_counts = self._insert_items(conn, job.id, job.status, job.saved_counts)
+
+    def save(self, job):
+        """
+        写回任务的状态和输出目录，只插入新增的列表条目，同时更新心跳
+
+        Returns:
+            bool: 是否已请求取消该任务
+        """
+        with self._transaction() as conn:
+            self._write(conn, job)
+            row = conn.execute('SELECT cancel_requested FROM jobs WHERE id = ?', (job.id,)).fetchone()
+        return bool(row and row['cancel_requested'])
+
+    def save_metrics(self, snapshot, worker=None):
+        """保存工作进程的运行指标快照（见 metrics.Registry.snapshot），由Web进程的 /metrics 汇总"""
+        self._connect().execute(
+            'INSERT OR REPLACE INTO worker_metrics (worker, metrics, updated_at) VALUES (?, ?, ?)',
+            (worker or worker_name(), json.dumps(snapshot, ensure_ascii=False), time.time()))
+
+    def load_metrics(self):
+        """
+        读取各工作进程保存的运行指标快照
+
+        Returns:
+            list: (快照, 进程是否仍在运行)，超过心跳超时没有更新或本机进程已不存在时视为已退出
+        """
+        deadline = time.time() - HEARTBEAT_TIMEOUT
+        return [
+            (json.loads(row['metrics']), row['updated_at'] >= deadline and _worker_alive(row['worker']))
+            for row in self._connect().execute('SELECT * FROM worker_metrics')
+        ]
+
+    def finish(self, job, state):
+        """结束任务并写回最终状态"""
+        job.mark_finished(state)
+        with self._transaction() as conn:
+            self._write(conn, job, state)
+            conn.execute('UPDATE jobs SET worker = NULL WHERE id = ?', (job.id,))
+
+class _Transaction:
+    """BEGIN IMMEDIATE ... COMMIT，出错时回滚；写事务之间互斥，避免领取同一个任务"""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute('BEGIN IMMEDIATE')
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute('ROLLBACK' if exc_type is not None else 'COMMIT')
+        return False
@@ -0,0 +1,67 @@
+import threading
+import time
+import uuid
+
+# 同时处理的任务数上限（工作进程数），超出的任务排队等待
+MAX_CONCURRENT_JOBS = 2
+
+def new_status(subimages_count=8):
+    """创建一个任务的初始处理状态"""
+    return {
+        'job_id': '',
+        'state': 'queued',       # queued, running, complete, failed, cancelled
+        'is_processing': True,
+        'progress': 0,
+        'status': '排队等待中...',
+        'log': [],
+        'extracted_images': [],  # 存储提取的图片路径
+        'split_results': {},     # 存储分割结果
+        'split_items': [],       # 按完成顺序追加的分割结果，用于增量状态推送
+        'current_step': 'none',  # none, extracting, splitting, complete
+        'current_pdf_name': '',  # 保存当前PDF名称用于后续处理
+        'subimages_count': subimages_count,
+        'timings': {},           # 各处理阶段的耗时明细 {阶段: {'seconds', 'count'}}
+    }
+
+class Job:
+    """一个PDF处理任务：拥有独立的ID、输出目录、处理状态和取消标记"""
+
+    def __init__(self, pdf_path, output_dir, subimages_count=8, workers=1, priority=0, job_id=None):
+        self.id = job_id or uuid.uuid4().hex[:12]
+        self.pdf_path = pdf_path
+        self.output_dir = output_dir
+        self.subimages_count = subimages_count
+        self.workers = workers
+        self.priority = priority
+        # 结果缓存的键，由PDF内容哈希和分割参数决定
+        self.cache_key = None
+        # 可选的内存预算（字节），见 processing.process_pdf
+        self.max_memory = None
+        # 分割方式，见 split_subimages.SPLIT_MODES
+        self.split_mode = 'grid'
+        # JPEG图片是否在DCT域无损裁剪子图，见 processing.process_pdf
+        self.lossless = False
+        self.created_at = time.time()
+        self.stop_event = threading.Event()
+        self.status = new_status(subimages_count)
+        self.status['job_id'] = self.id
+        # 各状态列表已写入任务存储的条目数，见 job_store.JobStore.save
+        self.saved_counts = None
+
+    @property
+    def state(self):
+        return self.status['state']
+
+    @property
+    def finished(self):
+        return self.state in ('complete', 'failed', 'cancelled')
+
+    def mark_finished(self, state):
+        """把状态标记为已结束（complete、failed 或 cancelled）"""
+        self.status['state'] = state
+        self.status['is_processing'] = False
+        if state == 'cancelled':
+            self.status['status'] = '已取消'
+            self.status['log'].append('任务已取消')
+        elif state == 'failed':
+            self.status['status'] = '处理失败'
@@ -1,37 +1,57 @@
-from flask import Flask, render_template, request, jsonify, send_from_directory, send_file
+from flask import (
+    Blueprint, Flask, Response, current_app, render_template, request, jsonify,
+    send_file, stream_with_context,
+)
 from pathlib import Path
+import mimetypes
 import os
 import shutil
 import threading
 import webbrowser
 import signal
 import sys
-import zipfile
 import json
 import urllib.parse
+import uuid
+import hashlib
 from werkzeug.utils import secure_filename
 
-from extract_images import extract_images_from_pdf
-from split_subimages import process_directory
+from split_subimages import SPLIT_MODES, process_directory, split_engine
+from jobs import Job, MAX_CONCURRENT_JOBS
+from job_store import JobStore
+from worker import start_workers, stop_workers
+from zipstream import iter_zip, directory_entries
+from result_cache import ResultCache, file_version, result_key
+from thumbnails import THUMB_SIZES, ensure_thumbnail
+from uploads import DEFAULT_CHUNK_SIZE, PdfStore, UploadError, link_or_copy
+from metrics import JOBS, REGISTRY, timed_iter
+from processing import (
+    EXTRACT_WORKERS, CACHE_DIR, CACHE_MAX_BYTES, PDF_STORE_DIR, PDF_STORE_MAX_BYTES, PDF_MAX_FILE_BYTES,
+    JOB_DB_PATH, apply_cached_result,
+)
 
-app = Flask(__name__)
-
-# 全局变量存储处理状态和结果
-processing_status = {
-    'is_processing': False,
-    'progress': 0,
-    'status': '等待开始...',
-    'log': [],
-    'extracted_images': [],  # 存储提取的图片路径
-    'split_results': {},     # 存储分割结果
-    'current_step': 'none',   # none, extracting, splitting, complete
-    'current_pdf_name': '',   # 保存当前PDF名称用于后续处理
-    'subimages_count': 8  # 默认子图数量
-}
+bp = Blueprint('pdf', __name__)
 
 # 在文件开头添加
 ALLOWED_EXTENSIONS = {'pdf'}
 
+result_cache = ResultCache(CACHE_DIR, CACHE_MAX_BYTES)
+
+# 按内容哈希保存的上传PDF和分块上传会话
+pdf_store = PdfStore(PDF_STORE_DIR, PDF_STORE_MAX_BYTES, PDF_MAX_FILE_BYTES)
+
+# 内容不会变化的文件（缩略图、带内容版本号的结果文件）的浏览器缓存时间（秒）
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+# 结果文件所在的根目录，X-Accel-Redirect 模式下按相对于该目录的路径转交给 nginx
+OUTPUT_ROOT = Path('output_images')
+
+# 由反向代理发送文件内容的方式：None 由Flask发送，'x-sendfile'（Apache、lighttpd）或 'x-accel'（nginx）
+SENDFILE_MODES = (None, 'x-sendfile', 'x-accel')
+
+# X-Accel-Redirect 模式下 nginx 中指向 OUTPUT_ROOT 的 internal location
+ACCEL_PREFIX = '/protected-output/'
+
 def allowed_file(filename):
     """检查文件扩展名是否允许"""
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
@@ -50,143 +70,165 @@ def open_browser():
     """在新线程中打开浏览器"""
     webbrowser.open('http://127.0.0.1:8080/')
 
+# 开发模式下随服务器一起启动的工作进程，关闭服务器时终止
+worker_processes = []
+
 def signal_handler(sig, frame):
     """处理关闭信号"""
     print('\n正在关闭服务器...')
+    stop_workers(worker_processes)
     # 清理临时文件
-    cleanup_temp_files()
+    cleanup_temp_files(JobStore(JOB_DB_PATH))
     sys.exit(0)
 
-def cleanup_temp_files():
-    """清理临时文件和目录"""
+def cleanup_temp_files(store):
+    """清理已结束任务的上传目录，并将结果缓存淘汰到配额以内
+    
+    排队中和运行中的任务保存在任务存储中，重启后继续处理，它们的上传目录需要保留。
+    """
     try:
-        # 清理上传目录
         upload_dir = Path('uploads')
         if upload_dir.exists():
-            shutil.rmtree(str(upload_dir))
+            for job_dir in upload_dir.iterdir():
+                job = store.get(job_dir.name, items=False)
+                if job is None or job.finished:
+                    shutil.rmtree(str(job_dir), ignore_errors=True)
         
-        # 清理临时文件
-        output_dir = Path('output_images')
-        if output_dir.exists():
-            for item in output_dir.glob('temp_*'):
-                if item.is_dir():
-                    shutil.rmtree(str(item))
+        # 结果目录由缓存按最近使用时间淘汰，不会无限增长
+        result_cache.evict()
     except Exception as e:
         print(f"清理文件时发生错误: {str(e)}")
 
-def process_pdf(pdf_path, output_dir, subimages_count=8):
-    """处理PDF文件的后台任务"""
-    global processing_status
-    processing_status['subimages_count'] = subimages_count  # 保存子图数量设置
-    temp_dir = None
+def job_store():
+    """当前应用的任务存储，见 create_app"""
+    return current_app.extensions['job_store']
+
+@bp.route('/')
+def index():
+    return render_template('index.html')
+
+def parse_job_options(form):
+    """
+    读取上传表单中的处理参数
+
+    Returns:
+        dict: subimages_count、workers、priority、split_mode、max_memory、lossless
+
+    Raises:
+        ValueError: 参数无效，异常信息可以直接返回给客户端
+    """
+    # 获取子图数量参数
+    try:
+        subimages_count = int(form.get('subimages_count', '8'))
+        if subimages_count <= 0:
+            raise ValueError("子图数量必须大于0")
+    except ValueError as e:
+        raise ValueError(f'子图数量无效: {str(e)}')
     
+    # 获取提取进程数参数（可选）
     try:
-        pdf_name = Path(pdf_path).stem
-        # 保存当前PDF名称用于后续处理
-        processing_status['current_pdf_name'] = pdf_name
-        
-        output_base_dir = Path(output_dir)
-        output_base_dir.mkdir(parents=True, exist_ok=True)
-        
-        # 使用安全的目录名 - 只保留字母数字和下划线
-        safe_name = "".join(x if x.isalnum() else '_' for x in pdf_name)
-        temp_dir = output_base_dir / f"temp_{safe_name}"
-        temp_dir.mkdir(exist_ok=True)
-        
-        # 第一步：提取图片
-        processing_status['current_step'] = 'extracting'
-        processing_status['status'] = "正在从PDF提取图片..."
-        processing_status['progress'] = 20
-        processing_status['log'].append(f"开始处理PDF: {pdf_name}")
-        
-        num_images, image_files = extract_images_from_pdf(pdf_path, str(temp_dir))
-        
-        # 收集提取的图片信息
-        extracted_images = []
-        for img_name in image_files:
-            img_path = temp_dir / img_name
-            if img_path.exists():  # 确保文件存在
-                # 使用os.path.join来确保正确的路径分隔符
-                relative_path = os.path.join(f"temp_{safe_name}", img_name)
-                extracted_images.append({
-                    'path': relative_path,
-                    'name': img_name
-                })
-        
-        processing_status['extracted_images'] = extracted_images
-        processing_status['log'].append(f"已提取 {num_images} 张图片")
-        processing_status['progress'] = 50
-        
-        # 第二步：分割子图
-        processing_status['current_step'] = 'splitting'
-        processing_status['status'] = "正在处理提取出的图片..."
-        processing_status['log'].append("开始分割子图...")
-        
-        final_output = output_base_dir / safe_name
-        if final_output.exists():
-            shutil.rmtree(str(final_output))
-        final_output.mkdir(parents=True)
+        workers = int(form.get('workers', str(EXTRACT_WORKERS)))
+        if workers <= 0:
+            raise ValueError("进程数必须大于0")
+    except ValueError as e:
+        raise ValueError(f'进程数无效: {str(e)}')
         
-        # 处理每个提取出的图片
-        split_results = {}
-        total_split = 0
-        
-        for img_info in extracted_images:
-            img_path = temp_dir / img_info['name']
-            if img_path.exists():
-                output_subdir = final_output / f"split_{img_info['name'].rsplit('.', 1)[0]}"
-                output_subdir.mkdir(exist_ok=True)
-                
-                try:
-                    # 处理单个图片，传入子图数量参数
-                    from split_subimages import process_image
-                    success = process_image(str(img_path), str(output_subdir), subimages_count)
-                    
-                    if success:
-                        # 收集分割结果
-                        subimages = []
-                        for subimg in output_subdir.glob('*.jpg'):
-                            relative_path = os.path.join(
-                                safe_name,
-                                f"split_{img_info['name'].rsplit('.', 1)[0]}",
-                                subimg.name
-                            )
-                            subimages.append(relative_path)
-                        
-                        if subimages:
-                            split_results[img_info['name']] = subimages
-                            total_split += len(subimages)
-                            processing_status['log'].append(
-                                f"成功从 {img_info['name']} 提取了 {len(subimages)} 个子图"
-                            )
-                    else:
-                        processing_status['log'].append(f"跳过 {img_info['name']} - 不符合分割要求")
-                        
-                except Exception as e:
-                    processing_status['log'].append(f"处理 {img_info['name']} 时发生错误: {str(e)}")
-                    print(f"处理 {img_info['name']} 时发生错误: {str(e)}")  # 控制台日志
-        
-        processing_status['split_results'] = split_results
-        processing_status['log'].append(f"分割完成: 共提取 {total_split} 个子图")
-        
-        processing_status['progress'] = 100
-        processing_status['status'] = "处理完成！"
-        processing_status['log'].append("所有处理已完成！")
-        processing_status['current_step'] = 'complete'
-        
-    except Exception as e:
-        processing_status['log'].append(f"错误: {str(e)}")
-        print(f"处理错误: {str(e)}")
-    finally:
-        processing_status['is_processing'] = False
+    # 获取任务优先级参数（可选，数值越大越先处理）
+    try:
+        priority = int(form.get('priority', '0'))
+    except ValueError:
+        raise ValueError('优先级无效')
+    
+    # 获取分割方式参数（可选）
+    split_mode = form.get('split_mode', 'grid')
+    if split_mode not in SPLIT_MODES:
+        raise ValueError(f'分割方式无效: {split_mode}')
+    
+    # 获取内存预算参数（可选，单位MB），用于处理超大的扫描PDF
+    max_memory = form.get('max_memory', '').strip()
+    try:
+        max_memory = int(max_memory) * 1024 * 1024 if max_memory else None
+        if max_memory is not None and max_memory <= 0:
+            raise ValueError("内存预算必须大于0")
+    except ValueError as e:
+        raise ValueError(f'内存预算无效: {str(e)}')
+    
+    # 画质选项：是否在DCT域无损裁剪JPEG子图，保留原图画质但通常更慢；子图窗口按MCU对齐，与默认结果不同
+    lossless = form.get('lossless', '').strip().lower() in ('1', 'true', 'on')
+    
+    return {
+        'subimages_count': subimages_count,
+        'workers': workers,
+        'priority': priority,
+        'split_mode': split_mode,
+        'max_memory': max_memory,
+        'lossless': lossless,
+    }
 
-@app.route('/')
-def index():
-    return render_template('index.html')
+def start_job(pdf_hash, filename, options):
+    """
+    为已知内容哈希的PDF创建任务
+    
+    缓存中已有相同PDF和参数的结果时直接完成；否则把 pdf_store 中保存的PDF
+    链接到任务目录并提交任务。
+    
+    Args:
+        pdf_hash: PDF内容的SHA-256
+        filename: 原始文件名
+        options: parse_job_options() 返回的处理参数
+    
+    Returns:
+        str: 任务ID，既没有缓存结果也没有保存的PDF时返回None
+    """
+    # 每个任务使用独立的上传目录和输出目录
+    job_id = uuid.uuid4().hex[:12]
+    upload_dir = Path('uploads') / job_id
+    filepath = upload_dir / secure_filename(filename)
+    
+    # 结果缓存键：PDF内容哈希 + 分割参数
+    # 缩小解码检测的子图边界可能与原尺寸检测略有不同，内存预算模式单独缓存
+    key_options = {}
+    if options['max_memory']:
+        key_options['memory_budget'] = True
+    if options['split_mode'] != 'grid':
+        key_options['split_mode'] = options['split_mode']
+    # 无损裁剪（内存预算模式下缩小解码的图片也会使用）的结果取决于 PyTurboJPEG 是否可用
+    engine = split_engine(options['lossless'] or bool(options['max_memory']))
+    if engine != 'decode':
+        key_options['jpeg_engine'] = engine
+    cache_key = result_key(pdf_hash, options['subimages_count'], key_options)
+    
+    job = Job(
+        str(filepath),
+        str(result_cache.partial_dir(cache_key, job_id)),
+        options['subimages_count'],
+        options['workers'],
+        options['priority'],
+        job_id=job_id,
+    )
+    job.cache_key = cache_key
+    job.max_memory = options['max_memory']
+    job.split_mode = options['split_mode']
+    job.lossless = options['lossless']
+    cached_dir = apply_cached_result(result_cache, cache_key, job.status)
+    if cached_dir is not None:
+        # 命中缓存的任务无需排队
+        job.output_dir = str(cached_dir)
+        job_store().add_finished(job, 'complete')
+        return job_id
+    
+    stored_path = pdf_store.lookup(pdf_hash)
+    if stored_path is None:
+        return None
+    upload_dir.mkdir(parents=True, exist_ok=True)
+    link_or_copy(stored_path, filepath)
+    # 提交任务，超出并发上限时排队等待
+    job_store().submit(job)
+    return job_id
 
-@app.route('/upload', methods=['POST'])
+@bp.route('/upload', methods=['POST'])
 def upload_file():
-    """处理文件上传"""
+    """处理文件上传（整个文件一次上传），大文件应使用分块上传接口"""
     try:
         if 'pdf' not in request.files:
             return jsonify({'error': '没有文件被上传'}), 400
@@ -194,158 +236,317 @@ def upload_file():
         file = request.files['pdf']
         if file.filename == '':
             return jsonify({'error': '没有选择文件'}), 400
-            
-        # 获取子图数量参数
-        subimages_count = request.form.get('subimages_count', '8')
+        
         try:
-            subimages_count = int(subimages_count)
-            if subimages_count <= 0:
-                raise ValueError("子图数量必须大于0")
+            options = parse_job_options(request.form)
         except ValueError as e:
-            return jsonify({'error': f'子图数量无效: {str(e)}'}), 400
+            return jsonify({'error': str(e)}), 400
             
         if file and allowed_file(file.filename):
-            # 确保上传目录存在
-            upload_dir = Path('uploads')
-            upload_dir.mkdir(exist_ok=True)
-            
-            # 保存文件
-            filename = secure_filename(file.filename)
-            filepath = upload_dir / filename
-            file.save(str(filepath))
-            
-            # 重置处理状态
-            processing_status['is_processing'] = True
-            processing_status['progress'] = 0
-            processing_status['status'] = '等待开始...'
-            processing_status['log'] = []
-            processing_status['extracted_images'] = []
-            processing_status['split_results'] = {}
+            # 保存文件，按内容哈希存入 pdf_store
+            temp_path = pdf_store.incoming_path(file.filename)
+            file.save(str(temp_path))
+            pdf_hash, _ = pdf_store.add(temp_path)
             
-            # 启动处理线程
-            processing_thread = threading.Thread(
-                target=process_pdf,
-                args=(str(filepath), 'output_images', subimages_count)
-            )
-            processing_thread.daemon = True  # 设置为守护线程
-            processing_thread.start()
-            
-            return jsonify({'message': '文件上传成功，开始处理'})
+            job_id = start_job(pdf_hash, file.filename, options)
+            if job_id is None:
+                # 保存的PDF在加入和创建任务之间被清理
+                return jsonify({'error': '上传的文件已被清理，请重新上传'}), 409
+            return jsonify({'message': '文件上传成功，开始处理', 'job_id': job_id})
         else:
             return jsonify({'error': '不支持的文件类型'}), 400
             
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/status')
-def status():
-    return jsonify(processing_status)
+@bp.route('/upload/check', methods=['POST'])
+def upload_check():
+    """上传前的预检：服务器已有该哈希的PDF（或其处理结果）时直接创建任务，无需上传
+    
+    表单字段：sha256、filename 以及与 /upload 相同的处理参数。
+    """
+    try:
+        options = parse_job_options(request.form)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    filename = request.form.get('filename', '')
+    if not allowed_file(filename):
+        return jsonify({'error': '不支持的文件类型'}), 400
+    
+    job_id = start_job(request.form.get('sha256', '').lower(), filename, options)
+    if job_id is None:
+        return jsonify({'exists': False})
+    return jsonify({'exists': True, 'message': '服务器已有该文件，开始处理', 'job_id': job_id})
+
+@bp.route('/upload/init', methods=['POST'])
+def upload_init():
+    """开始分块上传
+    
+    表单字段：filename、size、可选的 chunk_size 和整个文件的 sha256。
+    提供 sha256 时，相同文件再次开始上传会继续之前的会话，返回中的 missing 为还需上传的分块。
+    """
+    filename = request.form.get('filename', '')
+    if not allowed_file(filename):
+        return jsonify({'error': '不支持的文件类型'}), 400
+    try:
+        size = int(request.form.get('size', ''))
+        chunk_size = int(request.form.get('chunk_size', DEFAULT_CHUNK_SIZE))
+        sha256 = request.form.get('sha256', '').lower() or None
+        return jsonify(pdf_store.create_session(filename, size, chunk_size, sha256))
+    except (ValueError, UploadError) as e:
+        return jsonify({'error': f'上传参数无效: {str(e)}'}), 400
 
-@app.route('/output/<path:filename>')
-def download(filename):
-    """处理图片文件请求"""
+@bp.route('/upload/<upload_id>')
+def upload_status(upload_id):
+    """查询分块上传的进度，连接中断后据此只补传缺少的分块"""
     try:
-        # 解码URL编码的路径并替换斜杠
-        decoded_path = urllib.parse.unquote(filename).replace('/', os.sep)
-        # 构建完整的文件路径
-        file_path = Path('output_images') / decoded_path
-        
-        print(f"尝试访问文件: {file_path}")  # 调试日志
-        
-        if not file_path.exists():
-            print(f"文件不存在: {file_path}")
+        return jsonify(pdf_store.session_status(upload_id))
+    except UploadError as e:
+        return jsonify({'error': str(e)}), 404
+
+@bp.route('/upload/<upload_id>/<int:index>', methods=['PUT'])
+def upload_chunk(upload_id, index):
+    """上传一个分块，请求体为分块内容，X-Chunk-SHA256 头为分块的SHA-256（可选）"""
+    try:
+        received = pdf_store.write_chunk(upload_id, index, request.stream,
+                                         request.headers.get('X-Chunk-SHA256'))
+    except UploadError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'index': index, 'received': received})
+
+@bp.route('/upload/<upload_id>/complete', methods=['POST'])
+def upload_complete(upload_id):
+    """所有分块上传完成后校验文件并创建任务，表单字段为与 /upload 相同的处理参数"""
+    try:
+        options = parse_job_options(request.form)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        pdf_hash, _, filename = pdf_store.complete(upload_id)
+    except UploadError as e:
+        return jsonify({'error': str(e)}), 400
+    job_id = start_job(pdf_hash, filename, options)
+    if job_id is None:
+        # 合并后的PDF在完成上传和创建任务之间被清理
+        return jsonify({'error': '上传的文件已被清理，请重新上传'}), 409
+    return jsonify({'message': '文件上传成功，开始处理', 'job_id': job_id})
+
+def get_job_or_404(job_id, items=True):
+    """按ID获取任务，不存在时返回404响应
+    
+    Args:
+        items: 是否读取日志、提取图片和分割结果，只用到输出目录等概要信息时传 False
+    """
+    job = job_store().get(job_id, items)
+    if job is None:
+        return None, (jsonify({'error': '任务不存在'}), 404)
+    return job, None
+
+@bp.route('/jobs')
+def list_jobs():
+    """列出所有任务的概要信息"""
+    return jsonify([
+        {
+            'job_id': job.id,
+            'state': job.state,
+            'progress': job.status['progress'],
+            'pdf_name': Path(job.pdf_path).stem,
+            'priority': job.priority,
+            'created_at': job.created_at,
+        }
+        for job in job_store().list_jobs()
+    ])
+
+def read_cursor(name):
+    """读取增量状态请求中的游标参数，缺省或无效时为0"""
+    try:
+        return max(int(request.args.get(name, 0)), 0)
+    except ValueError:
+        return 0
+
+@bp.route('/status/<job_id>')
+def status(job_id):
+    """增量状态接口
+    
+    客户端通过 log、images、splits 三个游标参数告知已收到的条目数，
+    响应只包含之后新增的日志、提取图片和分割结果，并返回新的游标。
+    状态没有变化时根据 If-None-Match 返回 304。
+    """
+    cursors = {name: read_cursor(name) for name in ('log', 'images', 'splits')}
+    
+    # 只从任务存储中读取游标之后的条目，长度与条目来自同一时刻
+    job, items, lengths = job_store().get_delta(job_id, cursors)
+    if job is None:
+        return jsonify({'error': '任务不存在'}), 404
+    job_status = job.status
+    queue_position = job_store().queue_position(job_id)
+    
+    # ETag 由会变化的标量字段和各列表长度决定；客户端游标已追上且ETag一致时无需返回内容
+    etag = hashlib.sha1(repr((
+        job_id, job_status['state'], job_status['progress'], job_status['status'],
+        job_status['current_step'], queue_position, sorted(lengths.items()),
+        job_status.get('timings'),
+    )).encode('utf-8')).hexdigest()
+    if request.if_none_match.contains(etag) and cursors == lengths:
+        response = current_app.response_class(status=304)
+    else:
+        response = jsonify({
+            'job_id': job_id,
+            'state': job_status['state'],
+            'is_processing': job_status['is_processing'],
+            'progress': job_status['progress'],
+            'status': job_status['status'],
+            'current_step': job_status['current_step'],
+            'current_pdf_name': job_status['current_pdf_name'],
+            'queue_position': queue_position,
+            'timings': job_status.get('timings', {}),
+            'log': items['log'],
+            'extracted_images': items['images'],
+            'split_items': items['splits'],
+            'cursors': lengths,
+        })
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@bp.route('/metrics')
+def metrics():
+    """Prometheus 文本格式的运行指标：阶段耗时直方图、图片/子图/字节计数、队列深度和任务数
+    
+    处理在工作进程中进行，输出本进程的指标与各工作进程保存在任务存储中的快照之和。
+    """
+    states = {'queued': 0, 'running': 0, 'complete': 0, 'failed': 0, 'cancelled': 0}
+    for job in job_store().list_jobs():
+        states[job.state] = states.get(job.state, 0) + 1
+    for state, count in states.items():
+        JOBS.set(state, count)
+    return Response(REGISTRY.render(job_store().load_metrics()), mimetype='text/plain; version=0.0.4')
+
+@bp.route('/cancel/<job_id>', methods=['POST'])
+def cancel(job_id):
+    """取消排队中或运行中的任务"""
+    job, error = get_job_or_404(job_id, items=False)
+    if error:
+        return error
+    if not job_store().cancel(job_id):
+        return jsonify({'error': '任务已结束，无法取消'}), 409
+    return jsonify({'message': '任务已取消', 'job_id': job_id})
+
+def send_result_file(file_path, mimetype=None, immutable=False):
+    """发送结果目录中的文件
+    
+    支持 ETag/Last-Modified 条件请求（304）和 Range 请求。immutable 时允许浏览器长期缓存，
+    否则每次使用前向服务器验证。
+    应用配置了 OUTPUT_SENDFILE 时只返回响应头，由反向代理发送文件内容（见 create_app）。
+    
+    Args:
+        file_path: 文件解析后的绝对路径，调用方应已确认它在允许访问的目录中
+        mimetype: 内容类型，None 时按扩展名判断
+        immutable: 文件内容是否不会变化
+    """
+    if current_app.config['OUTPUT_SENDFILE'] == 'x-accel':
+        # X-Accel-Redirect 只能指向 nginx location 对应的 OUTPUT_ROOT 中的文件
+        output_root = current_app.config['OUTPUT_ROOT']
+        if output_root not in file_path.parents:
             return "File not found", 404
-            
-        # 获取文件所在目录和文件名
-        directory = str(file_path.parent.absolute())
-        basename = file_path.name
-        
-        print(f"发送文件: {directory} / {basename}")  # 调试日志
-        
-        # 使用send_from_directory发送文件
-        return send_from_directory(
-            directory,
-            basename,
-            as_attachment=False,
-            mimetype='image/jpeg'
-        )
-    except Exception as e:
-        print(f"提供文件时出错 {filename}: {str(e)}")
-        return str(e), 404
+        # nginx 对 internal location 自行处理条件请求和 Range 请求
+        rel_path = file_path.relative_to(output_root).as_posix()
+        response = current_app.response_class(
+            mimetype=mimetype or mimetypes.guess_type(file_path.name)[0] or 'application/octet-stream')
+        response.headers['X-Accel-Redirect'] = (
+            current_app.config['OUTPUT_ACCEL_PREFIX'].rstrip('/') + '/' + urllib.parse.quote(rel_path))
+    else:
+        # 'x-sendfile' 模式由 Flask 的 USE_X_SENDFILE 配置处理
+        response = send_file(file_path, mimetype=mimetype, conditional=True)
+    if immutable:
+        response.headers['Cache-Control'] = f'public, max-age={IMMUTABLE_MAX_AGE}, immutable'
+    else:
+        response.headers['Cache-Control'] = 'no-cache'
+    return response
 
-@app.route('/download_zip/<mode>')
-def download_zip(mode):
+@bp.route('/output/<job_id>/<path:filename>')
+def download(job_id, filename):
+    """返回结果图片
+    
+    URL带有与文件一致的内容版本号（?v=，见 result_cache.file_version）时允许浏览器长期缓存，
+    否则每次使用前用 ETag/Last-Modified 验证。
+    """
+    job, error = get_job_or_404(job_id, items=False)
+    if error:
+        return error
+    job_dir = Path(job.output_dir).resolve()
+    file_path = (job_dir / urllib.parse.unquote(filename)).resolve()
+    if job_dir not in file_path.parents or not file_path.is_file():
+        return "File not found", 404
+    
+    version = request.args.get('v')
+    return send_result_file(file_path, immutable=version is not None and version == file_version(file_path))
+
+@bp.route('/thumb/<job_id>/<int:size>/<path:filename>')
+def thumbnail(job_id, size, filename):
+    """返回结果图片的缩略图，缩略图内容不会变化，允许浏览器长期缓存"""
+    job, error = get_job_or_404(job_id, items=False)
+    if error:
+        return error
+    if size not in THUMB_SIZES:
+        return "Unsupported thumbnail size", 404
+    
+    job_dir = Path(job.output_dir).resolve()
+    file_path = (job_dir / urllib.parse.unquote(filename)).resolve()
+    if job_dir not in file_path.parents:
+        return "File not found", 404
+    
+    thumb_path = ensure_thumbnail(job_dir, file_path.relative_to(job_dir), size)
+    if thumb_path is None:
+        return "File not found", 404
+    return send_result_file(thumb_path.resolve(), mimetype='image/webp', immutable=True)
+
+@bp.route('/download_zip/<job_id>/<mode>')
+def download_zip(job_id, mode):
     """下载打包文件
     mode: 
         - chapter: 按章节打包(保持目录结构)
         - flat: 所有图片打包在同一目录
     """
     try:
+        job, error = get_job_or_404(job_id)
+        if error:
+            return error
+        status = job.status
+        
         # 检查是否有处理结果
-        if not processing_status.get('split_results'):
+        if not status.get('split_results'):
             return jsonify({'error': '没有可下载的文件'}), 404
             
         # 获取当前PDF名称
-        pdf_name = processing_status.get('current_pdf_name', '')
+        pdf_name = status.get('current_pdf_name', '')
         if not pdf_name:
             return jsonify({'error': '找不到PDF文件名'}), 404
             
         # 使用安全的文件名
         safe_name = "".join(x if x.isalnum() else '_' for x in pdf_name)
-        output_base_dir = Path('output_images')
+        output_base_dir = Path(job.output_dir).absolute()
         final_output = output_base_dir / safe_name
         
         if not final_output.exists():
             return jsonify({'error': '处理结果不存在'}), 404
             
-        # 创建临时ZIP文件
+        # 边打包边发送，不在磁盘上生成临时ZIP文件
         zip_filename = f"{safe_name}_results_{mode}.zip"
-        zip_path = output_base_dir / zip_filename
-        
-        # 确保输出目录存在
-        output_base_dir.mkdir(exist_ok=True)
-        
-        # 创建ZIP文件
-        with zipfile.ZipFile(zip_path, 'w') as zipf:
-            if mode == 'chapter':
-                # 按章节打包，保持目录结构
-                for root, _, files in os.walk(final_output):
-                    for file in files:
-                        file_path = Path(root) / file
-                        # 使用相对路径作为ZIP中的路径
-                        arcname = file_path.relative_to(final_output)
-                        zipf.write(file_path, arcname)
-            else:
-                # 所有图片打包在同一目录
-                for root, _, files in os.walk(final_output):
-                    for file in files:
-                        file_path = Path(root) / file
-                        # 使用目录名和文件名组合作为新文件名
-                        arcname = f"{Path(root).name}_{file}"
-                        zipf.write(file_path, arcname)
-        
-        # 发送文件
-        try:
-            return send_file(
-                zip_path,
-                as_attachment=True,
-                download_name=zip_filename,
-                mimetype='application/zip'
-            )
-        finally:
-            # 发送后删除临时ZIP文件
-            try:
-                if zip_path.exists():
-                    zip_path.unlink()
-            except Exception as e:
-                print(f"删除临时ZIP文件时出错: {e}")
+        return Response(
+            stream_with_context(timed_iter('zip', iter_zip(directory_entries(final_output, mode)), bytes_kind='zip')),
+            mimetype='application/zip',
+            headers={
+                'Content-Disposition': "attachment; filename*=UTF-8''" + urllib.parse.quote(zip_filename),
+            },
+        )
                 
     except Exception as e:
         print(f"创建ZIP文件时出错: {e}")
         return jsonify({'error': str(e)}), 500
 
 # 添加调试路由
-@app.route('/debug/files')
+@bp.route('/debug/files')
 def debug_files():
     """列出output_images目录中的所有文件"""
     try:
@@ -356,13 +557,13 @@ def debug_files():
                 files.append(str(file_path.relative_to(output_dir)))
         return jsonify({
             'files': files,
-            'status': processing_status
+            'jobs': {job.id: job.status for job in job_store().list_jobs(items=True)}
         })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 # 添加调试路由来检查分割结果
-@app.route('/debug/split_results')
+@bp.route('/debug/split_results')
 def debug_split_results():
     """查看分割结果的调试信息"""
     try:
@@ -374,23 +575,52 @@ def debug_split_results():
             split_files.append(str(file_path.relative_to(output_dir)))
         
         return jsonify({
-            'processing_status': processing_status,
             'split_files': split_files,
-            'split_results': processing_status.get('split_results', {})
+            'split_results': {job.id: job.status.get('split_results', {})
+                              for job in job_store().list_jobs(items=True)}
         })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 # 添加CORS支持
-@app.after_request
+@bp.after_app_request
 def after_request(response):
     response.headers.add('Access-Control-Allow-Origin', '*')
-    response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
+    response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization,X-Chunk-SHA256')
     response.headers.add('Access-Control-Allow-Methods', 'GET,PUT,POST,DELETE,OPTIONS')
     return response
 
+def create_app(db_path=JOB_DB_PATH, sendfile=None, accel_prefix=ACCEL_PREFIX, output_root=OUTPUT_ROOT):
+    """
+    创建Web应用，可以直接交给多进程的WSGI服务器，如
+    gunicorn -w 4 'main:create_app()'
+    
+    Web进程只接收上传、提交任务和查询状态，任务由 worker.py 启动的工作进程处理，
+    两者通过 db_path 处的任务存储共享任务队列和状态，可以分别扩展和重启。
+    
+    Args:
+        db_path: 任务存储（SQLite数据库）的路径
+        sendfile: 结果文件和缩略图的发送方式（见 SENDFILE_MODES）。'x-sendfile' 返回
+                  X-Sendfile 头和文件的绝对路径；'x-accel' 返回 X-Accel-Redirect 头，
+                  值为 accel_prefix 加上文件相对于 output_images 的路径，nginx 中需要配置如
+                  location /protected-output/ { internal; alias /path/to/output_images/; }
+        accel_prefix: 'x-accel' 模式下 nginx 的 internal location 前缀
+        output_root: 结果文件所在的根目录，创建应用时按当前工作目录解析为绝对路径，
+                     之后工作目录变化不影响 X-Accel-Redirect 的路径
+    """
+    if sendfile not in SENDFILE_MODES:
+        raise ValueError(f'不支持的文件发送方式: {sendfile}')
+    app = Flask(__name__)
+    app.config['OUTPUT_SENDFILE'] = sendfile
+    app.config['OUTPUT_ACCEL_PREFIX'] = accel_prefix
+    app.config['OUTPUT_ROOT'] = Path(output_root).resolve()
+    app.config['USE_X_SENDFILE'] = sendfile == 'x-sendfile'
+    app.extensions['job_store'] = JobStore(db_path)
+    app.register_blueprint(bp)
+    return app
+
 def main():
-    """主函数"""
+    """主函数：开发模式，单个Web进程并在本机启动工作进程"""
     # 设置工作目录
     setup_working_directory()
     
@@ -401,6 +631,9 @@ def main():
         # 确保目录有正确的权限
         path.chmod(0o755)
     
+    app = create_app()
+    worker_processes.extend(start_workers(MAX_CONCURRENT_JOBS))
+    
     # 注册信号处理
     signal.signal(signal.SIGINT, signal_handler)
     signal.signal(signal.SIGTERM, signal_handler)
@@ -0,0 +1,279 @@
+import threading
+import time
+from contextlib import contextmanager
+
+# 阶段耗时直方图的桶上限（秒）
+STAGE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _format_labels(label_name, label_value, extra=None):
+    labels = []
+    if label_name is not None:
+        labels.append((label_name, label_value))
+    if extra is not None:
+        labels.append(extra)
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{value}"' for name, value in labels) + '}'
+
+def _format_value(value):
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+class _Metric:
+    """带一个可选标签的指标，各标签值的数据分别统计"""
+
+    type_name = None
+
+    def __init__(self, name, help_text, label_name=None):
+        self.name = name
+        self.help_text = help_text
+        self.label_name = label_name
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def snapshot(self):
+        """返回各标签值的当前数据：[[标签值, 数据], ...]，可以JSON序列化"""
+        with self._lock:
+            return [[label_value, self._combine(None, value)] for label_value, value in self._values.items()]
+
+    @staticmethod
+    def _combine(total, value):
+        return value if total is None else total + value
+
+    def render(self, snapshots=()):
+        """
+        Args:
+            snapshots: 其他进程同一指标的 snapshot()，与本进程的数据相加后输出
+        """
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.type_name}"]
+        values = {label_value: value for label_value, value in self.snapshot()}
+        for snapshot in snapshots:
+            for label_value, value in snapshot:
+                values[label_value] = self._combine(values.get(label_value), value)
+        for label_value, value in sorted(values.items(), key=lambda item: str(item[0])):
+            lines.extend(self._render_value(label_value, value))
+        return lines
+
+    def _render_value(self, label_value, value):
+        return [f"{self.name}{_format_labels(self.label_name, label_value)} {_format_value(value)}"]
+
+class Counter(_Metric):
+    type_name = 'counter'
+
+    def inc(self, label_value=None, amount=1):
+        with self._lock:
+            self._values[label_value] = self._values.get(label_value, 0) + amount
+
+class Gauge(_Metric):
+    type_name = 'gauge'
+
+    def set(self, label_value=None, value=0):
+        with self._lock:
+            self._values[label_value] = value
+
+    def inc(self, label_value=None, amount=1):
+        with self._lock:
+            self._values[label_value] = self._values.get(label_value, 0) + amount
+
+    def dec(self, label_value=None, amount=1):
+        self.inc(label_value, -amount)
+
+class Histogram(_Metric):
+    type_name = 'histogram'
+
+    def __init__(self, name, help_text, label_name=None, buckets=STAGE_BUCKETS):
+        super().__init__(name, help_text, label_name)
+        self.buckets = tuple(buckets)
+
+    def observe(self, label_value, value):
+        with self._lock:
+            # [各桶计数..., 总次数, 总和]
+            data = self._values.setdefault(label_value, [0] * len(self.buckets) + [0, 0.0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    data[i] += 1
+            data[-2] += 1
+            data[-1] += value
+
+    @staticmethod
+    def _combine(total, data):
+        if total is None:
+            return list(data)
+        return [a + b for a, b in zip(total, data)]
+
+    def _render_value(self, label_value, data):
+        lines = []
+        for bound, count in zip(self.buckets, data):
+            labels = _format_labels(self.label_name, label_value, ('le', _format_value(bound)))
+            lines.append(f"{self.name}_bucket{labels} {count}")
+        labels = _format_labels(self.label_name, label_value, ('le', '+Inf'))
+        lines.append(f"{self.name}_bucket{labels} {data[-2]}")
+        labels = _format_labels(self.label_name, label_value)
+        lines.append(f"{self.name}_count{labels} {data[-2]}")
+        lines.append(f"{self.name}_sum{labels} {data[-1]!r}")
+        return lines
+
+class Registry:
+    """
+    进程内的指标集合，以 Prometheus 文本格式输出
+
+    处理任务的工作进程各有自己的指标，定期把 snapshot() 保存到任务存储中，
+    Web进程输出时把各进程的快照与本进程的指标相加（见 job_store.JobStore.save_metrics）。
+    """
+
+    def __init__(self):
+        self._metrics = []
+
+    def _register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help_text, label_name=None):
+        return self._register(Counter(name, help_text, label_name))
+
+    def gauge(self, name, help_text, label_name=None):
+        return self._register(Gauge(name, help_text, label_name))
+
+    def histogram(self, name, help_text, label_name=None, buckets=STAGE_BUCKETS):
+        return self._register(Histogram(name, help_text, label_name, buckets))
+
+    def snapshot(self):
+        """
+        Returns:
+            dict: 指标名 -> 该指标的 snapshot()，可以JSON序列化
+        """
+        return {metric.name: metric.snapshot() for metric in self._metrics}
+
+    def render(self, snapshots=()):
+        """
+        Args:
+            snapshots: 其他进程的 (snapshot(), 进程是否仍在运行) 序列。已退出的进程只计入
+                       计数器和直方图这些累计值，仪表盘（如队列深度）表示当前状态，不再计入
+        """
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render([
+                snapshot[metric.name] for snapshot, alive in snapshots
+                if metric.name in snapshot and (alive or metric.type_name != 'gauge')
+            ]))
+        return '\n'.join(lines) + '\n'
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    'pdf_stage_seconds', '各处理阶段单次操作的耗时（秒）', 'stage')
+IMAGES_TOTAL = REGISTRY.counter(
+    'pdf_images_total', '按结果统计的图片数（extracted、split、skipped、error）', 'result')
+TILES_TOTAL = REGISTRY.counter(
+    'pdf_tiles_total', '写入的子图数')
+BYTES_TOTAL = REGISTRY.counter(
+    'pdf_bytes_total', '按类型统计的字节数（extracted 提取的图片、zip 下载的压缩包）', 'kind')
+QUEUE_DEPTH = REGISTRY.gauge(
+    'pdf_pipeline_queue_depth', '流水线各阶段队列中等待的图片数', 'queue')
+JOBS = REGISTRY.gauge(
+    'pdf_jobs', '各状态的任务数', 'state')
+
+class StageTimings:
+    """
+    一个任务（或一次命令行调用）各阶段的耗时明细，线程安全
+
+    保存每次操作的耗时，可以在进程之间传递：分片进程返回自己的明细，
+    主进程合并后再计入本进程的直方图。各阶段另外保存累计的 [次数, 总耗时]，
+    summary() 的开销与已记录的次数无关，可以在每张图片完成时调用。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._samples = {}
+        self._totals = {}
+
+    def __getstate__(self):
+        with self._lock:
+            return {'samples': {stage: list(values) for stage, values in self._samples.items()}}
+
+    def __setstate__(self, state):
+        self._lock = threading.Lock()
+        self._samples = state['samples']
+        self._totals = {stage: [len(values), sum(values)] for stage, values in self._samples.items()}
+
+    def add(self, stage, seconds):
+        with self._lock:
+            self._samples.setdefault(stage, []).append(seconds)
+            totals = self._totals.setdefault(stage, [0, 0.0])
+            totals[0] += 1
+            totals[1] += seconds
+
+    def merge(self, other, observe=True):
+        """
+        合并另一份明细（通常来自分片进程）
+
+        Args:
+            observe: 是否同时计入本进程的阶段耗时直方图
+        """
+        for stage, values in other.__getstate__()['samples'].items():
+            with self._lock:
+                self._samples.setdefault(stage, []).extend(values)
+                totals = self._totals.setdefault(stage, [0, 0.0])
+                totals[0] += len(values)
+                totals[1] += sum(values)
+            if observe:
+                for value in values:
+                    STAGE_SECONDS.observe(stage, value)
+
+    def summary(self):
+        """
+        Returns:
+            dict: 阶段 -> {'seconds': 总耗时, 'count': 次数}，按总耗时从大到小排列
+        """
+        with self._lock:
+            totals = [(stage, seconds, count) for stage, (count, seconds) in self._totals.items()]
+        totals.sort(key=lambda item: item[1], reverse=True)
+        return {stage: {'seconds': round(seconds, 4), 'count': count} for stage, seconds, count in totals}
+
+    def format(self):
+        """返回可打印的耗时明细表"""
+        summary = self.summary()
+        total = sum(item['seconds'] for item in summary.values()) or 1
+        lines = [f"{'阶段':<22} {'次数':>8} {'总耗时(s)':>11} {'平均(ms)':>10} {'占比':>7}"]
+        for stage, item in summary.items():
+            average = item['seconds'] / item['count'] * 1000 if item['count'] else 0
+            lines.append(f"{stage:<22} {item['count']:>8} {item['seconds']:>11.3f} "
+                         f"{average:>10.2f} {item['seconds'] / total:>7.1%}")
+        return '\n'.join(lines)
+
+@contextmanager
+def timed(stage, timings=None):
+    """记录代码块的耗时：计入阶段直方图，提供 timings 时同时计入该任务的明细"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(stage, elapsed)
+        if timings is not None:
+            timings.add(stage, elapsed)
+
+def timed_iter(stage, iterable, timings=None, bytes_kind=None):
+    """
+    逐项转发可迭代对象，只统计生成各项所花的时间（不含消费方的时间，如网络发送）
+
+    Args:
+        bytes_kind: 提供时把每项的长度计入 BYTES_TOTAL 的该类型
+    """
+    elapsed = 0.0
+    iterator = iter(iterable)
+    try:
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                break
+            finally:
+                elapsed += time.perf_counter() - start
+            if bytes_kind is not None:
+                BYTES_TOTAL.inc(bytes_kind, len(item))
+            yield item
+    finally:
+        STAGE_SECONDS.observe(stage, elapsed)
+        if timings is not None:
+            timings.add(stage, elapsed)
@@ -0,0 +1,274 @@
+import os
+import queue
+import threading
+from pathlib import Path
+
+from split_subimages import JPEG_EXTENSIONS, load_image, load_image_reduced, split_image, split_jpeg, save_subimages
+from thumbnails import save_thumbnails
+from split_pool import SplitPool, preview_tiles
+from metrics import BYTES_TOTAL, IMAGES_TOTAL, QUEUE_DEPTH, TILES_TOTAL, timed
+
+# 分割阶段的线程数（OpenCV 在解码、轮廓和编码时会释放GIL）
+SPLIT_WORKERS = min(4, os.cpu_count() or 1)
+# 编码/写入阶段的线程数
+WRITE_WORKERS = 2
+# 阶段之间队列的容量，限制同时驻留内存的图片数量
+QUEUE_SIZE = 8
+
+# 估算一张图片在流水线中占用的内存时每像素的字节数：
+# 解码后的BGR数组、灰度图和掩码，以及子图的编码缓冲
+BYTES_PER_PIXEL = 6
+
+# 内存预算模式下每处理这么多页释放一次 MuPDF 的对象缓存
+PAGE_WINDOW = 16
+
+# 队列结束标记
+_DONE = object()
+
+class MemoryBudget:
+    """
+    按估算的字节数限制流水线中同时处理的图片
+
+    提取阶段在读取下一张图片前申请额度，图片写入完成（或被跳过、出错）后归还。
+    单张图片的估算超过总额度时按总额度计，且只有在没有其他图片占用额度时才放行，
+    保证超大图片也能依次处理而不会永久阻塞。
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.in_use = 0
+        self._condition = threading.Condition()
+
+    def acquire(self, amount, stop_event=None):
+        """
+        阻塞直到有足够额度
+
+        Returns:
+            int: 实际占用的额度，需原样传给 release；stop_event 被设置时返回0
+        """
+        amount = min(amount, self.limit)
+        with self._condition:
+            while self.in_use and self.in_use + amount > self.limit:
+                if stop_event is not None and stop_event.is_set():
+                    return 0
+                self._condition.wait(0.1)
+            self.in_use += amount
+        return amount
+
+    def release(self, amount):
+        with self._condition:
+            self.in_use -= amount
+            self._condition.notify_all()
+
+def estimate_image_bytes(record):
+    """按记录中的宽高估算处理一张图片需要的内存，没有尺寸时按编码字节数粗略估计"""
+    if record.get('width') and record.get('height'):
+        return record['width'] * record['height'] * BYTES_PER_PIXEL
+    return len(record['image'] or b'') * 10
+
+def run_pipeline(records, subimages_count, output_dir_for, extract_dir=None,
+                 split_workers=SPLIT_WORKERS, write_workers=WRITE_WORKERS,
+                 queue_size=QUEUE_SIZE, on_event=None, stop_event=None, thumb_root=None, timings=None,
+                 max_memory=None, split_mode='grid', split_processes=0, lossless=False):
+    """
+    以流水线方式执行 提取→分割→编码写入 三个阶段
+
+    提取线程从 records 中读取图片，分割线程池解码并切分子图，
+    编码线程将子图写成JPEG。开启 lossless（画质选项）时JPEG图片的子图尽量在DCT域无损裁剪，
+    写入阶段直接保存裁剪结果，保留原图画质。阶段之间使用有界队列连接，
+    三个阶段同时进行，队列容量限制了峰值内存。
+
+    Args:
+        records: 图片记录的可迭代对象（如 iter_images_from_pdf 的返回值），
+                 重复图片（duplicate_of 不为 None）会被跳过
+        subimages_count: 要分割的子图数量
+        output_dir_for: 函数，根据图片记录返回该图片子图的输出目录
+        extract_dir: 若提供，提取阶段会把原始图片字节保存到该目录
+        split_workers: 分割线程数
+        write_workers: 编码写入线程数
+        queue_size: 每个阶段队列的容量
+        on_event: 回调 on_event(stage, record, payload)，每张图片完成一个阶段时调用，stage 为
+                  'extracted'、'split'（payload 为子图数量）、'written'（payload 为子图路径列表）、
+                  'skipped'（不符合分割要求）或 'error'（payload 为错误信息）
+        stop_event: 可选的 threading.Event，设置后各阶段尽快停止
+        thumb_root: 若提供，分割阶段为提取的图片、写入阶段为每个子图生成缩略图，
+                    保存在该目录下（extract_dir 和子图输出目录都应位于其中）
+        timings: 可选的 StageTimings，记录 save_extracted、decode、split、write、thumbnail 各阶段的耗时
+        max_memory: 可选的内存预算（字节）。提供时按图片尺寸估算的内存限制同时处理的图片，
+                    像素数超过单个分割线程份额的JPEG缩小解码后检测子图边界，
+                    再在原图上无损裁剪，不生成原尺寸的数组
+        split_mode: 分割方式，见 split_subimages.split_image；只有 grid 方式会无损裁剪JPEG
+        lossless: 画质选项，原尺寸解码的JPEG是否也在DCT域无损裁剪（见 split_subimages.process_image），
+                  通常比默认的解码分割后重新编码更慢
+        split_processes: 大于0时在该数量的进程中计算白边、分隔并编码子图（见 split_pool.SplitPool），
+                         解码后的图片经共享内存传给子进程；分割线程数不少于进程数
+
+    Returns:
+        dict: 各阶段完成的数量 extracted、split、written、skipped、errors
+
+    Raises:
+        读取 records 时（如PDF损坏）抛出的异常，在已读取的图片全部处理完、各阶段结束后重新抛出
+    """
+    split_queue = queue.Queue(maxsize=queue_size)
+    write_queue = queue.Queue(maxsize=queue_size)
+    if stop_event is None:
+        stop_event = threading.Event()
+
+    stats = {'extracted': 0, 'split': 0, 'written': 0, 'skipped': 0, 'errors': 0}
+    stats_lock = threading.Lock()
+    budget = MemoryBudget(max_memory) if max_memory else None
+    pool = SplitPool(split_processes) if split_processes else None
+    split_workers = max(split_workers, split_processes)
+    # 每张图片占用的额度：图片名 -> 字节数
+    reserved = {}
+    # 提取阶段读取 records 时的异常，只有一个提取线程
+    produce_errors = []
+    # 单个分割线程解码时允许的最大像素数
+    max_pixels = max_memory // (split_workers * BYTES_PER_PIXEL) if max_memory else None
+
+    def relative_to_root(path):
+        return Path(path).resolve().relative_to(Path(thumb_root).resolve())
+
+    def release(record):
+        if budget is not None and record is not None:
+            with stats_lock:
+                amount = reserved.pop(record['name'], 0)
+            budget.release(amount)
+
+    def emit(stage, record, payload=None):
+        if stage in ('written', 'skipped', 'error'):
+            release(record)
+        with stats_lock:
+            stats['errors' if stage == 'error' else stage] += 1
+        if stage == 'written':
+            TILES_TOTAL.inc(amount=len(payload))
+        else:
+            IMAGES_TOTAL.inc(stage)
+        if on_event is not None:
+            on_event(stage, record, payload)
+
+    def produce():
+        try:
+            for record in records:
+                if stop_event.is_set():
+                    break
+                if record['duplicate_of'] is not None:
+                    continue
+                if budget is not None:
+                    amount = budget.acquire(estimate_image_bytes(record), stop_event)
+                    with stats_lock:
+                        reserved[record['name']] = amount
+                if extract_dir is not None:
+                    with timed('save_extracted', timings), open(Path(extract_dir) / record['name'], "wb") as image_file:
+                        image_file.write(record['image'])
+                BYTES_TOTAL.inc('extracted', len(record['image']))
+                emit('extracted', record)
+                split_queue.put(record)
+                QUEUE_DEPTH.inc('split')
+        except Exception as e:
+            produce_errors.append(e)
+
+    def split():
+        while True:
+            record = split_queue.get()
+            if record is _DONE:
+                break
+            QUEUE_DEPTH.dec('split')
+            if stop_event.is_set():
+                release(record)
+                continue
+            try:
+                source = record['array'] if record.get('array') is not None else record['image']
+                scale = 1
+                with timed('decode', timings):
+                    if max_pixels is not None and split_mode == 'grid' and record['ext'] in JPEG_EXTENSIONS:
+                        img, scale = load_image_reduced(source, max_pixels)
+                    else:
+                        img = load_image(source)
+                if scale > 1:
+                    # 缩小解码的结果只用于检测边界，原图在DCT域无损裁剪
+                    with timed('split', timings):
+                        cropped = split_jpeg(record['image'], img, subimages_count, scale) if img is not None else None
+                    if cropped is None:
+                        # 无法无损裁剪时退回按原尺寸解码
+                        with timed('decode', timings):
+                            img = load_image(source)
+                        scale = 1
+                if img is not None and thumb_root is not None and extract_dir is not None:
+                    # 图片已经解码，顺便生成提取图片的缩略图
+                    with timed('thumbnail', timings):
+                        save_thumbnails(img, thumb_root, relative_to_root(Path(extract_dir) / record['name']))
+                with timed('split', timings):
+                    if scale == 1:
+                        cropped = None
+                        if (lossless and img is not None and split_mode == 'grid'
+                                and record['ext'] in JPEG_EXTENSIONS and record.get('image') is not None):
+                            cropped = split_jpeg(record['image'], img, subimages_count)
+                    if cropped is not None:
+                        subimages, previews = cropped
+                    elif pool is not None and img is not None:
+                        # 子进程返回编码后的子图，缩略图按返回的区域在本进程中合成
+                        result = pool.split(img, subimages_count, split_mode)
+                        subimages, previews = None, None
+                        if result is not None:
+                            subimages, regions = result
+                            previews = preview_tiles(img, regions) if thumb_root is not None else subimages
+                    else:
+                        subimages = (split_image(img, subimages_count, record['name'], mode=split_mode)
+                                     if img is not None else None)
+                        previews = subimages
+                if subimages is None:
+                    emit('skipped', record)
+                else:
+                    emit('split', record, len(subimages))
+                    write_queue.put((record, subimages, previews))
+                    QUEUE_DEPTH.inc('write')
+            except Exception as e:
+                emit('error', record, str(e))
+
+    def write():
+        while True:
+            item = write_queue.get()
+            if item is _DONE:
+                break
+            QUEUE_DEPTH.dec('write')
+            if stop_event.is_set():
+                release(item[0])
+                continue
+            # previews 为子图的ndarray，无损裁剪时 subimages 是JPEG字节，缩略图从 previews 生成
+            record, subimages, previews = item
+            try:
+                output_dir = Path(output_dir_for(record))
+                output_dir.mkdir(parents=True, exist_ok=True)
+                with timed('write', timings):
+                    output_paths = save_subimages(subimages, str(output_dir))
+                if thumb_root is not None:
+                    with timed('thumbnail', timings):
+                        for sub_img, output_path in zip(previews, output_paths):
+                            save_thumbnails(sub_img, thumb_root, relative_to_root(output_path))
+                emit('written', record, output_paths)
+            except Exception as e:
+                emit('error', record, str(e))
+
+    producer = threading.Thread(target=produce, daemon=True)
+    splitters = [threading.Thread(target=split, daemon=True) for _ in range(split_workers)]
+    writers = [threading.Thread(target=write, daemon=True) for _ in range(write_workers)]
+    for thread in [producer] + splitters + writers:
+        thread.start()
+
+    # 按阶段依次结束：上游全部完成后再向下游发送结束标记
+    producer.join()
+    for _ in splitters:
+        split_queue.put(_DONE)
+    for thread in splitters:
+        thread.join()
+    if pool is not None:
+        pool.close()
+    for _ in writers:
+        write_queue.put(_DONE)
+    for thread in writers:
+        thread.join()
+
+    if produce_errors:
+        raise produce_errors[0]
+    return stats
@@ -0,0 +1,113 @@
+import io
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+from split_subimages import grid_shape
+
+# 短边小于该值的图片视为图标、装饰等，不做处理
+MIN_IMAGE_SIZE = 100
+
+# 长边与短边之比超过该值的图片视为分隔线、页眉装饰条等
+MAX_ASPECT_RATIO = 8
+
+# 网格分割后每个子图的最小边长（与 check_8_subimages 的要求一致）
+MIN_CELL_SIZE = 100
+
+class ImageScreen:
+    """
+    只根据图片尺寸等元数据判断图片是否值得处理，不解码任何像素
+
+    PDF中的图片使用 page.get_images() 给出的宽、高、位深和颜色空间，
+    图片文件只读取文件头中的尺寸。规则依次为：
+    蒙版图片、过小的图片、长宽比过大的图片、不能均匀分割为网格的图片、自定义规则。
+    实例只包含普通属性，可以传给进程池中的分片任务。
+    """
+
+    def __init__(self, subimages_count=None, min_size=MIN_IMAGE_SIZE, max_aspect=MAX_ASPECT_RATIO,
+                 min_cell_size=MIN_CELL_SIZE, predicate=None):
+        """
+        Args:
+            subimages_count: 要分割的子图数量，提供时拒绝不能均匀分割或子图过小的图片；
+                             None 表示不检查网格（例如按轮廓分割时）
+            min_size: 图片短边的最小像素数，0 表示不限制
+            max_aspect: 长边与短边之比的上限，None 表示不限制
+            min_cell_size: 网格分割后子图边长的最小像素数
+            predicate: 可选的自定义规则 predicate(width, height)，返回 False 表示拒绝，
+                       需要传给进程池时应为模块级函数
+        """
+        self.subimages_count = subimages_count
+        self.min_size = min_size
+        self.max_aspect = max_aspect
+        self.min_cell_size = min_cell_size
+        self.predicate = predicate
+
+    def params(self):
+        """返回筛选规则的参数，用于记录在批处理清单中"""
+        return {
+            'subimages_count': self.subimages_count,
+            'min_size': self.min_size,
+            'max_aspect': self.max_aspect,
+            'min_cell_size': self.min_cell_size,
+            'predicate': getattr(self.predicate, '__qualname__', None),
+        }
+
+    def check(self, width, height, bpc=8, colorspace=None):
+        """
+        按尺寸等元数据检查一张图片
+
+        Returns:
+            str: 拒绝的原因，图片可以处理时返回None
+        """
+        # 1位且没有颜色空间的是模板蒙版（ImageMask），不是独立的图片
+        if bpc == 1 and colorspace == '':
+            return '蒙版'
+        if min(width, height) < self.min_size:
+            return '尺寸过小'
+        if self.max_aspect and max(width, height) > self.max_aspect * min(width, height):
+            return '长宽比过大'
+        if self.subimages_count:
+            num_rows, num_cols = grid_shape(self.subimages_count)
+            if height % num_rows != 0 or width % num_cols != 0:
+                return '不能均匀分割'
+            if height // num_rows < self.min_cell_size or width // num_cols < self.min_cell_size:
+                return '子图过小'
+        if self.predicate is not None and not self.predicate(width, height):
+            return '不符合自定义规则'
+        return None
+
+    def check_pdf_image(self, image_info):
+        """检查 page.get_images() 返回的一项 (xref, smask, width, height, bpc, colorspace, ...)"""
+        return self.check(image_info[2], image_info[3], image_info[4], image_info[5])
+
+    def check_source(self, source):
+        """
+        检查图片文件、已编码的图片字节或已解码的ndarray，文件和字节只读取文件头
+
+        Returns:
+            str: 拒绝的原因，图片可以处理时返回None；无法识别的图片交给后续解码处理
+        """
+        size = image_size(source)
+        if size is None:
+            return None
+        return self.check(*size)
+
+def image_size(source):
+    """
+    只读取文件头获取图片尺寸，不解码像素
+
+    Returns:
+        (宽, 高)，无法识别时返回None
+    """
+    if isinstance(source, np.ndarray):
+        return source.shape[1], source.shape[0]
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(source)
+    elif isinstance(source, Path):
+        source = str(source)
+    try:
+        with Image.open(source) as img:
+            return img.size
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return None
@@ -0,0 +1,216 @@
+import os
+from pathlib import Path
+import shutil
+
+from extract_images import iter_images_from_pdf, count_images_in_pdf
+from pipeline import PAGE_WINDOW, run_pipeline
+from prescreen import ImageScreen
+from metrics import StageTimings, timed
+from jobs import new_status
+from result_cache import file_version
+
+# 提取图片时按页分片的默认进程数（页数较少的PDF不会分片）
+EXTRACT_WORKERS = os.cpu_count() or 1
+
+# 分割阶段的进程数，单核机器上只用线程，不启动进程池
+SPLIT_PROCESSES = EXTRACT_WORKERS if EXTRACT_WORKERS > 1 else 0
+
+# 处理结果缓存目录及其磁盘配额（字节）
+CACHE_DIR = Path('output_images') / 'cache'
+CACHE_MAX_BYTES = 2 * 1024 ** 3
+
+# 上传的PDF按内容哈希保存的目录及其磁盘配额（字节），相同的PDF无需再次上传
+PDF_STORE_DIR = Path('output_images') / 'pdf_store'
+PDF_STORE_MAX_BYTES = 5 * 1024 ** 3
+# 分块上传的单个PDF大小上限（字节）
+PDF_MAX_FILE_BYTES = 2 * 1024 ** 3
+
+# 任务队列和任务状态的存储（SQLite），Web进程和工作进程共用
+JOB_DB_PATH = Path('output_images') / 'jobs.sqlite3'
+
+# 缓存条目中保存的状态字段，命中缓存时直接恢复
+CACHED_STATUS_KEYS = ('current_pdf_name', 'extracted_images', 'split_results', 'split_items')
+
+def process_pdf(pdf_path, output_dir, subimages_count=8, workers=EXTRACT_WORKERS,
+                status=None, stop_event=None, prescreen=True, max_memory=None, split_mode='grid',
+                split_processes=SPLIT_PROCESSES, lossless=False):
+    """处理PDF文件的后台任务
+    
+    Args:
+        pdf_path: PDF文件路径
+        output_dir: 该任务独立的输出目录
+        subimages_count: 每张图片要分割的子图数量
+        workers: 提取图片时按页分片并行的进程数，设置了 max_memory 时固定为1
+        status: 该任务的状态字典（见 jobs.new_status），处理过程中实时更新
+        stop_event: 可选的 threading.Event，设置后尽快停止处理
+        prescreen: 是否在提取前按图片元数据跳过图标、蒙版和不能分割为 subimages_count 个子图的图片
+        max_memory: 可选的内存预算（字节），提供时按页窗口释放PDF缓存、
+                    限制同时处理的图片并缩小解码超大图片（见 run_pipeline）
+        split_mode: 分割方式，'grid' 按网格均匀分割，'profile' 按空白投影寻找分隔，
+                    后者不要求图片能被均匀分割
+        split_processes: 分割阶段的进程数，0 表示只在线程中分割（见 run_pipeline）
+        lossless: 画质选项，JPEG图片是否在DCT域无损裁剪子图以保留原图画质，通常更慢（见 run_pipeline）
+
+    Returns:
+        dict: 各阶段完成的数量，见 run_pipeline；读取PDF出错时抛出异常
+    """
+    if status is None:
+        status = new_status(subimages_count)
+    status['subimages_count'] = subimages_count  # 保存子图数量设置
+    
+    pdf_name = Path(pdf_path).stem
+    # 保存当前PDF名称用于后续处理
+    status['current_pdf_name'] = pdf_name
+    
+    output_base_dir = Path(output_dir)
+    output_base_dir.mkdir(parents=True, exist_ok=True)
+    
+    # 使用安全的目录名 - 只保留字母数字和下划线
+    safe_name = "".join(x if x.isalnum() else '_' for x in pdf_name)
+    temp_dir = output_base_dir / f"temp_{safe_name}"
+    temp_dir.mkdir(exist_ok=True)
+    
+    final_output = output_base_dir / safe_name
+    if final_output.exists():
+        shutil.rmtree(str(final_output))
+    final_output.mkdir(parents=True)
+    
+    # 提取、分割、编码写入三个阶段以流水线方式同时进行
+    status['current_step'] = 'extracting'
+    status['status'] = "正在提取并分割图片..."
+    status['progress'] = 5
+    status['log'].append(f"开始处理PDF: {pdf_name}")
+    
+    # 只读取页面图片列表来估算总数，用于计算进度
+    # 各阶段的耗时明细，随状态一起返回给客户端
+    timings = StageTimings()
+    # 按空白投影分割时不要求图片能被均匀分割，预筛选只检查尺寸和长宽比
+    screen = ImageScreen(subimages_count if split_mode == 'grid' else None) if prescreen else None
+    with timed('count', timings):
+        total_images, all_images = count_images_in_pdf(pdf_path, screen=screen)
+    screened_out = all_images - total_images
+    if screened_out:
+        status['log'].append(f"预筛选跳过 {screened_out} 张图标、蒙版或不能分割的图片")
+    total_images = max(total_images, 1)
+    extracted_images = []
+    status['extracted_images'] = extracted_images
+    split_results = {}
+    # 按完成顺序追加的分割结果，index 为对应图片的提取顺序
+    split_items = []
+    status['split_items'] = split_items
+    extract_order = {}
+    stage_counts = {'extracted': 0, 'split': 0, 'written': 0}
+    
+    def split_dir_name(record):
+        return f"split_{record['name'].rsplit('.', 1)[0]}"
+    
+    def on_event(stage, record, payload):
+        name = record['name'] if record is not None else pdf_name
+        if stage == 'extracted':
+            stage_counts['extracted'] += 1
+            extract_order[name] = len(extracted_images)
+            extracted_images.append({
+                # 使用os.path.join来确保正确的路径分隔符
+                'path': os.path.join(f"temp_{safe_name}", name),
+                'name': name,
+                # 内容版本号，客户端用于可长期缓存的URL
+                'version': file_version(record['image']),
+            })
+        elif stage == 'split':
+            stage_counts['split'] += 1
+            status['current_step'] = 'splitting'
+        elif stage == 'written':
+            stage_counts['written'] += 1
+            split_results[name] = [
+                os.path.join(safe_name, split_dir_name(record), Path(path).name)
+                for path in payload
+            ]
+            # 复制一份，避免 /status 序列化时字典被其他线程修改
+            status['split_results'] = dict(split_results)
+            split_items.append({
+                'name': name,
+                'index': extract_order[name],
+                'subimages': sorted(split_results[name]),
+                'versions': {
+                    rel_path: file_version(path)
+                    for rel_path, path in zip(split_results[name], payload)
+                },
+            })
+            status['log'].append(f"成功从 {name} 提取了 {len(payload)} 个子图")
+        elif stage == 'skipped':
+            # 不符合分割要求的图片同时完成了分割和写入两个阶段
+            stage_counts['split'] += 1
+            stage_counts['written'] += 1
+            status['log'].append(f"跳过 {name} - 不符合分割要求")
+        elif stage == 'error':
+            stage_counts['split'] += 1
+            stage_counts['written'] += 1
+            status['log'].append(f"处理 {name} 时发生错误: {payload}")
+            print(f"处理 {name} 时发生错误: {payload}")  # 控制台日志
+    
+        # 进度按每张图片完成的阶段数计算
+        finished = sum(stage_counts.values())
+        status['progress'] = min(99, 5 + 94 * finished // (3 * total_images))
+        status['timings'] = timings.summary()
+    
+    if max_memory:
+        # 分片进程按整段页面返回图片字节并预取多个分片，这部分内存不受预算限制，
+        # 有预算时在当前进程中逐张读取，每张图片都先申请额度
+        workers = 1
+    stats = run_pipeline(
+        iter_images_from_pdf(pdf_path, workers=workers, screen=screen, timings=timings,
+                             page_window=PAGE_WINDOW if max_memory else None),
+        subimages_count,
+        lambda record: final_output / split_dir_name(record),
+        extract_dir=temp_dir,
+        on_event=on_event,
+        stop_event=stop_event,
+        thumb_root=output_base_dir,
+        timings=timings,
+        max_memory=max_memory,
+        split_mode=split_mode,
+        split_processes=split_processes,
+        lossless=lossless,
+    )
+    status['timings'] = timings.summary()
+    
+    if stop_event is not None and stop_event.is_set():
+        # 任务被取消，保留已完成的部分结果
+        status['split_results'] = dict(split_results)
+        return stats
+    
+    # 流水线中各图片完成顺序不固定，最后按提取顺序整理结果
+    status['split_results'] = {
+        img_info['name']: sorted(split_results[img_info['name']])
+        for img_info in extracted_images
+        if img_info['name'] in split_results
+    }
+    status['log'].append(f"已提取 {stats['extracted']} 张图片")
+    total_split = sum(len(subimages) for subimages in split_results.values())
+    status['log'].append(f"分割完成: 共提取 {total_split} 个子图")
+    
+    status['progress'] = 100
+    status['status'] = "处理完成！"
+    status['log'].append("所有处理已完成！")
+    status['current_step'] = 'complete'
+    return stats
+
+def cache_manifest(status):
+    """从处理完成的状态中取出需要缓存的字段"""
+    return {key: status[key] for key in CACHED_STATUS_KEYS}
+
+def apply_cached_result(cache, cache_key, status):
+    """缓存中已有相同PDF和参数的结果时，直接填充处理状态
+    
+    Returns:
+        缓存条目目录，未命中时返回None
+    """
+    manifest = cache.lookup(cache_key)
+    if manifest is None:
+        return None
+    status.update(manifest)
+    status['progress'] = 100
+    status['status'] = "处理完成！"
+    status['current_step'] = 'complete'
+    status['log'].append("该PDF已处理过，直接使用缓存的结果")
+    return cache.entry_dir(cache_key)
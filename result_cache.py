@@ -0,0 +1,251 @@
+import functools
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+
+from batch_manifest import file_sha256
+from split_subimages import SPLITTER_VERSION
+
+try:
+    import fcntl
+except ImportError:
+    # 没有 fcntl（如Windows）时只能标记本进程正在使用的目录
+    fcntl = None
+
+# 默认磁盘配额（字节），超出后按最近最少使用顺序淘汰
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+
+# 缓存条目中记录处理结果的清单文件
+MANIFEST_NAME = 'manifest.json'
+
+# 结果文件内容版本号的长度（SHA-256 十六进制的前缀）
+VERSION_LENGTH = 16
+
+# 目录中的锁文件：使用目录的进程持有共享锁，淘汰时只有取得排他锁才删除目录
+PIN_NAME = '.pin'
+
+# 新建的 partial 目录在这段时间（秒）内不会被淘汰，覆盖创建目录到加锁之间的间隙
+PARTIAL_GRACE = 60
+
+def result_key(pdf_hash, subimages_count, options=None):
+    """
+    由PDF内容哈希、子图数量、分割器版本和其他分割选项生成缓存键
+
+    Args:
+        pdf_hash: PDF文件内容的SHA-256
+        subimages_count: 子图数量
+        options: 其他会影响结果的选项（可JSON序列化的字典）
+    """
+    params = {
+        'pdf': pdf_hash,
+        'subimages_count': subimages_count,
+        'splitter': SPLITTER_VERSION,
+        'options': options or {},
+    }
+    return hashlib.sha256(json.dumps(params, sort_keys=True).encode('utf-8')).hexdigest()
+
+def file_version(source):
+    """
+    返回结果文件内容的版本号，放在URL中（?v=）时该URL的内容不会变化，允许浏览器长期缓存
+
+    Args:
+        source: 文件路径，或已在内存中的文件内容（字节）
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return hashlib.sha256(source).hexdigest()[:VERSION_LENGTH]
+    stat = os.stat(source)
+    return _path_version(str(source), stat.st_size, stat.st_mtime_ns)
+
+@functools.lru_cache(maxsize=4096)
+def _path_version(path, size, mtime_ns):
+    # 文件大小或修改时间变化时重新计算
+    return file_sha256(path)[:VERSION_LENGTH]
+
+def _dir_size(path):
+    total = 0
+    for dir_path, _, file_names in os.walk(path):
+        for file_name in file_names:
+            try:
+                total += os.stat(os.path.join(dir_path, file_name)).st_size
+            except OSError:
+                pass
+    return total
+
+class ResultCache:
+    """
+    内容寻址的处理结果缓存
+
+    每个条目是 root 下以缓存键命名的目录，包含处理结果文件和清单文件。
+    处理中的结果写在 partial 目录中，完成后整体重命名为正式条目。
+    条目总大小超过 max_bytes 时按最近使用时间淘汰，正在使用的条目不会被淘汰。
+
+    多个工作进程和 Streamlit 应用共用同一个缓存目录，各自创建 ResultCache。
+    pin() 对目录中的锁文件加共享锁（flock），evict() 只删除能取得排他锁的目录，
+    因此其他进程正在使用的目录也不会被删除；进程退出后锁自动释放。
+    """
+
+    def __init__(self, root, max_bytes=DEFAULT_MAX_BYTES):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # 本进程正在使用的目录 -> 各次 pin() 打开的锁文件（没有 fcntl 时为None）
+        self._pinned = {}
+
+    def entry_dir(self, key):
+        return self.root / key
+
+    def partial_dir(self, key, owner):
+        """返回某个任务写入处理中结果的目录"""
+        return self.root / f"{key}.partial-{owner}"
+
+    def lookup(self, key):
+        """
+        查找缓存条目，命中时更新最近使用时间
+
+        Returns:
+            dict: 条目的清单内容，未命中时返回None
+        """
+        manifest_path = self.entry_dir(key) / MANIFEST_NAME
+        try:
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            os.utime(manifest_path)
+        except (OSError, ValueError):
+            return None
+        return manifest
+
+    def commit(self, key, partial_dir, manifest):
+        """
+        将处理完成的目录提交为缓存条目
+
+        如果其他任务已经提交了相同的键，丢弃本次结果并使用已有条目。
+
+        Returns:
+            Path: 正式条目目录
+        """
+        partial_dir = Path(partial_dir)
+        with open(partial_dir / MANIFEST_NAME, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False)
+
+        target = self.entry_dir(key)
+        with self._lock:
+            if (target / MANIFEST_NAME).exists():
+                shutil.rmtree(str(partial_dir), ignore_errors=True)
+            else:
+                if target.exists():
+                    shutil.rmtree(str(target), ignore_errors=True)
+                try:
+                    os.replace(partial_dir, target)
+                except OSError:
+                    # 另一个进程同时提交了相同的键
+                    if not (target / MANIFEST_NAME).exists():
+                        raise
+                    shutil.rmtree(str(partial_dir), ignore_errors=True)
+        return target
+
+    def pin(self, path):
+        """标记目录正在使用，任何进程淘汰时都会跳过，使用完后调用 unpin()"""
+        path = Path(path)
+        handle = None
+        if fcntl is not None:
+            try:
+                handle = open(path / PIN_NAME, 'a')
+            except OSError:
+                # 目录已不存在（已被淘汰），调用方读取时会发现
+                pass
+            else:
+                fcntl.flock(handle, fcntl.LOCK_SH)
+        with self._lock:
+            self._pinned.setdefault(str(path.resolve()), []).append(handle)
+
+    def unpin(self, path):
+        with self._lock:
+            path = str(Path(path).resolve())
+            handles = self._pinned.get(path, [])
+            handle = handles.pop() if handles else None
+            if not handles:
+                self._pinned.pop(path, None)
+        if handle is not None:
+            handle.close()
+
+    def _lock_for_removal(self, path):
+        """
+        尝试取得目录锁文件的排他锁
+
+        Returns:
+            (是否可以删除, 需要在删除后关闭的锁文件或None)
+        """
+        if str(path.resolve()) in self._pinned:
+            return False, None
+        if fcntl is None:
+            return True, None
+        try:
+            handle = open(path / PIN_NAME, 'r')
+        except OSError:
+            # 没有锁文件：从未被 pin()，或者刚创建还没来得及加锁（见 PARTIAL_GRACE）
+            return True, None
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            handle.close()
+            return False, None
+        return True, handle
+
+    def evict(self):
+        """
+        按最近最少使用的顺序删除条目，直到总大小不超过配额
+
+        未被使用的 partial 目录（任务已结束或进程已退出留下的不完整结果）最先删除，
+        创建不到 PARTIAL_GRACE 秒的 partial 目录除外。
+
+        Returns:
+            int: 删除的条目数
+        """
+        if not self.root.exists():
+            return 0
+        now = time.time()
+        with self._lock:
+            entries = []
+            pinned_size = 0
+            for path in self.root.iterdir():
+                if not path.is_dir():
+                    continue
+                manifest_path = path / MANIFEST_NAME
+                is_partial = '.partial-' in path.name or not manifest_path.exists()
+                try:
+                    last_used = (manifest_path if manifest_path.exists() else path).stat().st_mtime
+                    changed = path.stat().st_mtime
+                except OSError:
+                    continue
+                removable, handle = self._lock_for_removal(path)
+                if handle is not None:
+                    handle.close()
+                if not removable or (is_partial and changed > now - PARTIAL_GRACE):
+                    pinned_size += _dir_size(path)
+                    continue
+                entries.append((not is_partial, last_used, path))
+
+            sizes = {path: _dir_size(path) for _, _, path in entries}
+            total = sum(sizes.values()) + pinned_size
+
+            removed = 0
+            # 先删除不完整的结果，再按最近使用时间从旧到新删除
+            for is_complete, _, path in sorted(entries, key=lambda entry: (entry[0], entry[1])):
+                if total <= self.max_bytes and is_complete:
+                    break
+                # 检查之后可能又被其他进程使用，删除期间持有排他锁
+                removable, handle = self._lock_for_removal(path)
+                if not removable:
+                    continue
+                try:
+                    shutil.rmtree(str(path), ignore_errors=True)
+                finally:
+                    if handle is not None:
+                        handle.close()
+                total -= sizes[path]
+                removed += 1
+            return removed
@@ -0,0 +1,109 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from split_subimages import center_on_canvas, encode_subimage, split_regions
+
+# 分割进程池的默认进程数
+SPLIT_PROCESSES = os.cpu_count() or 1
+
+# 进程池在流水线的分割线程中按需启动子进程。直接 fork 的子进程会继承其他线程
+# 此时持有的锁（OpenCV、MuPDF 等），可能在子进程中死锁，因此从单线程的 forkserver 进程派生
+_MP_CONTEXT = multiprocessing.get_context(
+    'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn')
+
+class SharedImage:
+    """
+    放在共享内存中的图片，传给分割进程时只传递名称、形状和类型，不复制像素
+
+    创建者负责在所有进程用完后调用 release 释放共享内存。
+    """
+
+    def __init__(self, img):
+        self._shm = shared_memory.SharedMemory(create=True, size=max(1, img.nbytes))
+        self.name = self._shm.name
+        self.shape = img.shape
+        self.dtype = img.dtype.str
+        np.ndarray(img.shape, dtype=img.dtype, buffer=self._shm.buf)[...] = img
+
+    def __getstate__(self):
+        # 只传递描述信息，子进程按名称重新连接
+        return {'name': self.name, 'shape': self.shape, 'dtype': self.dtype}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._shm = None
+
+    def release(self):
+        """关闭并删除共享内存（只应由创建者调用）"""
+        if self._shm is not None:
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
+
+def _split_shared(shared, subimages_count, mode):
+    """
+    进程池任务：连接共享内存中的图片，计算子图区域并编码
+
+    Returns:
+        (JPEG字节列表, 区域列表)，不能分割时返回None
+    """
+    shm = shared_memory.SharedMemory(name=shared.name)
+    try:
+        img = np.ndarray(shared.shape, dtype=np.dtype(shared.dtype), buffer=shm.buf)
+        regions = split_regions(img, subimages_count, mode)
+        if regions is None:
+            return None
+        tiles = center_on_canvas([img[y1:y2, x1:x2] for x1, y1, x2, y2 in regions])
+        encoded = [encode_subimage(tile) for tile in tiles]
+        # 关闭共享内存前必须释放所有引用它的数组
+        del img, tiles
+        return encoded, regions
+    finally:
+        shm.close()
+
+class SplitPool:
+    """
+    多进程的子图分割执行器
+
+    已解码的图片通过共享内存交给子进程，子进程计算白边、空白分隔等并编码子图，
+    只返回JPEG字节和子图区域，大图片不会在进程之间复制。
+    可以在多个线程中同时调用 split。
+    """
+
+    def __init__(self, processes=SPLIT_PROCESSES):
+        self._executor = ProcessPoolExecutor(max_workers=processes, mp_context=_MP_CONTEXT)
+
+    def split(self, img, subimages_count=8, mode='grid'):
+        """
+        分割一张图片，阻塞直到完成
+
+        Args:
+            img: BGR格式的ndarray
+            subimages_count: 要分割的子图数量
+            mode: 分割方式，见 split_subimages.split_image
+
+        Returns:
+            (JPEG字节列表, [(x1, y1, x2, y2), ...])，不能分割时返回None
+        """
+        shared = SharedImage(img)
+        try:
+            return self._executor.submit(_split_shared, shared, subimages_count, mode).result()
+        finally:
+            shared.release()
+
+    def close(self):
+        self._executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def preview_tiles(img, regions):
+    """按 SplitPool.split 返回的区域在本进程中合成子图，用于生成缩略图"""
+    return center_on_canvas([img[y1:y2, x1:x2] for x1, y1, x2, y2 in regions])
@@ -1,10 +1,44 @@
+import argparse
+import io
 import os
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 import cv2
 import numpy as np
 from PIL import Image
 import math
 
+from metrics import timed
+from batch_manifest import BATCH_MANIFEST_NAME, BatchManifest, list_outputs, reset_output_dir
+
+try:
+    from turbojpeg import TurboJPEG, TJCS_CMYK, TJCS_YCCK, tjMCUWidth, tjMCUHeight
+except ImportError:
+    # 可选依赖，只用于无损裁剪（画质选项和内存预算模式），未安装时JPEG子图走解码/重新编码的路径
+    TurboJPEG = None
+
+# 分割结果的版本号，分割算法或输出格式变化时递增，使旧的缓存结果失效
+SPLITTER_VERSION = 4
+
+# 可以在DCT域无损裁剪的图片扩展名
+JPEG_EXTENSIONS = {'jpg', 'jpeg'}
+
+# 延迟创建的 TurboJPEG 实例，False 表示库不可用
+_turbojpeg = None
+
+# 按轮廓提取子图时区域的最小宽、高（像素），更小的轮廓视为文字、噪点
+REGION_MIN_SIZE = 50
+
+# 由粗到细检测轮廓时，缩小后图片长边的最小像素数，长边不足该值两倍的图片直接按原尺寸检测
+COARSE_MIN_SIDE = 1500
+
+# 网格分割的方式：grid 按行列数均匀分割，profile 按行、列的空白投影寻找分隔空白
+SPLIT_MODES = ('grid', 'profile')
+
+# 最多缩小的级数（每级缩小一半）。二值图逐级取平均后仍大于0即表示块内有前景，
+# uint8 四舍五入下最多可以连续缩小3级（1/8）而不丢失单个前景像素
+COARSE_MAX_LEVEL = 3
+
 def is_similar_size(regions):
     """
     检查所有区域是否大小相近
@@ -26,41 +60,131 @@ def is_similar_size(regions):
             return False
     return True
 
-def extract_subimages(image_path, output_dir, subimages_count=8):
+def _pyramid_level(height, width):
+    """按图片尺寸选择粗检测的缩小级数，0 表示不缩小"""
+    level = 0
+    while level < COARSE_MAX_LEVEL and max(height, width) >> (level + 1) >= COARSE_MIN_SIDE:
+        level += 1
+    return level
+
+def _find_regions_exact(binary, min_size):
+    """在原尺寸的二值图上查找外轮廓，返回宽、高都大于 min_size 的边界框"""
+    contours, _ = cv2.findContours(binary, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    regions = []
+    for contour in contours:
+        # 获取边界框
+        x, y, w, h = cv2.boundingRect(contour)
+        # 过滤掉太小的区域
+        if w > min_size and h > min_size:
+            regions.append((x, y, x+w, y+h))
+    return regions
+
+def _any_blocks(strip, block):
+    """把不足一个块高的窄条按每 block 列归约为一行：块内有前景即为1"""
+    columns = strip.any(axis=0)
+    padded = np.zeros(-(-len(columns) // block) * block, dtype=bool)
+    padded[:len(columns)] = columns
+    return padded.reshape(-1, block).any(axis=1).astype(np.uint8)
+
+def _find_regions_coarse(binary, level, min_size):
     """
-    提取图片中的子图
+    由粗到细查找区域：在缩小的二值图上查找候选区域，再在原尺寸的窄带内确定精确边界
     
-    Args:
-        image_path: 输入图片路径
-        output_dir: 输出目录
-        subimages_count: 要分割的子图数量
+    缩小后的每个像素只要对应的块内有前景就为前景，因此每个候选框都包含原图中对应的连通区域，
+    边界误差小于一个块。精确边界只在候选框四条边内侧各一个块宽的窄带中查找。
+    两个连通区域的间隔小于两个块宽时可能合并为一个候选区域，这是与原尺寸检测的主要差别。
     """
-    # 读取图片
-    img = cv2.imread(str(image_path))
-    if img is None:
-        print(f"无法读取图片: {image_path}")
-        return False
+    block = 1 << level
+    height, width = binary.shape
+    # 只有整数倍缩小时缩小后的像素才与原图的块一一对应，先裁掉除不尽的右、下边缘
+    small = binary[:height // block * block, :width // block * block]
+    for _ in range(level):
+        small = cv2.resize(small, (small.shape[1] // 2, small.shape[0] // 2), interpolation=cv2.INTER_AREA)
+    # 裁掉的边缘单独按块归约后补上
+    small_mask = np.zeros((-(-height // block), -(-width // block)), dtype=np.uint8)
+    small_mask[:small.shape[0], :small.shape[1]] = small > 0
+    if small.shape[0] < small_mask.shape[0]:
+        small_mask[-1] |= _any_blocks(binary[small.shape[0] * block:], block)
+    if small.shape[1] < small_mask.shape[1]:
+        small_mask[:, -1] |= _any_blocks(binary[:, small.shape[1] * block:].T, block)
+    
+    contours, _ = cv2.findContours(small_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    regions = []
+    for contour in contours:
+        x, y, w, h = cv2.boundingRect(contour)
+        # 候选框不小于实际区域，候选框已经不满足尺寸要求的区域可以直接丢弃
+        if w * block <= min_size or h * block <= min_size:
+            continue
+        x1, y1 = x * block, y * block
+        x2, y2 = min(width, (x + w) * block), min(height, (y + h) * block)
+        top = np.flatnonzero(binary[y1:min(y1 + block, y2), x1:x2].any(axis=1))
+        bottom = np.flatnonzero(binary[max(y2 - block, y1):y2, x1:x2].any(axis=1))
+        left = np.flatnonzero(binary[y1:y2, x1:min(x1 + block, x2)].any(axis=0))
+        right = np.flatnonzero(binary[y1:y2, max(x2 - block, x1):x2].any(axis=0))
+        if not (len(top) and len(bottom) and len(left) and len(right)):
+            continue
+        region = (x1 + left[0], y1 + top[0], max(x2 - block, x1) + right[-1] + 1, max(y2 - block, y1) + bottom[-1] + 1)
+        if region[2] - region[0] > min_size and region[3] - region[1] > min_size:
+            regions.append(tuple(int(v) for v in region))
+    return regions
+
+def find_regions(img, min_size=REGION_MIN_SIZE, coarse=False):
+    """
+    查找图片中的子图区域（非白色的连通区域的外接矩形）
+    
+    Args:
+        img: BGR格式的ndarray
+        min_size: 区域的最小宽、高，只保留宽和高都大于该值的区域
+        coarse: 是否对大图使用由粗到细的检测，见 _find_regions_coarse。
+                间隔很近的区域可能被合并，结果不保证与原尺寸检测一致，默认不使用；
+                命令行用 --coarse 开启，bench_split 对比两种检测的速度和结果
         
+    Returns:
+        [(x1, y1, x2, y2), ...]，按从上到下、从左到右排序
+    """
     # 转换为灰度图
     gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
     
     # 二值化
     _, binary = cv2.threshold(gray, 240, 255, cv2.THRESH_BINARY_INV)
     
-    # 查找轮廓
-    contours, _ = cv2.findContours(binary, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-    
-    # 获取有效的子图区域
-    regions = []
-    for contour in contours:
-        # 获取边界框
-        x, y, w, h = cv2.boundingRect(contour)
-        # 过滤掉太小的区域
-        if w > 50 and h > 50:  # 可以根据实际情况调整阈值
-            regions.append((x, y, x+w, y+h))
+    level = _pyramid_level(*binary.shape) if coarse else 0
+    if level:
+        regions = _find_regions_coarse(binary, level, min_size)
+    else:
+        regions = _find_regions_exact(binary, min_size)
     
     # 按照从上到下，从左到右排序
     regions.sort(key=lambda r: (r[1], r[0]))
+    return regions
+
+def extract_subimages(image_path, output_dir, subimages_count=8, coarse=False, mode='contour'):
+    """
+    提取图片中的子图
+    
+    Args:
+        image_path: 输入图片路径
+        output_dir: 输出目录
+        subimages_count: 要分割的子图数量
+        coarse: 是否对大图使用由粗到细的轮廓检测（更快，但区域可能与原尺寸检测不同），
+                默认在原尺寸上检测
+        mode: 'contour' 按轮廓查找子图区域；'profile' 按空白投影查找（见 find_gutters），
+              只在行、列投影上计算，比轮廓检测快，子图内部不连通时也不会被拆开
+    """
+    # 读取图片
+    with timed('decode'):
+        img = cv2.imread(str(image_path))
+    if img is None:
+        print(f"无法读取图片: {image_path}")
+        return False
+        
+    if mode == 'profile':
+        with timed('profile'):
+            regions = find_gutters(img, subimages_count) or []
+    else:
+        with timed('contours'):
+            # 获取有效的子图区域，按从上到下、从左到右排序
+            regions = find_regions(img, coarse=coarse)
     
     # 检查是否有足够的子图
     if len(regions) < subimages_count:
@@ -72,17 +196,30 @@ def extract_subimages(image_path, output_dir, subimages_count=8):
     output_subdir.mkdir(parents=True, exist_ok=True)
     
     # 提取并保存指定数量的子图
-    for i, (x1, y1, x2, y2) in enumerate(regions[:subimages_count], 1):
-        subimg = img[y1:y2, x1:x2]
-        output_path = output_subdir / f"子图_{i}.jpg"
-        cv2.imwrite(str(output_path), subimg)
+    with timed('write'):
+        for i, (x1, y1, x2, y2) in enumerate(regions[:subimages_count], 1):
+            subimg = img[y1:y2, x1:x2]
+            output_path = output_subdir / f"子图_{i}.jpg"
+            cv2.imwrite(str(output_path), subimg)
     
     print(f"成功从 {image_path.name} 提取了 {subimages_count} 个子图")
     return True
 
-def process_directory(input_dir, output_dir, subimages_count=8):
+def process_directory(input_dir, output_dir, subimages_count=8, screen=None, mode='contour', resume=True,
+                      workers=1, coarse=False):
     """
     处理目录下的所有图片
+    
+    每张图片处理完成后记录在输出目录的批处理清单中（见 batch_manifest.BatchManifest），
+    重新运行时跳过未变化且输出完整的图片，其余图片先清除上次留下的子图再重新处理。
+    
+    Args:
+        screen: 可选的 prescreen.ImageScreen，只读取文件头按尺寸跳过图标等图片，不解码像素
+        mode: 查找子图区域的方式，见 extract_subimages
+        resume: 是否跳过清单中已完成的图片，False 时全部重新处理（清单仍会更新）
+        workers: 并行处理的进程数，大于1时每张图片在子进程中读取、分割并写入，
+                 只在进程之间传递文件路径，清单仍由当前进程按顺序记录
+        coarse: 是否对大图使用由粗到细的轮廓检测（只用于 contour 方式），见 find_regions
     """
     input_path = Path(input_dir)
     output_dir = Path(output_dir)
@@ -94,14 +231,68 @@ def process_directory(input_dir, output_dir, subimages_count=8):
     total_success = 0
     print(image_files)
     
+    # 提取阶段对重复图片使用硬链接，按文件标识跳过重复的图片
+    seen_files = set()
+    
+    manifest = BatchManifest(output_dir / BATCH_MANIFEST_NAME)
+    params = {
+        'subimages_count': subimages_count,
+        'mode': mode,
+        'screen': screen.params() if screen is not None else None,
+        'splitter': SPLITTER_VERSION,
+    }
+    if coarse:
+        # 默认不记录该项，使原尺寸检测的清单保持有效
+        params['coarse'] = True
+    total_skipped = 0
+    # 需要处理的图片及其子图目录
+    pending = []
+    
     for img_path in image_files:
-        try:
-            if extract_subimages(img_path, output_dir, subimages_count):
-                total_success += 1
-            total_processed += 1
-        except Exception as e:
-            print(f"处理 {img_path.name} 时发生错误: {str(e)}")
+        stat = img_path.stat()
+        file_id = (stat.st_dev, stat.st_ino)
+        if stat.st_nlink > 1 and file_id in seen_files:
+            continue
+        seen_files.add(file_id)
+        if resume and manifest.is_current(img_path, params):
+            total_skipped += 1
+            continue
+        # 子图目录与 extract_subimages 中的命名一致
+        subimage_dir = output_dir / f"图{img_path.stem}"
+        reset_output_dir(subimage_dir)
+        if screen is not None:
+            reason = screen.check_source(img_path)
+            if reason is not None:
+                print(f"跳过 {img_path.name} - {reason}")
+                manifest.record(img_path, params, [], reason)
+                continue
+        pending.append((img_path, subimage_dir))
+    
+    executor = None
+    if workers > 1 and len(pending) > 1:
+        executor = ProcessPoolExecutor(max_workers=workers)
+        futures = [executor.submit(extract_subimages, img_path, output_dir, subimages_count, coarse, mode)
+                   for img_path, _ in pending]
+    try:
+        for i, (img_path, subimage_dir) in enumerate(pending):
+            try:
+                if executor is not None:
+                    success = futures[i].result()
+                else:
+                    success = extract_subimages(img_path, output_dir, subimages_count, coarse, mode)
+                if success:
+                    total_success += 1
+                total_processed += 1
+                manifest.record(img_path, params, list_outputs(subimage_dir), success)
+            except Exception as e:
+                print(f"处理 {img_path.name} 时发生错误: {str(e)}")
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+        manifest.compact()
     
+    if total_skipped:
+        print(f"跳过 {total_skipped} 张已处理且未变化的图片")
     print(f"\n处理完成: 共处理 {total_processed} 张图片，成功提取 {total_success} 张{subimages_count}子图")
 
 def check_8_subimages(img):
@@ -134,94 +325,616 @@ def remove_white_borders(img, threshold=250):
     Returns:
         裁剪后的图片
     """
-    if len(img.shape) == 3:
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-    else:
-        gray = img
-        
-    # 获取非白色区域的边界
-    mask = gray < threshold
-    coords = np.argwhere(mask)
+    with timed('remove_white_borders'):
+        if len(img.shape) == 3:
+            gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        else:
+            gray = img
+            
+        # 获取非白色区域的边界；按行、列做 any 归约，不生成与像素数成正比的坐标数组
+        mask = gray < threshold
+        rows = np.flatnonzero(mask.any(axis=1))
+        cols = np.flatnonzero(mask.any(axis=0))
     
-    if len(coords) == 0:  # 如果图片全白
+    if len(rows) == 0:  # 如果图片全白
         return img
         
-    y_min, x_min = coords.min(axis=0)
-    y_max, x_max = coords.max(axis=0)
+    y_min, y_max = rows[0], rows[-1]
+    x_min, x_max = cols[0], cols[-1]
     
     # 裁剪图片
     return img[y_min:y_max+1, x_min:x_max+1]
 
-def process_image(input_path, output_dir, subimages_count=8):
-    """处理单个图片文件"""
+def load_image(source):
+    """读取图片为OpenCV图片对象
+    
+    Args:
+        source: 图片文件路径、已编码的图片字节(bytes/bytearray/memoryview)或已解码的ndarray
+        
+    Returns:
+        BGR格式的ndarray，无法解码时返回None
+    """
+    if isinstance(source, np.ndarray):
+        return source
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return cv2.imdecode(np.frombuffer(source, dtype=np.uint8), cv2.IMREAD_COLOR)
+    return cv2.imread(str(source))
+
+def _split_image_loop(img, subimages_count, num_rows, num_cols):
+    """逐个切分子图并分别去除白边，split_image 的 grid 方式使用此实现"""
+    height, width = img.shape[:2]
+    
+    # 计算子图尺寸
+    sub_width = width // num_cols
+    sub_height = height // num_rows
+    
+    # 存储所有子图
+    subimages = []
+    
+    # 提取子图
+    count = 0
+    for row in range(num_rows):
+        for col in range(num_cols):
+            if count >= subimages_count:
+                break
+                
+            y1 = row * sub_height
+            y2 = (row + 1) * sub_height
+            x1 = col * sub_width
+            x2 = (col + 1) * sub_width
+            
+            sub_img = img[y1:y2, x1:x2]
+            # 移除白边
+            sub_img = remove_white_borders(sub_img)
+            subimages.append(sub_img)
+            count += 1
+    
+    # 找出所有子图中的最大尺寸
+    max_height = max(img.shape[0] for img in subimages)
+    max_width = max(img.shape[1] for img in subimages)
+    
+    # 调整所有子图到相同尺寸
+    final_images = []
+    for sub_img in subimages:
+        # 创建白色背景
+        final_img = np.full((max_height, max_width, 3), 255, dtype=np.uint8)
+        
+        # 计算居中位置
+        y_offset = (max_height - sub_img.shape[0]) // 2
+        x_offset = (max_width - sub_img.shape[1]) // 2
+        
+        # 将子图放在中心位置
+        final_img[
+            y_offset:y_offset + sub_img.shape[0],
+            x_offset:x_offset + sub_img.shape[1]
+        ] = sub_img
+        final_images.append(final_img)
+    
+    return final_images
+
+def grid_shape(subimages_count):
+    """根据子图数量计算网格的 (行数, 列数)"""
+    num_cols = int(math.sqrt(subimages_count))
+    num_rows = (subimages_count + num_cols - 1) // num_cols
+    return num_rows, num_cols
+
+def load_image_reduced(source, max_pixels):
+    """读取图片，像素数超过 max_pixels 的JPEG按 1/2、1/4 或 1/8 缩小解码
+    
+    缩小在解码时完成（libjpeg 的DCT缩放），不会生成原尺寸的数组，
+    用于在内存预算内检测超大扫描图的子图边界。其他格式按原尺寸解码。
+    
+    Args:
+        source: 图片文件路径、已编码的图片字节或已解码的ndarray
+        max_pixels: 不缩小时允许的最大像素数
+        
+    Returns:
+        (BGR格式的ndarray或None, 缩小倍数)
+    """
+    if isinstance(source, np.ndarray):
+        return source, 1
+    header = io.BytesIO(source) if isinstance(source, (bytes, bytearray, memoryview)) else str(source)
     try:
+        with Image.open(header) as pil_img:
+            width, height = pil_img.size
+            image_format = pil_img.format
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return load_image(source), 1
+    if image_format != 'JPEG' or width * height <= max_pixels:
+        return load_image(source), 1
+    
+    for scale, flag in ((2, cv2.IMREAD_REDUCED_COLOR_2), (4, cv2.IMREAD_REDUCED_COLOR_4), (8, cv2.IMREAD_REDUCED_COLOR_8)):
+        if width * height <= max_pixels * scale * scale:
+            break
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return cv2.imdecode(np.frombuffer(source, dtype=np.uint8), flag), scale
+    return cv2.imread(str(source), flag), scale
+
+def _content_bounds(img, subimages_count, num_rows, num_cols, threshold=250):
+    """一次计算所有网格子图的内容边界（去除白边后的范围，相对于子图左上角）
+    
+    图片按 (行, 子图高, 列, 子图宽) 重塑为子图视图（不复制数据），
+    对非白色掩码做行、列方向的 any 归约得到每个子图的内容边界，
+    不需要像 np.argwhere 那样生成与像素数成正比的坐标数组。
+    
+    Returns:
+        (y_min, y_max, x_min, x_max)，每项为长度 subimages_count 的数组（闭区间）
+    """
+    height, width = img.shape[:2]
+    sub_height = height // num_rows
+    sub_width = width // num_cols
+    
+    # 非白色掩码，形状 (行, 子图高, 列, 子图宽)
+    gray = img if img.ndim == 2 else cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    mask = (gray < threshold).reshape(num_rows, sub_height, num_cols, sub_width)
+    
+    # 每个子图中各行/各列是否含有非白色像素，形状 (行, 列, 子图高) 和 (行, 列, 子图宽)
+    row_any = mask.any(axis=3).transpose(0, 2, 1)
+    col_any = mask.any(axis=1)
+    
+    # 按行优先顺序取前 subimages_count 个子图
+    row_any = row_any.reshape(-1, sub_height)[:subimages_count]
+    col_any = col_any.reshape(-1, sub_width)[:subimages_count]
+    
+    # 内容边界；全白的子图保留整块
+    has_content = row_any.any(axis=1)
+    y_min = np.where(has_content, row_any.argmax(axis=1), 0)
+    y_max = np.where(has_content, sub_height - 1 - row_any[:, ::-1].argmax(axis=1), sub_height - 1)
+    x_min = np.where(has_content, col_any.argmax(axis=1), 0)
+    x_max = np.where(has_content, sub_width - 1 - col_any[:, ::-1].argmax(axis=1), sub_width - 1)
+    return y_min, y_max, x_min, x_max
+
+def _reduced_content_bounds(small, scale, height, width, subimages_count, num_rows, num_cols, threshold=250):
+    """按缩小解码的图片估计原图中各网格子图的内容边界
+    
+    缩小图片的一个像素对应原图 scale×scale 的区域，网格边界不一定落在缩小像素的边界上。
+    边界按覆盖的原图区域换算，并向外多留一个缩小像素，避免缩小时被平均掉的细线被裁掉。
+    
+    Returns:
+        (y_min, y_max, x_min, x_max)，相对于原图子图左上角的闭区间，与 _content_bounds 相同
+    """
+    sub_height = height // num_rows
+    sub_width = width // num_cols
+    gray = small if small.ndim == 2 else cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+    mask = gray < threshold
+    
+    bounds = np.zeros((4, subimages_count), dtype=np.int64)
+    for i in range(subimages_count):
+        row, col = divmod(i, num_cols)
+        top, left = row * sub_height, col * sub_width
+        r0, c0 = top // scale, left // scale
+        r1 = min(mask.shape[0], -(-(top + sub_height) // scale))
+        c1 = min(mask.shape[1], -(-(left + sub_width) // scale))
+        cell = mask[r0:r1, c0:c1]
+        rows = np.flatnonzero(cell.any(axis=1))
+        cols = np.flatnonzero(cell.any(axis=0))
+        if len(rows) == 0:
+            # 全白的子图保留整块
+            bounds[:, i] = (0, sub_height - 1, 0, sub_width - 1)
+            continue
+        bounds[:, i] = (
+            max(0, (r0 + rows[0] - 1) * scale - top),
+            min(sub_height - 1, (r0 + rows[-1] + 2) * scale - 1 - top),
+            max(0, (c0 + cols[0] - 1) * scale - left),
+            min(sub_width - 1, (c0 + cols[-1] + 2) * scale - 1 - left),
+        )
+    return bounds[0], bounds[1], bounds[2], bounds[3]
+
+def _blank_runs(profile):
+    """
+    在一维投影中查找内容范围内部的空白段
+    
+    子图的边框线只占每行很少的像素，因此只有完全没有前景的行才视为空白。
+    
+    Args:
+        profile: 每行（或每列）的前景像素数
+        
+    Returns:
+        (内容起点, 内容终点(不含), [(空白段起点, 宽度), ...])，没有内容时返回None
+    """
+    ink = np.flatnonzero(profile)
+    if len(ink) == 0:
+        return None
+    gaps = np.diff(ink) - 1
+    starts = np.flatnonzero(gaps > 0)
+    return int(ink[0]), int(ink[-1]) + 1, [(int(ink[i]) + 1, int(gaps[i])) for i in starts]
+
+def _widest(runs, count):
+    """按宽度从大到小选出 count 个空白段，宽度相同时靠前的优先，结果按位置排序"""
+    chosen = sorted(runs, key=lambda run: (-run[1], run[0]))[:count]
+    return sorted(chosen)
+
+def _line_counts(binary, axis):
+    """按行（axis=1）或按列（axis=0）统计 0/1 二值图的前景像素数"""
+    return cv2.reduce(binary, axis, cv2.REDUCE_SUM, dtype=cv2.CV_32S).reshape(-1)
+
+def _profile_layout(binary, subimages_count, axis):
+    """
+    先沿一个方向选取分隔空白得到若干条带，再在每个条带内沿另一个方向选取分隔空白
+    
+    各条带的投影由空白段之间各小段的投影相加得到，整幅图片只需遍历两次。
+    在所有条带数中选择所用分隔空白最窄的一条最宽的方案。
+    
+    Args:
+        binary: 0/1 二值图
+        subimages_count: 要分割的子图数量
+        axis: 0 表示先按行分条带（行间分隔），1 表示先按列分条带
+        
+    Returns:
+        (得分, [(y1, y2, x1, x2), ...])，找不到足够的分隔空白时返回None
+    """
+    height, width = binary.shape
+    cross_length = width if axis == 0 else height
+    primary = _blank_runs(_line_counts(binary, 1 - axis))
+    if primary is None:
+        return None
+    start, end, runs = primary
+    
+    # 每个空白段的中点把内容切成小段，分别计算另一个方向的投影
+    cuts = [start] + [run_start + width_ // 2 for run_start, width_ in runs] + [end]
+    segment_profiles = np.stack([
+        _line_counts(binary[a:b] if axis == 0 else binary[:, a:b], axis)
+        for a, b in zip(cuts, cuts[1:])
+    ])
+    cumulative = np.concatenate([np.zeros((1, cross_length), dtype=np.int64), np.cumsum(segment_profiles, axis=0)])
+    run_index = {run: i + 1 for i, run in enumerate(runs)}
+    
+    best = None
+    for num_bands in range(1, min(subimages_count, len(runs) + 1) + 1):
+        band_runs = _widest(runs, num_bands - 1)
+        edges = [0] + [run_index[run] for run in band_runs] + [len(cuts) - 1]
+        bands = []
+        for a, b in zip(edges, edges[1:]):
+            secondary = _blank_runs(cumulative[b] - cumulative[a])
+            if secondary is not None:
+                bands.append((cuts[a], cuts[b], secondary))
+        # 在所有条带的空白段中按宽度依次选取，直到子图数量足够，这样所用空白中最窄的一条最宽
+        candidates = sorted(
+            ((run_width, -run_start, i, (run_start, run_width))
+             for i, (_, _, (_, _, band_gaps)) in enumerate(bands) for run_start, run_width in band_gaps),
+            reverse=True)
+        needed = subimages_count - len(bands)
+        if needed < 0 or len(candidates) < needed:
+            continue
+        chosen = [[] for _ in bands]
+        for _, _, i, run in candidates[:needed]:
+            chosen[i].append(run)
+        widths = [run_width for _, run_width in band_runs] + [item[0] for item in candidates[:needed]]
+        score = min(widths) if widths else 0
+        if best is not None and score <= best[0]:
+            continue
+        cells = []
+        for (band_start, band_end, (cross_start, cross_end, _)), band_cuts in zip(bands, chosen):
+            points = ([cross_start] + [run_start + run_width // 2 for run_start, run_width in sorted(band_cuts)]
+                      + [cross_end])
+            for a, b in zip(points, points[1:]):
+                cells.append((band_start, band_end, a, b) if axis == 0 else (a, b, band_start, band_end))
+        best = (score, cells)
+    return best
+
+def find_gutters(img, subimages_count=8, threshold=250):
+    """
+    按行、列的空白投影查找子图区域，不要求图片能被均匀分割
+    
+    先对二值图按行（或按列）统计前景像素数，选取最宽的若干条空白作为行间分隔，
+    再在每一行内按列统计并选取列间分隔。各行的子图数量可以不同，子图和分隔空白
+    的尺寸也可以不均匀。先按行和先按列两种顺序都会尝试，取分隔空白更宽的方案，
+    宽度相同时按行优先。
+    
+    Args:
+        img: OpenCV图片对象
+        subimages_count: 要分割的子图数量
+        threshold: 白色阈值(0-255)，低于该值的像素视为内容
+        
+    Returns:
+        [(x1, y1, x2, y2), ...]，已去除白边，按行优先时从上到下、从左到右排列；
+        找不到足够的分隔空白时返回None
+    """
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
+    _, binary = cv2.threshold(gray, threshold - 1, 1, cv2.THRESH_BINARY_INV)
+    
+    rows_first = _profile_layout(binary, subimages_count, 0)
+    cols_first = _profile_layout(binary, subimages_count, 1)
+    if rows_first is None and cols_first is None:
+        return None
+    if cols_first is not None and (rows_first is None or cols_first[0] > rows_first[0]):
+        cells = cols_first[1]
+    else:
+        cells = rows_first[1]
+    
+    regions = []
+    for y1, y2, x1, x2 in cells:
+        # 去除每个子图自身的白边
+        cell = binary[y1:y2, x1:x2]
+        rows = np.flatnonzero(_line_counts(cell, 1))
+        cols = np.flatnonzero(_line_counts(cell, 0))
+        if len(rows) == 0:
+            return None
+        regions.append((x1 + int(cols[0]), y1 + int(rows[0]), x1 + int(cols[-1]) + 1, y1 + int(rows[-1]) + 1))
+    return regions
+
+def center_on_canvas(crops):
+    """把尺寸不同的子图居中放到统一尺寸的白色画布上"""
+    max_height = max(crop.shape[0] for crop in crops)
+    max_width = max(crop.shape[1] for crop in crops)
+    output = np.full((len(crops), max_height, max_width, 3), 255, dtype=np.uint8)
+    for i, crop in enumerate(crops):
+        y_offset = (max_height - crop.shape[0]) // 2
+        x_offset = (max_width - crop.shape[1]) // 2
+        output[i, y_offset:y_offset + crop.shape[0], x_offset:x_offset + crop.shape[1]] = crop
+    return output
+
+def split_regions(img, subimages_count=8, mode='grid'):
+    """
+    只计算各子图去除白边后的内容区域，不生成子图
+    
+    按这些区域裁剪后用 center_on_canvas 合成，结果与 split_image 相同。
+    
+    Returns:
+        [(x1, y1, x2, y2), ...]，不能分割时返回None
+    """
+    if mode == 'profile':
+        return find_gutters(img, subimages_count)
+    height, width = img.shape[:2]
+    num_rows, num_cols = grid_shape(subimages_count)
+    if height % num_rows != 0 or width % num_cols != 0:
+        return None
+    sub_height = height // num_rows
+    sub_width = width // num_cols
+    y_min, y_max, x_min, x_max = _content_bounds(img, subimages_count, num_rows, num_cols)
+    regions = []
+    for i in range(len(y_min)):
+        row, col = divmod(i, num_cols)
+        top, left = row * sub_height, col * sub_width
+        regions.append((left + int(x_min[i]), top + int(y_min[i]), left + int(x_max[i]) + 1, top + int(y_max[i]) + 1))
+    return regions
+
+def split_image(img, subimages_count=8, name='图片', mode='grid'):
+    """将图片分割为子图，去除白边后居中放到统一尺寸的白色画布上
+    
+    Args:
+        img: OpenCV图片对象
+        subimages_count: 要分割的子图数量
+        name: 日志中显示的图片名称
+        mode: 'grid' 按网格均匀分割；'profile' 按空白投影寻找分隔（见 find_gutters），
+              适用于不能均匀分割或子图大小不一的图片
+        
+    Returns:
+        子图序列（grid 方式为ndarray列表，profile 方式为一个4维ndarray），不能分割时返回None
+    """
+    if img.ndim == 2:
+        img = cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
+    
+    if mode == 'profile':
+        regions = find_gutters(img, subimages_count)
+        if regions is None:
+            print(f"图片 {name} 中没有找到 {subimages_count} 个子图的分隔空白")
+            return None
+        return center_on_canvas([img[y1:y2, x1:x2] for x1, y1, x2, y2 in regions])
+    
+    # 获取图片尺寸
+    height, width = img.shape[:2]
+    
+    # 根据子图数量计算行列数
+    num_rows, num_cols = grid_shape(subimages_count)
+    
+    # 检查是否可以均匀分割
+    if height % num_rows != 0 or width % num_cols != 0:
+        print(f"图片 {name} 不能均匀分割为 {subimages_count} 个子图")
+        return None
+    
+    return _split_image_loop(img, subimages_count, num_rows, num_cols)
+
+def _get_turbojpeg():
+    """返回 TurboJPEG 实例，未安装或找不到 libturbojpeg 时返回None"""
+    global _turbojpeg
+    if _turbojpeg is None:
+        try:
+            _turbojpeg = TurboJPEG() if TurboJPEG is not None else False
+        except (OSError, RuntimeError):
+            _turbojpeg = False
+    return _turbojpeg or None
+
+def split_engine(lossless=True):
+    """
+    返回JPEG子图实际使用的输出方式，需要写入缓存键
+
+    无损裁剪的子图窗口按MCU对齐，与解码分割（去白边后居中放到白色画布上）的结果不同，
+    是否可用又取决于是否安装了 PyTurboJPEG。
+
+    Args:
+        lossless: 是否要求无损裁剪
+
+    Returns:
+        str: 'turbojpeg' 表示DCT域无损裁剪，'decode' 表示解码后分割并重新编码
+    """
+    return 'turbojpeg' if lossless and _get_turbojpeg() is not None else 'decode'
+
+def _aligned_origin(cell_start, cell_size, content_min, content_max, window, block):
+    """
+    在一维上为裁剪窗口选择按 block 对齐的起点
+    
+    窗口必须包含内容范围 [content_min, content_max] 且不超出所在网格，
+    在满足条件的起点中选择最接近内容居中的一个。
+    
+    Returns:
+        int: 对齐的起点（绝对坐标），不存在时返回None
+    """
+    low = max(cell_start, content_max - window + 1)
+    high = min(content_min, cell_start + cell_size - window)
+    first = -(-low // block) * block
+    last = high // block * block
+    if first > last:
+        return None
+    center = (content_min + content_max + 1 - window) / 2
+    return int(min(max(round(center / block) * block, first), last))
+
+def lossless_crop_boxes(img, subimages_count, block_width, block_height, scale=1, size=None):
+    """
+    计算可以在DCT域裁剪的子图窗口
+    
+    每个窗口包含子图去除白边后的内容，起点按MCU块对齐，所有窗口尺寸相同。
+    为了能够对齐，窗口比最大的内容尺寸最多放宽一个MCU块（多出的部分是子图自身的白边），
+    但不会超出所在的网格。
+    
+    Args:
+        img: 解码后的图片，用于计算内容边界
+        subimages_count: 要分割的子图数量
+        block_width, block_height: JPEG的MCU块尺寸
+        scale: img 相对原图的缩小倍数（见 load_image_reduced）
+        size: 原图的 (高, 宽)，scale 大于1时必须提供
+        
+    Returns:
+        [(x, y, 宽, 高), ...]，坐标为原图坐标，不能均匀分割或无法对齐时返回None
+    """
+    height, width = size if size is not None else img.shape[:2]
+    num_rows, num_cols = grid_shape(subimages_count)
+    if height % num_rows != 0 or width % num_cols != 0:
+        return None
+    sub_height = height // num_rows
+    sub_width = width // num_cols
+    if scale == 1:
+        y_min, y_max, x_min, x_max = _content_bounds(img, subimages_count, num_rows, num_cols)
+    else:
+        y_min, y_max, x_min, x_max = _reduced_content_bounds(
+            img, scale, height, width, subimages_count, num_rows, num_cols)
+    
+    window_width = min(sub_width, int((x_max - x_min).max()) + block_width)
+    window_height = min(sub_height, int((y_max - y_min).max()) + block_height)
+    boxes = []
+    for i in range(len(y_min)):
+        row, col = divmod(i, num_cols)
+        left = col * sub_width
+        top = row * sub_height
+        x = _aligned_origin(left, sub_width, left + int(x_min[i]), left + int(x_max[i]), window_width, block_width)
+        y = _aligned_origin(top, sub_height, top + int(y_min[i]), top + int(y_max[i]), window_height, block_height)
+        if x is None or y is None:
+            return None
+        boxes.append((x, y, window_width, window_height))
+    return boxes
+
+def split_jpeg(data, img, subimages_count=8, scale=1):
+    """
+    在DCT域无损切分JPEG图片，不解码/重新编码子图
+    
+    子图的DCT系数与原图逐位一致，不会再经过一次有损压缩。裁剪需要熵解码整张原图，
+    速度通常不如解码分割后重新编码（见 bench_split），用于保留画质，
+    以及内存预算模式下不生成原尺寸数组地输出子图。
+    
+    Args:
+        data: 原始JPEG字节
+        img: 同一图片解码后的ndarray，用于计算子图边界
+        subimages_count: 要分割的子图数量
+        scale: img 相对原图的缩小倍数，大于1时不需要原尺寸的解码结果，
+               返回的区域视图也是缩小后的
+        
+    Returns:
+        (子图JPEG字节列表, 对应区域的ndarray视图列表)，
+        PyTurboJPEG 不可用、图片不是普通的8位YCbCr/灰度JPEG或窗口无法对齐时返回None，
+        调用方应回退到 split_image
+    """
+    jpeg = _get_turbojpeg()
+    if jpeg is None:
+        return None
+    try:
+        width, height, subsample, colorspace, precision = jpeg.decode_header(data, return_precision=True)
+    except OSError:
+        return None
+    if precision != 8 or colorspace in (TJCS_CMYK, TJCS_YCCK):
+        return None
+    if (-(-height // scale), -(-width // scale)) != img.shape[:2]:
+        return None
+    
+    boxes = lossless_crop_boxes(img, subimages_count, tjMCUWidth[subsample], tjMCUHeight[subsample],
+                                scale, (height, width))
+    if boxes is None:
+        return None
+    tiles = jpeg.crop_multiple(data, boxes, copynone=True)
+    previews = [img[y // scale:-(-(y + h) // scale), x // scale:-(-(x + w) // scale)] for x, y, w, h in boxes]
+    return tiles, previews
+
+def encode_subimage(sub_img):
+    """将子图编码为JPEG字节"""
+    ok, buffer = cv2.imencode('.jpg', sub_img)
+    if not ok:
+        raise ValueError("子图编码失败")
+    return buffer.tobytes()
+
+def save_subimages(subimages, output_dir):
+    """将子图保存为 subimg_N.jpg
+    
+    Args:
+        subimages: 子图序列，元素为ndarray（编码为JPEG）或已编码的JPEG字节（直接写入）
+        
+    Returns:
+        保存的文件路径列表
+    """
+    output_paths = []
+    for i, sub_img in enumerate(subimages, 1):
+        output_path = os.path.join(output_dir, f'subimg_{i}.jpg')
+        if isinstance(sub_img, (bytes, bytearray)):
+            with open(output_path, 'wb') as f:
+                f.write(sub_img)
+        else:
+            cv2.imwrite(output_path, sub_img)
+        output_paths.append(output_path)
+    return output_paths
+
+def process_image(input_path, output_dir, subimages_count=8, name=None, screen=None, mode='grid',
+                  lossless=False):
+    """处理单个图片
+    
+    Args:
+        input_path: 图片文件路径，也可以是已编码的图片字节或已解码的ndarray
+        output_dir: 子图输出目录
+        subimages_count: 要分割的子图数量
+        name: 日志中显示的图片名称，默认取文件名
+        screen: 可选的 prescreen.ImageScreen，解码前只读取文件头检查尺寸，不符合时直接跳过
+        mode: 分割方式，见 split_image
+        lossless: 画质选项，grid 方式下JPEG来源是否尽量在DCT域无损裁剪（见 split_jpeg），
+                  子图保留原图画质。不是性能优化：裁剪需要熵解码整张原图，通常比解码分割后
+                  重新编码更慢，子图窗口按MCU对齐，与默认的解码分割结果也不同
+    """
+    if name is None:
+        name = os.path.basename(input_path) if isinstance(input_path, (str, Path)) else '内存图片'
+    try:
+        if screen is not None:
+            reason = screen.check_source(input_path)
+            if reason is not None:
+                print(f"跳过 {name} - {reason}")
+                return False
+        
         # 读取图片
-        img = cv2.imread(input_path)
+        with timed('decode'):
+            img = load_image(input_path)
         if img is None:
-            print(f"无法读取图片: {input_path}")
+            print(f"无法读取图片: {name}")
             return False
-            
-        # 获取图片尺寸
-        height, width = img.shape[:2]
-        
-        # 根据子图数量计算行列数
-        num_cols = int(math.sqrt(subimages_count))
-        num_rows = (subimages_count + num_cols - 1) // num_cols
         
-        # 检查是否可以均匀分割
-        if height % num_rows != 0 or width % num_cols != 0:
-            print(f"图片 {os.path.basename(input_path)} 不能均匀分割为 {subimages_count} 个子图")
+        # 要求保留原图画质时，JPEG来源按网格分割优先在DCT域切分
+        data = None
+        if lossless and mode == 'grid':
+            if isinstance(input_path, (bytes, bytearray)):
+                data = bytes(input_path)
+            elif (isinstance(input_path, (str, Path))
+                  and Path(input_path).suffix.lower().lstrip('.') in JPEG_EXTENSIONS):
+                with open(input_path, 'rb') as f:
+                    data = f.read()
+        with timed('split'):
+            cropped = split_jpeg(data, img, subimages_count) if data is not None and data[:2] == b'\xff\xd8' else None
+            
+            if cropped is not None:
+                subimages = cropped[0]
+            else:
+                subimages = split_image(img, subimages_count, name, mode=mode)
+        if subimages is None:
             return False
         
-        # 计算子图尺寸
-        sub_width = width // num_cols
-        sub_height = height // num_rows
-        
-        # 存储所有子图
-        subimages = []
-        
-        # 提取子图
-        count = 0
-        for row in range(num_rows):
-            for col in range(num_cols):
-                if count >= subimages_count:
-                    break
-                    
-                y1 = row * sub_height
-                y2 = (row + 1) * sub_height
-                x1 = col * sub_width
-                x2 = (col + 1) * sub_width
-                
-                sub_img = img[y1:y2, x1:x2]
-                # 移除白边
-                sub_img = remove_white_borders(sub_img)
-                subimages.append(sub_img)
-                count += 1
-        
-        # 找出所有子图中的最大尺寸
-        max_height = max(img.shape[0] for img in subimages)
-        max_width = max(img.shape[1] for img in subimages)
-        
-        # 调整所有子图到相同尺寸并保存
-        for i, sub_img in enumerate(subimages, 1):
-            # 创建白色背景
-            final_img = np.full((max_height, max_width, 3), 255, dtype=np.uint8)
-            
-            # 计算居中位置
-            y_offset = (max_height - sub_img.shape[0]) // 2
-            x_offset = (max_width - sub_img.shape[1]) // 2
-            
-            # 将子图放在中心位置
-            final_img[
-                y_offset:y_offset + sub_img.shape[0],
-                x_offset:x_offset + sub_img.shape[1]
-            ] = sub_img
-            
-            # 保存子图
-            output_path = os.path.join(output_dir, f'subimg_{i}.jpg')
-            cv2.imwrite(output_path, final_img)
+        # 保存子图
+        with timed('write'):
+            save_subimages(subimages, output_dir)
         
-        print(f"成功从 {os.path.basename(input_path)} 提取了{count}个子图")
+        print(f"成功从 {name} 提取了{len(subimages)}个子图")
         return True
         
     except Exception as e:
@@ -229,8 +942,14 @@ def process_image(input_path, output_dir, subimages_count=8):
         return False
 
 if __name__ == "__main__":
-    # 直接在这里指定输入和输出目录
-    input_directory = "pdf_dump_img/output_folder/第2章 内蒙古胜利煤田34-6孔6、11号煤层"  # 这里放提取出的图片的目录
-    output_directory = "final_subimages"  # 这里是分割后的子图的保存目录
+    parser = argparse.ArgumentParser(description='按轮廓从图片目录中提取子图')
+    # 这里放提取出的图片的目录
+    parser.add_argument('input_dir', nargs='?', default="pdf_dump_img/output_folder/第2章 内蒙古胜利煤田34-6孔6、11号煤层",
+                        help='提取出的图片所在目录')
+    # 这里是分割后的子图的保存目录
+    parser.add_argument('output_dir', nargs='?', default="final_subimages", help='子图的保存目录 (默认: final_subimages)')
+    parser.add_argument('--coarse', action='store_true',
+                        help='对大图使用由粗到细的轮廓检测，更快，但间隔很近的子图可能被合并 (默认: 原尺寸检测)')
+    args = parser.parse_args()
     
-    process_directory(input_directory, output_directory) 
\ No newline at end of file
+    process_directory(args.input_dir, args.output_dir, coarse=args.coarse)
@@ -0,0 +1,72 @@
+import os
+from pathlib import Path
+
+import cv2
+
+from split_subimages import load_image
+
+# 缩略图尺寸（最长边像素），从大到小逐级缩小生成
+THUMB_SIZES = (1024, 256)
+
+# 缩略图统一使用WebP格式
+THUMB_EXT = '.webp'
+THUMB_QUALITY = 80
+
+# 缩略图保存在结果目录下的该子目录中，不会被打包进ZIP
+THUMB_DIR = 'thumbs'
+
+def thumb_relpath(rel_path, size):
+    """返回结果文件对应缩略图的相对路径，如 thumbs/256/a/b.jpg.webp"""
+    return Path(THUMB_DIR) / str(size) / (str(rel_path) + THUMB_EXT)
+
+def _resize(img, size):
+    """按最长边缩小到 size，不放大"""
+    height, width = img.shape[:2]
+    scale = size / max(height, width)
+    if scale >= 1:
+        return img
+    return cv2.resize(
+        img,
+        (max(1, round(width * scale)), max(1, round(height * scale))),
+        interpolation=cv2.INTER_AREA,
+    )
+
+def save_thumbnails(img, root, rel_path):
+    """
+    为一张已解码的图片生成各级缩略图
+
+    较小的缩略图由上一级缩略图缩小得到（图像金字塔），不再从原图重新缩放。
+
+    Args:
+        img: OpenCV图片对象
+        root: 结果根目录
+        rel_path: 原图相对于 root 的路径
+    """
+    current = img
+    for size in sorted(THUMB_SIZES, reverse=True):
+        current = _resize(current, size)
+        thumb_path = Path(root) / thumb_relpath(rel_path, size)
+        thumb_path.parent.mkdir(parents=True, exist_ok=True)
+        ok, buffer = cv2.imencode(THUMB_EXT, current, [cv2.IMWRITE_WEBP_QUALITY, THUMB_QUALITY])
+        if ok:
+            # 先写临时文件再替换，避免并发请求读到不完整的缩略图
+            temp_path = thumb_path.with_name(thumb_path.name + '.tmp')
+            with open(temp_path, 'wb') as f:
+                f.write(buffer.tobytes())
+            os.replace(temp_path, thumb_path)
+
+def ensure_thumbnail(root, rel_path, size):
+    """
+    返回缩略图路径，缩略图不存在时（例如旧的结果）从原图生成
+
+    Returns:
+        Path: 缩略图路径，原图不存在或无法解码时返回None
+    """
+    thumb_path = Path(root) / thumb_relpath(rel_path, size)
+    if thumb_path.exists():
+        return thumb_path
+    img = load_image(Path(root) / rel_path)
+    if img is None:
+        return None
+    save_thumbnails(img, root, rel_path)
+    return thumb_path if thumb_path.exists() else None
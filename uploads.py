@@ -0,0 +1,313 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from pathlib import Path
+
+from batch_manifest import HASH_CHUNK_SIZE, file_sha256
+
+# 分块上传的默认块大小和允许的上限（字节）
+DEFAULT_CHUNK_SIZE = 8 * 1024 * 1024
+MAX_CHUNK_SIZE = 64 * 1024 * 1024
+
+# 超过该时间（秒）没有新分块的上传会话视为已放弃，清理时删除
+SESSION_TTL = 24 * 3600
+
+# 默认磁盘配额（字节），超出后按最近最少使用顺序删除保存的PDF
+DEFAULT_MAX_BYTES = 5 * 1024 ** 3
+
+# 默认允许分块上传的单个文件大小上限（字节），会话开始时即按声明的大小预留磁盘空间
+DEFAULT_MAX_FILE_BYTES = 2 * 1024 ** 3
+
+# 会话目录中的文件
+SESSION_META = 'meta.json'
+SESSION_DATA = 'data.part'
+SESSION_RECEIVED = 'received.txt'
+
+class UploadError(ValueError):
+    """上传请求无效，如分块序号越界、长度或校验和不符"""
+
+def _is_sha256(value):
+    return isinstance(value, str) and len(value) == 64 and all(c in '0123456789abcdef' for c in value)
+
+def link_or_copy(source, target):
+    """为文件创建硬链接，不支持时（如跨文件系统）复制"""
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copyfile(source, target)
+
+class PdfStore:
+    """
+    按内容哈希保存上传过的PDF，并管理分块上传会话
+
+    PDF保存为 root/pdfs/<sha256>.pdf，客户端可以先询问服务器是否已有某个哈希，
+    已有时无需再次上传。任务使用PDF的硬链接，淘汰不会影响正在处理的任务。
+
+    分块上传的每个会话是 root/sessions 下的一个目录：meta.json 记录文件名、大小、
+    块大小和声明的哈希，data.part 按偏移写入各分块。received.txt 按顺序记录分块状态：
+    开始写入前追加 -序号（之前收到的内容即将被覆盖），校验通过后追加 序号。
+    连接中断后客户端查询已收到的分块，只补传缺少的部分。
+    """
+
+    def __init__(self, root, max_bytes=DEFAULT_MAX_BYTES, max_file_bytes=DEFAULT_MAX_FILE_BYTES):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.max_file_bytes = max_file_bytes
+        self._lock = threading.Lock()
+
+    def pdf_path(self, sha256):
+        return self.root / 'pdfs' / f'{sha256}.pdf'
+
+    def _session_dir(self, upload_id):
+        # 会话ID只由十六进制字符组成，不会指向会话目录之外
+        if not upload_id or not all(c in '0123456789abcdef' for c in upload_id):
+            raise UploadError('上传会话无效')
+        return self.root / 'sessions' / upload_id
+
+    def lookup(self, sha256):
+        """
+        查找已保存的PDF，命中时更新最近使用时间
+
+        Returns:
+            Path: PDF路径，没有时返回None
+        """
+        if not _is_sha256(sha256):
+            return None
+        path = self.pdf_path(sha256)
+        try:
+            os.utime(path)
+        except OSError:
+            return None
+        return path
+
+    def add(self, path, sha256=None):
+        """
+        把一个文件移入存储（同一文件系统内为重命名）
+
+        Args:
+            path: 要保存的文件，调用后不再存在
+            sha256: 已知的内容哈希，None 时计算
+
+        Returns:
+            (sha256, 保存后的路径)
+        """
+        sha256 = sha256 or file_sha256(path)
+        target = self.pdf_path(sha256)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            if target.exists():
+                os.remove(path)
+                os.utime(target)
+            else:
+                shutil.move(str(path), str(target))
+        return sha256, target
+
+    def incoming_path(self, filename):
+        """返回普通（非分块）上传写入的临时文件路径，写完后用 add() 保存"""
+        incoming = self.root / 'incoming'
+        incoming.mkdir(parents=True, exist_ok=True)
+        return incoming / f'{uuid.uuid4().hex}{Path(filename).suffix}'
+
+    def create_session(self, filename, size, chunk_size=DEFAULT_CHUNK_SIZE, sha256=None):
+        """
+        开始一个分块上传，同一文件（哈希和大小相同）已有未完成的会话时继续使用
+
+        Args:
+            filename: 原始文件名
+            size: 文件总字节数，不能超过 max_file_bytes
+            chunk_size: 块大小，最后一块可以较小
+            sha256: 可选的整个文件的哈希，提供时完成上传后校验
+
+        Returns:
+            dict: 会话状态，见 session_status()
+        """
+        if size <= 0:
+            raise UploadError('文件大小无效')
+        if size > self.max_file_bytes:
+            raise UploadError(f'文件不能超过 {self.max_file_bytes // (1024 * 1024)}MB')
+        if not 0 < chunk_size <= MAX_CHUNK_SIZE:
+            raise UploadError(f'块大小必须在1到{MAX_CHUNK_SIZE}字节之间')
+        if sha256 is not None and not _is_sha256(sha256):
+            raise UploadError('文件哈希无效')
+        self.cleanup_sessions()
+
+        if sha256 is not None:
+            # 同一文件重复开始上传（如刷新页面后）时得到同一个会话
+            upload_id = hashlib.sha256(f'{sha256}:{size}:{chunk_size}'.encode('utf-8')).hexdigest()[:32]
+        else:
+            upload_id = uuid.uuid4().hex
+        session_dir = self._session_dir(upload_id)
+        with self._lock:
+            if not (session_dir / SESSION_META).exists():
+                session_dir.mkdir(parents=True, exist_ok=True)
+                with open(session_dir / SESSION_DATA, 'wb') as f:
+                    f.truncate(size)
+                meta = {
+                    'upload_id': upload_id,
+                    'filename': filename,
+                    'size': size,
+                    'chunk_size': chunk_size,
+                    'chunks': -(-size // chunk_size),
+                    'sha256': sha256,
+                    'created_at': time.time(),
+                }
+                temp_path = session_dir / (SESSION_META + '.tmp')
+                with open(temp_path, 'w', encoding='utf-8') as f:
+                    json.dump(meta, f, ensure_ascii=False)
+                os.replace(temp_path, session_dir / SESSION_META)
+        return self.session_status(upload_id)
+
+    def _load_meta(self, upload_id):
+        try:
+            with open(self._session_dir(upload_id) / SESSION_META, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            raise UploadError('上传会话不存在或已过期')
+
+    def _received(self, upload_id):
+        received = set()
+        try:
+            with open(self._session_dir(upload_id) / SESSION_RECEIVED, 'r', encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if line.startswith('-') and line[1:].isdigit():
+                        received.discard(int(line[1:]))
+                    elif line.isdigit():
+                        received.add(int(line))
+        except FileNotFoundError:
+            pass
+        return sorted(received)
+
+    def _mark(self, upload_id, entry):
+        session_dir = self._session_dir(upload_id)
+        with self._lock:
+            with open(session_dir / SESSION_RECEIVED, 'a', encoding='utf-8') as f:
+                f.write(f'{entry}\n')
+                f.flush()
+                os.fsync(f.fileno())
+            os.utime(session_dir / SESSION_META)
+
+    def session_status(self, upload_id):
+        """
+        Returns:
+            dict: 会话信息和已收到的分块序号 received、还缺少的分块序号 missing
+        """
+        meta = self._load_meta(upload_id)
+        received = self._received(upload_id)
+        done = set(received)
+        return dict(meta, received=received,
+                    missing=[index for index in range(meta['chunks']) if index not in done])
+
+    def write_chunk(self, upload_id, index, stream, checksum=None):
+        """
+        写入一个分块，边读边计算哈希，校验通过后才记为已收到
+
+        同一分块可以重复上传（如响应丢失后重试），后写入的内容覆盖之前的。
+
+        Args:
+            stream: 分块内容的文件对象（如请求体）
+            checksum: 可选的分块SHA-256，提供时必须一致
+
+        Returns:
+            int: 已收到的分块数
+        """
+        meta = self._load_meta(upload_id)
+        if not 0 <= index < meta['chunks']:
+            raise UploadError(f'分块序号越界: {index}')
+        offset = index * meta['chunk_size']
+        expected_length = min(meta['chunk_size'], meta['size'] - offset)
+
+        # 先撤销该分块的记录，写入失败或中途退出时它会被视为缺少
+        self._mark(upload_id, f'-{index}')
+        digest = hashlib.sha256()
+        length = 0
+        with open(self._session_dir(upload_id) / SESSION_DATA, 'r+b') as f:
+            f.seek(offset)
+            while True:
+                data = stream.read(min(HASH_CHUNK_SIZE, expected_length - length + 1))
+                if not data:
+                    break
+                length += len(data)
+                if length > expected_length:
+                    break
+                digest.update(data)
+                f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        if length != expected_length:
+            raise UploadError(f'分块 {index} 长度应为 {expected_length} 字节')
+        if checksum is not None and digest.hexdigest() != checksum.lower():
+            raise UploadError(f'分块 {index} 校验和不符')
+
+        self._mark(upload_id, index)
+        return len(self._received(upload_id))
+
+    def complete(self, upload_id):
+        """
+        所有分块都收到后校验整个文件，移入存储并删除会话
+
+        Returns:
+            (sha256, 保存后的路径, 原始文件名)
+        """
+        status = self.session_status(upload_id)
+        if status['missing']:
+            raise UploadError(f"还有 {len(status['missing'])} 个分块未上传")
+        session_dir = self._session_dir(upload_id)
+        sha256 = file_sha256(session_dir / SESSION_DATA)
+        if status['sha256'] is not None and sha256 != status['sha256']:
+            # 内容已损坏，整个会话作废
+            shutil.rmtree(str(session_dir), ignore_errors=True)
+            raise UploadError('文件哈希不符，请重新上传')
+        sha256, path = self.add(session_dir / SESSION_DATA, sha256)
+        shutil.rmtree(str(session_dir), ignore_errors=True)
+        return sha256, path, status['filename']
+
+    def cleanup_sessions(self, max_age=SESSION_TTL):
+        """删除超过 max_age 秒没有新分块的会话和遗留的临时文件"""
+        deadline = time.time() - max_age
+        for name in ('sessions', 'incoming'):
+            directory = self.root / name
+            if not directory.exists():
+                continue
+            for path in directory.iterdir():
+                try:
+                    last_used = (path / SESSION_META if path.is_dir() else path).stat().st_mtime
+                except OSError:
+                    last_used = 0
+                if last_used < deadline:
+                    if path.is_dir():
+                        shutil.rmtree(str(path), ignore_errors=True)
+                    else:
+                        path.unlink(missing_ok=True)
+
+    def evict(self):
+        """
+        按最近最少使用的顺序删除保存的PDF，直到总大小不超过配额
+
+        Returns:
+            int: 删除的PDF数
+        """
+        directory = self.root / 'pdfs'
+        if not directory.exists():
+            return 0
+        with self._lock:
+            entries = []
+            for path in directory.iterdir():
+                try:
+                    stat = path.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+            total = sum(size for _, size, _ in entries)
+            removed = 0
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                path.unlink(missing_ok=True)
+                total -= size
+                removed += 1
+            return removed
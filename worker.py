@@ -0,0 +1,167 @@
+import argparse
+import multiprocessing
+import shutil
+import signal
+import threading
+import time
+from pathlib import Path
+
+from job_store import JobStore
+from jobs import MAX_CONCURRENT_JOBS
+from metrics import REGISTRY
+from processing import (
+    CACHE_DIR, CACHE_MAX_BYTES, JOB_DB_PATH, PDF_STORE_DIR, PDF_STORE_MAX_BYTES,
+    process_pdf, apply_cached_result, cache_manifest,
+)
+from result_cache import ResultCache
+from uploads import PdfStore
+
+# 没有排队任务时查询任务队列的间隔（秒）
+POLL_INTERVAL = 1.0
+
+# 处理过程中把任务状态写回存储的间隔（秒），也是响应取消请求的延迟
+SYNC_INTERVAL = 0.5
+
+# 空闲时保存运行指标快照的间隔（秒），处理任务时随状态一起保存；应小于 HEARTBEAT_TIMEOUT
+METRICS_INTERVAL = 15
+
+# 工作进程需要启动自己的子进程（提取分片、分割进程池），不能是守护进程；
+# 不使用 fork，避免复制调用方（如Web服务）的线程状态
+_MP_CONTEXT = multiprocessing.get_context(
+    'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn')
+
+def run_job(job, result_cache, pdf_store):
+    """处理一个任务
+
+    先按缓存键查找之前的处理结果，命中时直接使用；
+    否则在缓存的 partial 目录中处理，全部图片处理成功后提交为缓存条目。
+    有图片处理失败时丢弃 partial 目录并抛出异常，任务记为失败。
+    """
+    try:
+        # 排队期间可能已有相同的任务完成
+        cached_dir = apply_cached_result(result_cache, job.cache_key, job.status)
+        if cached_dir is not None:
+            job.output_dir = str(cached_dir)
+            return
+
+        partial_dir = result_cache.partial_dir(job.cache_key, job.id)
+        job.output_dir = str(partial_dir)
+        result_cache.pin(partial_dir)
+        try:
+            stats = process_pdf(
+                job.pdf_path,
+                job.output_dir,
+                job.subimages_count,
+                job.workers,
+                status=job.status,
+                stop_event=job.stop_event,
+                max_memory=job.max_memory,
+                split_mode=job.split_mode,
+                lossless=job.lossless,
+            )
+            if stats['errors'] and not job.stop_event.is_set():
+                raise RuntimeError(f"{stats['errors']} 张图片处理失败，结果未保存")
+            if not job.stop_event.is_set():
+                job.output_dir = str(result_cache.commit(job.cache_key, partial_dir, cache_manifest(job.status)))
+        except Exception:
+            # 不完整的结果不能成为缓存条目，否则之后相同的任务都会直接使用它
+            shutil.rmtree(str(partial_dir), ignore_errors=True)
+            raise
+        finally:
+            result_cache.unpin(partial_dir)
+    finally:
+        # 任务目录中只是PDF的链接，PDF本身仍保存在 pdf_store 中
+        shutil.rmtree(str(Path(job.pdf_path).parent), ignore_errors=True)
+        result_cache.evict()
+        pdf_store.evict()
+
+def _sync_status(store, job, done):
+    """定期写回任务状态和本进程的运行指标；发现取消请求时设置任务的停止标记"""
+    while not done.wait(SYNC_INTERVAL):
+        if store.save(job):
+            job.stop_event.set()
+        store.save_metrics(REGISTRY.snapshot())
+
+def worker_loop(db_path=JOB_DB_PATH, stop_event=None):
+    """
+    工作进程的主循环：从任务存储中领取任务并处理，直到 stop_event 被设置
+
+    Args:
+        db_path: 任务存储（SQLite数据库）的路径
+        stop_event: 可选的停止标记，在两个任务之间检查
+    """
+    store = JobStore(db_path)
+    result_cache = ResultCache(CACHE_DIR, CACHE_MAX_BYTES)
+    pdf_store = PdfStore(PDF_STORE_DIR, PDF_STORE_MAX_BYTES)
+    # 各进程的指标只在本进程中，保存到任务存储后由Web进程汇总
+    metrics_saved = 0
+    while stop_event is None or not stop_event.is_set():
+        if time.time() - metrics_saved >= METRICS_INTERVAL:
+            store.save_metrics(REGISTRY.snapshot())
+            metrics_saved = time.time()
+        job = store.claim()
+        if job is None:
+            time.sleep(POLL_INTERVAL)
+            continue
+
+        done = threading.Event()
+        syncer = threading.Thread(target=_sync_status, args=(store, job, done), daemon=True)
+        syncer.start()
+        try:
+            run_job(job, result_cache, pdf_store)
+        except Exception as e:
+            job.status['log'].append(f"错误: {str(e)}")
+            print(f"任务 {job.id} 处理错误: {str(e)}")
+            state = 'cancelled' if job.stop_event.is_set() else 'failed'
+        else:
+            state = 'cancelled' if job.stop_event.is_set() else 'complete'
+        finally:
+            done.set()
+            syncer.join()
+        store.finish(job, state)
+        store.save_metrics(REGISTRY.snapshot())
+        metrics_saved = time.time()
+
+def start_workers(processes=MAX_CONCURRENT_JOBS, db_path=JOB_DB_PATH):
+    """
+    启动工作进程，每个进程同时处理一个任务
+
+    工作进程被终止时正在处理的任务会被其他工作进程（或重启后的工作进程）重新领取。
+
+    Returns:
+        list: 启动的 multiprocessing.Process
+    """
+    workers = []
+    for _ in range(processes):
+        process = _MP_CONTEXT.Process(target=worker_loop, args=(str(db_path),))
+        process.start()
+        workers.append(process)
+    return workers
+
+def stop_workers(workers, timeout=5):
+    """终止工作进程并等待退出"""
+    for process in workers:
+        process.terminate()
+    for process in workers:
+        process.join(timeout)
+
+def main():
+    parser = argparse.ArgumentParser(description='运行PDF处理工作进程，从任务存储中领取Web服务提交的任务')
+    parser.add_argument('--processes', type=int, default=MAX_CONCURRENT_JOBS, help='工作进程数')
+    parser.add_argument('--db', default=str(JOB_DB_PATH), help='任务存储（SQLite数据库）的路径')
+    args = parser.parse_args()
+
+    workers = start_workers(args.processes, args.db)
+    print(f"已启动 {len(workers)} 个工作进程，任务存储: {args.db}")
+
+    def handle_signal(sig, frame):
+        stop_workers(workers)
+        raise SystemExit(0)
+
+    signal.signal(signal.SIGINT, handle_signal)
+    signal.signal(signal.SIGTERM, handle_signal)
+    for process in workers:
+        process.join()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+import io
+import os
+import time
+import zipfile
+from pathlib import Path
+
+# 每次读取源文件的块大小
+CHUNK_SIZE = 64 * 1024
+
+# 已经压缩过的图片格式直接存储，不再重复压缩
+STORED_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.webp', '.jp2', '.jpx', '.gif'}
+
+class _ChunkWriter(io.RawIOBase):
+    """只追加、不可寻址的输出流，缓存写入的数据供生成器分块取出"""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def take(self):
+        """取出并清空已缓存的数据"""
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+def iter_zip(entries):
+    """
+    边生成边输出ZIP文件，不创建临时文件，内存占用与结果大小无关
+
+    Args:
+        entries: (ZIP内路径, 数据源) 的可迭代对象，数据源为文件路径或字节
+
+    Yields:
+        bytes: ZIP文件的数据块
+    """
+    writer = _ChunkWriter()
+    with zipfile.ZipFile(writer, 'w') as zipf:
+        for arcname, source in entries:
+            is_bytes = isinstance(source, (bytes, bytearray, memoryview))
+            if is_bytes:
+                mtime = time.localtime()[:6]
+                size = len(source)
+            else:
+                stat = os.stat(source)
+                mtime = time.localtime(stat.st_mtime)[:6]
+                size = stat.st_size
+
+            zinfo = zipfile.ZipInfo(str(arcname), date_time=max(mtime, (1980, 1, 1, 0, 0, 0)))
+            zinfo.file_size = size
+            if Path(str(arcname)).suffix.lower() in STORED_EXTENSIONS:
+                zinfo.compress_type = zipfile.ZIP_STORED
+            else:
+                zinfo.compress_type = zipfile.ZIP_DEFLATED
+
+            with zipf.open(zinfo, 'w') as entry:
+                if is_bytes:
+                    entry.write(source)
+                else:
+                    with open(source, 'rb') as f:
+                        while True:
+                            chunk = f.read(CHUNK_SIZE)
+                            if not chunk:
+                                break
+                            entry.write(chunk)
+                            data = writer.take()
+                            if data:
+                                yield data
+            data = writer.take()
+            if data:
+                yield data
+    # 写入中央目录
+    data = writer.take()
+    if data:
+        yield data
+
+def layout_entries(files, mode):
+    """
+    按打包方式生成ZIP内路径
+
+    Args:
+        files: (子目录名, 文件名, 数据源) 的可迭代对象
+        mode: chapter 保持目录结构；flat 所有图片在同一目录，文件名为 子目录名_文件名
+
+    Yields:
+        (ZIP内路径, 数据源)
+    """
+    for dir_name, file_name, source in files:
+        if mode == 'chapter':
+            yield f"{dir_name}/{file_name}", source
+        else:
+            yield f"{dir_name}_{file_name}", source
+
+def directory_entries(root, mode):
+    """
+    遍历结果目录，按打包方式生成 (ZIP内路径, 文件路径)
+
+    chapter 模式下路径相对于 root；flat 模式下为 所在目录名_文件名。
+    """
+    root = Path(root)
+    for dir_path, dir_names, file_names in os.walk(root):
+        dir_names.sort()
+        for file_name in sorted(file_names):
+            file_path = Path(dir_path) / file_name
+            if mode == 'chapter':
+                yield file_path.relative_to(root).as_posix(), str(file_path)
+            else:
+                yield f"{Path(dir_path).name}_{file_name}", str(file_path)